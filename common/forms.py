@@ -2,9 +2,10 @@ from django import forms
 from django.core.exceptions import ValidationError
 
 
-class BeforeAfterUUIDForm(forms.Form):
-    before = forms.UUIDField(required=False)
-    after = forms.UUIDField(required=False)
+# The cursors are given by the BeforeAfterPaginator (see fights.views).
+class BeforeAfterCursorForm(forms.Form):
+    before = forms.CharField(required=False, max_length=200)
+    after = forms.CharField(required=False, max_length=200)
     
     def clean(self):
         cleaned_data = super().clean()
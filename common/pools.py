@@ -0,0 +1,49 @@
+# The simulator workers are grouped in pools (see SIMULATOR_POOLS in the
+# global config), each simulating only its own games, so that the games
+# with very different costs don't hold up each other. The games of the
+# pools with explicit games have their own streams in each lane; the
+# rest share the streams of the lanes, and are simulated by the default
+# pool (the one with 'games' None).
+#
+# Used by both the web and the simulator.
+
+def get_default_pool_name(pools):
+    return next(name for name, pool in pools.items() if pool['games'] is None)
+
+
+def get_pool_name_of_game(pools, game_name):
+    for name, pool in pools.items():
+        if pool['games'] is not None and game_name in pool['games']:
+            return name
+    
+    return get_default_pool_name(pools)
+
+
+def get_pool_game_names(pools, pool_name, all_game_names):
+    games = pools[pool_name]['games']
+    if games is not None:
+        return list(games)
+    
+    return [g for g in all_game_names if get_pool_name_of_game(pools, g) == pool_name]
+
+
+def get_game_stream(pools, lane_stream, game_name):
+    """Get the stream that the simulations of a game are sent to in a lane, given the stream of the lane."""
+    if get_pool_name_of_game(pools, game_name) == get_default_pool_name(pools):
+        return lane_stream
+    
+    return f'{lane_stream}:{game_name}'
+
+
+def get_pool_streams(pools, pool_name, lane_stream):
+    """Get the streams of a lane that a pool reads from, given the stream of the lane."""
+    games = pools[pool_name]['games']
+    if games is None:
+        return [lane_stream]
+    
+    return [f'{lane_stream}:{game_name}' for game_name in games]
+
+
+def get_pool_key(key, pool_name):
+    """Get the key of the pool's own version of a Redis key (e.g., of the worker stats)."""
+    return f'{key}:{pool_name}'
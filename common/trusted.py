@@ -0,0 +1,29 @@
+# The trusted codes (e.g., the house bots) are run by the simulator in
+# its own process, rather than in the sandbox, which saves the cost of
+# the coderunner on every command. The admins approve such codes by
+# their hash (see gamespecs.models.TrustedCode), and the web signs the
+# hash of each approved code of a fight with the TRUSTED_CODES_KEY (of
+# the global config) as it sends the fight. The simulator only runs a
+# code in its own process if the signature matches the hash of the code
+# it actually reads, so that nothing else (e.g., a forged message or a
+# changed file) can get a code run outside the sandbox.
+#
+# Used by both the web and the simulator.
+
+import hashlib
+import hmac
+
+
+def sign_trusted_code(key, sha256):
+    """Sign the SHA-256 (as hex) of a trusted code with the key."""
+    return hmac.new(key.encode(), sha256.encode(), hashlib.sha256).hexdigest()
+
+
+def is_trusted_code(key, content, signature):
+    """Check a code's content (bytes) against its signature; a code is never trusted without a key or a signature."""
+    if not key or not signature:
+        return False
+
+    expected = sign_trusted_code(key, hashlib.sha256(content).hexdigest())
+
+    return hmac.compare_digest(expected, signature)
@@ -7,4 +7,5 @@ class TerminationReasons:
     SABOTAGE =        'CS'
     XCPUTIME =        'XT'
     SECCOMP =         'SP'  # shouldn't really happen unless there is a bug.
+    TRUSTED_ERROR =   'TE'  # a trusted code failed to set up; a bug on our side.
 
@@ -53,7 +53,28 @@ MEDIA_URL = E('MEDIA_URL', 'media/')
 MEDIA_ROOT = Path(E('MEDIA_ROOT', _BASE_DIR / 'media_dev/'))
 
 
-# These are relative to the MEDIA_ROOT.
+# The replay artifacts of the finished fights. This MUST NOT be
+# under the MEDIA_ROOT, as the replays of the private fights must
+# only be served after an access check by Django.
+REPLAYS_ROOT = Path(E('REPLAYS_ROOT', _BASE_DIR / 'replays_dev/'))
+
+# The internal nginx location through which the replays are served
+# by X-Accel-Redirect. There is no nginx in development, so Django
+# serves the replay files itself.
+REPLAYS_ACCEL_REDIRECT_URL = None
+
+
+# The segment files that the flows of the old fights are moved
+# to, out of the database (see gamespecs.archive), and the age
+# (since finished) after which they're moved.
+ARCHIVES_ROOT = Path(E('ARCHIVES_ROOT', _BASE_DIR / 'archives_dev/'))
+GAME_RESULT_ARCHIVE_AGE_DAYS = 90
+
+
+# These are relative to the MEDIA_ROOT. The fight and preset
+# directories only have the codes uploaded before the codes were
+# stored by their hash (under the codes directory).
+CODES_DIR = 'codes/'
 FIGHT_CODES_DIR = 'fights/'
 PRESET_CODES_DIR = 'presets/'
 TEMPLATE_CODES_DIR = 'templates/'
@@ -87,20 +108,98 @@ REDIS_SIMULATOR_GROUP = 'test_group_simulator'
 REDIS_RESULT_PROCESSOR_STREAM = 'test_stream_result_processor'
 REDIS_RESULT_PROCESSOR_GROUP = 'test_group_result_processor'
 
+# The keys that the simulator sets the verdicts of the code probes
+# in, suffixed by the game and the hash of each code.
+REDIS_PROBE_VERDICT_KEY_PREFIX = 'probe_verdict_'
+
+# The simulations are queued in lanes, each a stream (all read by
+# the REDIS_SIMULATOR_GROUP). The interactive lane is the stream
+# REDIS_SIMULATOR_STREAM; these are the streams of the others. The
+# code probes have a lane of their own, which isn't weighted below;
+# it's always served first (see simulator/entry.py).
+REDIS_SIMULATOR_LANE_STREAMS = {
+    'batch': 'test_stream_simulator_batch',
+    'probe': 'test_stream_simulator_probe',
+}
+
+# The share of the simulators that each lane gets when they're all
+# busy; an idle lane's share goes to the others (see simulator/entry.py).
+SIMULATOR_LANE_WEIGHTS = {
+    'interactive': 8,
+    'batch': 1,
+}
+
+# For estimating the queue wait times: a list of the durations of the
+# recent simulations, and a sorted set of the simulator workers by the
+# time they were last seen. Each pool has its own of both (the pool name
+# is appended; see common.pools).
+REDIS_SIMULATION_DURATIONS_KEY = 'simulation_durations'
+REDIS_SIMULATOR_WORKERS_KEY = 'simulator_workers'
+
+# A sorted set of the simulator workers waiting for a simulation, by
+# the time they started waiting; per pool, as above. The workers only
+# take fights ahead when none of the others is waiting.
+REDIS_SIMULATOR_IDLE_WORKERS_KEY = 'simulator_idle_workers'
+
+# A list of the measures of the recent coderunner children, as JSON:
+# the setup time (in seconds) and the PSS and the USS (in bytes) of
+# each, before running the player's code. Per pool, as above.
+REDIS_CODERUNNER_STATS_KEY = 'coderunner_stats'
+
+# The simulations and the results left pending by a worker for too long
+# (e.g., as it died) are put back in their streams by the other workers,
+# counting the attempts. After this many, they're moved to these streams
+# instead, to be looked into.
+MAX_DELIVERY_ATTEMPTS = 3
+REDIS_SIMULATOR_DEAD_LETTER_STREAM = 'test_stream_simulator_dead'
+REDIS_RESULT_PROCESSOR_DEAD_LETTER_STREAM = 'test_stream_result_processor_dead'
+
 
 
 DOCKER_SERVER_URL = 'unix:///var/run/docker.sock'
 
 
 WORKERS = {
-    'simulator': 1,
     'result_processor': 1
 }
 
 
+# The pools of the simulator workers (see common.pools). Each pool has
+# its own number of workers, and optionally a limit on the CPUs (as in
+# 'docker run --cpus') of the coderunner container of each worker. The
+# games of no other pool are simulated by the one with 'games' None;
+# there must be exactly one such pool. e.g.:
+#   'heavy': {'games': ['some_heavy_game'], 'workers': 2, 'cpus': 2.0},
+SIMULATOR_POOLS = {
+    'default': {'games': None, 'workers': 1, 'cpus': None},
+}
+
+
+# The placement of the simulator workers on the CPUs (see
+# simulator/placement.py), or None to let them run on any CPU. Each
+# worker (of all the pools, in order) is pinned to 'CPUS_PER_WORKER'
+# of the CPUs, out of those not in 'RESERVED_CPUS'. The rest of the
+# services should be kept on the reserved CPUs (e.g., by 'cpuset' in
+# the compose file). When the workers are more than the CPUs allow,
+# they share the CPUs.
+SIMULATOR_CPU_PLACEMENT = None
+
+# The usage of each CPU is reported by the simulator daemon every
+# this many seconds, as a hash of {CPU: JSON of its usage (from 0 to
+# 1) and the simulator workers pinned to it}.
+SIMULATOR_CPU_USAGE_INTERVAL = 10
+REDIS_SIMULATOR_CPU_USAGE_KEY = 'simulator_cpu_usage'
+
+
+# The key that the web signs the trusted codes of the fights with, for
+# the simulator to run them in its own process (see common.trusted).
+# Shared by the web and the simulator. If None, no code is trusted.
+TRUSTED_CODES_KEY = E('TRUSTED_CODES_KEY', 'trusted_codes_dev_key')
+
+
 # Used by spawner daemons.
 WORKER_NAME_FORMATS = {
-    'simulator': 'simulator_{}',
+    'simulator': 'simulator_{pool}_{index}',
     'result_processor': 'result_processor_{}',
 }
 
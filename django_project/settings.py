@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
 from pathlib import Path
+from datetime import timedelta
 import importlib
 import os
 
@@ -218,7 +219,9 @@ MEDIA_ROOT = global_config.MEDIA_ROOT
 
 MAX_CODE_UPLOAD_SIZE = 100000  # in bytes
 
-MAX_USER_ATTENDED_FIGHTS = 1
+# The unfinished fights a user can be in at once. Only one of them can
+# be hosted by the user, though; see CreateFightService.
+MAX_USER_ATTENDED_FIGHTS = 3
 
 
 # If the "Origin" header is not present in an HTTPS request,
@@ -237,14 +240,110 @@ WEBSOCKET_ROOT_URLCONF = 'django_project.websocket.urls'
 
 REDIS_SERVER_URL = global_config.REDIS_SERVER_URL
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_SERVER_URL,
+    }
+}
+
+# In seconds. Finished fights never change, so this only
+# bounds how long an unpopular fight stays in the cache.
+FINISHED_FIGHT_CACHE_TIMEOUT = 24 * 60 * 60
+
+# In seconds. Used for the Cache-Control header of the
+# finished public fight pages served to anonymous users.
+FINISHED_FIGHT_PAGE_MAX_AGE = 60 * 60
+
 REDIS_SIMULATOR_STREAM = global_config.REDIS_SIMULATOR_STREAM
+REDIS_SIMULATOR_GROUP = global_config.REDIS_SIMULATOR_GROUP
+
+# See fights.queue.
+REDIS_SIMULATOR_LANE_STREAMS = global_config.REDIS_SIMULATOR_LANE_STREAMS
+SIMULATOR_LANE_WEIGHTS = global_config.SIMULATOR_LANE_WEIGHTS
+REDIS_SIMULATION_DURATIONS_KEY = global_config.REDIS_SIMULATION_DURATIONS_KEY
+REDIS_SIMULATOR_WORKERS_KEY = global_config.REDIS_SIMULATOR_WORKERS_KEY
+
+# See common.pools.
+SIMULATOR_POOLS = global_config.SIMULATOR_POOLS
+
+# See common.trusted.
+TRUSTED_CODES_KEY = global_config.TRUSTED_CODES_KEY
+
+# In seconds. Used by the result processor to reclaim the results left
+# pending by a dead worker; processing a result takes well under this.
+RESULT_RECLAIM_MIN_IDLE = 5 * 60
+RESULT_RECLAIM_INTERVAL = 30
+RESULT_RECLAIM_BATCH_SIZE = 10
+
+# The fights of the players with more than this many fights being
+# simulated (including the fight itself) are sent to the batch lane,
+# so that no one can crowd out the others' interactive fights. They're
+# still simulated, as the players have already committed to them.
+MAX_USER_IN_FLIGHT_SIMULATIONS = 1
+
+# No fight is started with a player who already has this many fights
+# being simulated; this bounds what each player can have in the batch
+# lane. The host can start the fight once some of those are finished.
+#
+# Both limits must be lower than MAX_USER_ATTENDED_FIGHTS to ever be
+# reached, as the open fights are only closed once their results are in.
+MAX_USER_STARTED_SIMULATIONS = 2
+
+# In seconds. The simulator workers not seen for this long
+# aren't counted in estimating the queue wait times.
+SIMULATOR_WORKER_ALIVE_TIMEOUT = 5 * 60
+
+# The queue position is counted up to this.
+QUEUE_ESTIMATE_MAX_POSITION = 1000
+
+# In seconds. How long the queue entry of a sent fight is kept
+# for estimating its wait; longer than any fight should wait.
+QUEUE_ENTRY_CACHE_TIMEOUT = 24 * 60 * 60
+
+REDIS_PROBE_VERDICT_KEY_PREFIX = global_config.REDIS_PROBE_VERDICT_KEY_PREFIX
+
+# In seconds; see ProbeCodeService. The codes are accepted without
+# waiting for their probes. If the simulators don't get to a probe by
+# then, it's dropped, and the code is left without a verdict; it's
+# probed again if it's uploaded again.
+CODE_PROBE_TIMEOUT = 60
+
+# In seconds. The verdicts are kept by the hash of the code.
+CODE_PROBE_VERDICT_TIMEOUT = 24 * 60 * 60
 
 
 LOGGING_ROOT = global_config.LOGGING_ROOT
 LOGGING_FILES_PATHS = global_config.LOGGING_FILES_PATHS
 
 
+REPLAYS_ROOT = Path(global_config.REPLAYS_ROOT)
+REPLAYS_ACCEL_REDIRECT_URL = global_config.REPLAYS_ACCEL_REDIRECT_URL
+
+# In seconds. Replays never change once written.
+REPLAY_MAX_AGE = 365 * 24 * 60 * 60
+
+
+# See gamespecs.archive.
+ARCHIVES_ROOT = Path(global_config.ARCHIVES_ROOT)
+GAME_RESULT_ARCHIVE_AGE = timedelta(days=global_config.GAME_RESULT_ARCHIVE_AGE_DAYS)
+GAME_RESULT_ARCHIVE_BATCH_SIZE = 1000
+
+# In seconds. The archived flows are only read to rebuild the
+# replay artifacts, so they needn't stay long in the cache.
+ARCHIVED_FLOW_CACHE_TIMEOUT = 60 * 60
+
+# In seconds. The code files younger than this that have no database
+# row aren't deleted by the garbage collector, as they may belong to a
+# transaction still in progress.
+CODE_FILE_ORPHAN_GRACE = 60 * 60
+
+# In seconds; see gamespecs.codes.validate_player_code().
+CODE_VALIDATION_CACHE_TIMEOUT = 24 * 60 * 60
+
+
 # These are relative to the MEDIA_ROOT.
+CODES_DIR = Path(global_config.CODES_DIR)
 FIGHT_CODES_DIR = Path(global_config.FIGHT_CODES_DIR)
 PRESET_CODES_DIR = Path(global_config.PRESET_CODES_DIR)
 TEMPLATE_CODES_DIR = Path(global_config.TEMPLATE_CODES_DIR)
@@ -8,6 +8,6 @@ def ws_login_required(uhp_func):
     """
     @wraps(uhp_func)
     async def func(self):
-        return self.user.is_authenticated and uhp_func(self)
+        return self.user.is_authenticated and await uhp_func(self)
     
     return func
\ No newline at end of file
@@ -2,4 +2,5 @@ from django.urls import path, include
 
 urlpatterns = [
     # Example: path('ws/your_app/', include('your_app.websocket.urls'))
-]
\ No newline at end of file
+    path('ws/fights/', include('fights.websocket.urls')),
+]
@@ -1,8 +1,8 @@
 from django.contrib import admin
 
-from fights.models import Fight, PlayerFight, Invitation, Hosting
+from fights.models import Fight, PlayerFight, FightSummary, OpenFightsCount, PlayerGameStats, Invitation, Hosting
 
-for model in [PlayerFight, Hosting]:
+for model in [PlayerFight, FightSummary, OpenFightsCount, PlayerGameStats, Hosting]:
     admin.site.register(model)
 
 
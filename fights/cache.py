@@ -0,0 +1,74 @@
+from django.core.cache import cache
+from django.conf import settings
+from django.template.loader import render_to_string
+
+from fights.models import Fight
+from gamespecs.models import GameInfo
+
+from games.frontend import EXPLANATION_INDEX
+
+
+# Once a fight is finished, nothing about it changes anymore, except
+# for the parts that depend on the viewer. So we cache what is shared
+# between all the viewers for each finished fight, keyed by the fight
+# id. The version must be bumped whenever the format of the cached
+# values (or the templates rendered into them) changes, so that the
+# stale entries are no longer used.
+FIGHT_PAGE_CACHE_VERSION = 2
+
+
+def get_fight_page_cache_key(fight_id):
+    return f'fight_page_{fight_id}'
+
+
+def render_fight_page_shared(fight_id):
+    """Render the parts of a finished fight's page that are the same for all viewers."""
+
+    fight = Fight.objects.prefetch_playerfights_with_players(
+        playerfight_fields=['won_or_rank'],
+        user_fields=['username'],
+
+        # We need the playerfights sorted by id so that we
+        # can tell which index belongs to which player.
+        order_by='id'
+    ).select_related(
+        'result',
+        'game',
+    ).only(
+        'game_settings',
+
+        'result__explanation',
+
+        'game__slug',
+        'game__name',  # to access the explanation index
+        'game__title',
+        'game__conclusion_system',
+    ).get(id=fight_id)
+
+    context = {
+        'fight': fight,
+        'ConclusionSystems': GameInfo.ConclusionSystems,
+    }
+
+    if fight.result.explanation:
+        context['explanation'] = EXPLANATION_INDEX[fight.game.name].get_explanation_text(
+            fight.result.explanation
+        )
+
+    return {
+        'game_name': fight.game.name,
+        'game_title': fight.game.title,
+        'game_settings': fight.game_settings,
+        'canvas': render_to_string('view_fight_canvas.html', context),
+        'players': render_to_string('view_fight_players.html', context),
+    }
+
+
+def get_fight_page_shared(fight_id):
+    return cache.get_or_set(
+        get_fight_page_cache_key(fight_id),
+        lambda: render_fight_page_shared(fight_id),
+        timeout=settings.FINISHED_FIGHT_CACHE_TIMEOUT,
+        version=FIGHT_PAGE_CACHE_VERSION
+    )
+
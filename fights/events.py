@@ -0,0 +1,22 @@
+# Redis PubSub channel names for the fight-related signals.
+#
+# These are used on both ends: the publishers (the services and the
+# result processor) format them directly, and the WebSocket views use
+# them as the keys of their signal dicts, which are formatted by
+# WSView.format_signals() with the context of each connection. So the
+# format fields here must be provided by get_signals_context() of the
+# WebSocket views that listen to them.
+FIGHT_FINISHED = 'fight_finished_{fight_uuid.hex}'
+
+PLAYER_FIGHT_FINISHED = 'player_fight_finished_{user_id}'
+INVITATION_RECEIVED = 'invitation_received_{user_id}'
+INVITATION_ACCEPTED = 'invitation_accepted_{user_id}'
+FIGHT_HELD_BACK = 'fight_held_back_{user_id}'
+
+
+# The names of the signals as they are sent to the WebSocket clients.
+class SignalNames:
+    FIGHT_FINISHED = 'fight_finished'
+    INVITATION_RECEIVED = 'invitation_received'
+    INVITATION_ACCEPTED = 'invitation_accepted'
+    FIGHT_HELD_BACK = 'fight_held_back'
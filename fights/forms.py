@@ -1,8 +1,14 @@
+import hashlib
+
 from django import forms
 from django.core.exceptions import ValidationError
 from django.conf import settings
 
+from common.values import TerminationReasons
 from accounts.models import User
+from gamespecs.codes import validate_player_code
+from gamespecs.models import GameCodePreset
+from fights.services import get_probe_verdicts
 
 
 def code_max_upload_size_validator(file):
@@ -24,14 +30,69 @@ def usernames_list_json_validator(json):
 
 
 
-class CreateFightForm(forms.Form):
+def get_probe_failure_message(termination_reason):
+    """Tell what went wrong with a code that failed its probe; see ProbeCodeService."""
+    match termination_reason:
+        case TerminationReasons.XCPUTIME:
+            problem = 'took too long'
+        case TerminationReasons.ENOMEM:
+            problem = 'used too much memory'
+        case _:
+            # Mostly an exception raised at the module level or
+            # in Main(), which ends in an illegal syscall.
+            problem = 'crashed'
+    
+    return f'The code {problem} in a test run of its first tick.'
+
+
+# A parent for the forms through which a player uploads their code
+# for a fight. The code is validated statically against the game. It's
+# also tried in the sandbox once it's accepted for a fight, without
+# waiting for that (see ProbeCodeService); a code known to have failed
+# that is rejected here right away.
+class PlayerCodeForm(forms.Form):
+    code = forms.FileField(validators=[code_max_upload_size_validator])
+    
+    def __init__(self, *args, game_info, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.game_info = game_info
+    
+    def clean_code(self):
+        code = self.cleaned_data['code']
+        content = b''.join(code.chunks())
+        
+        errors = validate_player_code(self.game_info.name, content)
+        if errors:
+            raise ValidationError(errors)
+        
+        [verdict] = get_probe_verdicts([
+            (self.game_info.name, hashlib.sha256(content).hexdigest())
+        ])
+        
+        if verdict is not None and not verdict['ok']:
+            raise ValidationError(get_probe_failure_message(verdict['termination_reason']))
+        
+        return code
+
+
+class CreateFightForm(PlayerCodeForm):
     is_public = forms.BooleanField(required=False)
     usernames_list = forms.JSONField(validators=[usernames_list_json_validator])
-    code = forms.FileField(validators=[code_max_upload_size_validator])
+    
+    # The house bots of the game picked as opponents, besides (or instead
+    # of) the invited players; see GameCodePresetQuerySet.house_bots().
+    house_bots = forms.ModelMultipleChoiceField(
+        queryset=GameCodePreset.objects.none(),
+        required=False
+    )
+    
+    def __init__(self, *args, game_info, **kwargs):
+        super().__init__(*args, game_info=game_info, **kwargs)
+        self.fields['house_bots'].queryset = GameCodePreset.objects.house_bots(game_info)
 
 
-class AcceptInvitationForm(forms.Form):
-    code = forms.FileField(validators=[code_max_upload_size_validator])
+class AcceptInvitationForm(PlayerCodeForm):
+    pass
 
 
 class SearchPlayerToInviteAPIForm(forms.Form):
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+
+from fights.models import Fight, PlayerFight, FightSummary
+
+
+class Command(BaseCommand):
+    help = 'Write the summaries of the finished fights that have none (i.e., finished before the summaries existed).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        written = 0
+
+        while True:
+            fights = list(Fight.objects.finished().filter(
+                summary__isnull=True
+            ).select_related(
+                'game'
+            ).only(
+                'uuid',
+                'finished_at',
+                'is_public',
+                'game__title',
+                'game__conclusion_system'
+            ).order_by('id')[:options['batch_size']])
+
+            if not fights:
+                break
+
+            playerfights = {}
+            for pf in PlayerFight.objects.filter(
+                fight__in=fights
+            ).select_related(
+                'player'
+            ).only(
+                'fight_id',
+                'won_or_rank',
+                'player__username'
+            ).order_by('id'):
+                playerfights.setdefault(pf.fight_id, []).append(pf)
+
+            # ignore_conflicts, in case the result processor
+            # writes any of them meanwhile.
+            FightSummary.objects.bulk_create([
+                FightSummary.from_fight(fight, playerfights.get(fight.id, []))
+                for fight in fights
+            ], ignore_conflicts=True)
+
+            written += len(fights)
+
+        self.stdout.write(f'Wrote the summaries of {written} fights.')
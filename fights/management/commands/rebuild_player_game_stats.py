@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from fights.models import PlayerFight, PlayerGameStats
+from fights.stats import apply_fight_to_stats
+from gamespecs.models import GameInfo
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stats of all the players in all the games from the history of the fights.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        # Blocks the result processor from updating the stats until
+        # we're done, so that no fight is missed or counted twice.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'LOCK TABLE {PlayerGameStats._meta.db_table} IN SHARE ROW EXCLUSIVE MODE'
+            )
+
+        PlayerGameStats.objects.all().delete()
+
+        total = 0
+
+        # One game at a time, as the stats of a game only depend on its
+        # own fights; only the stats of the game at hand are kept in
+        # memory, and they're written before moving on to the next game.
+        for game in GameInfo.objects.only('conclusion_system', 'has_scores').order_by('id'):
+            stats = self.rebuild_game_stats(game, batch_size)
+
+            PlayerGameStats.objects.bulk_create(stats, batch_size=batch_size)
+            total += len(stats)
+
+        self.stdout.write(f'Rebuilt the stats of {total} players in games.')
+
+    def rebuild_game_stats(self, game, batch_size):
+        # The ratings depend on the order of the fights, so they're
+        # replayed in the order they finished. The playerfights are
+        # streamed, and those of each fight are consecutive.
+        playerfights = PlayerFight.objects.of_finished_fight().filter(
+            fight__game=game
+        ).only(
+            'fight_id',
+            'player_id',
+            'termination_reason',
+            'won_or_rank',
+            'score'
+        ).order_by(
+            'fight__finished_at',
+            'fight_id',
+            'id'
+        ).iterator(chunk_size=batch_size)
+
+        stats = {}  # by the player id
+
+        def apply(fight_playerfights):
+            fight_stats = []
+            for pf in fight_playerfights:
+                if pf.player_id not in stats:
+                    stats[pf.player_id] = PlayerGameStats(player_id=pf.player_id, game=game)
+                fight_stats.append(stats[pf.player_id])
+
+            apply_fight_to_stats(fight_stats, game, fight_playerfights)
+
+        current = []
+        for pf in playerfights:
+            if current and current[0].fight_id != pf.fight_id:
+                apply(current)
+                current = []
+            current.append(pf)
+
+        if current:
+            apply(current)
+
+        return list(stats.values())
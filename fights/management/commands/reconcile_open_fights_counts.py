@@ -0,0 +1,76 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+
+from fights.models import PlayerFight, OpenFightsCount
+
+
+class Command(BaseCommand):
+    help = 'Repair the open fights counts of the users that have drifted from their actual fights.'
+
+    def add_arguments(self, parser):
+        # To run it as a background job (see the 'reconciler' service
+        # in the compose files).
+        parser.add_argument(
+            '--every',
+            type=int,
+            metavar='SECONDS',
+            help='Keep running, reconciling once every this many seconds.'
+        )
+
+    def get_actual_count(self, user_id):
+        return PlayerFight.objects.of_unfinished_fight().of_untrusted_code().filter(
+            player_id=user_id
+        ).count()
+
+    def reconcile(self):
+        # The house bots aren't counted (see CreateFightService), so
+        # any counts of theirs are repaired to 0.
+        actual = dict(
+            PlayerFight.objects.of_unfinished_fight().of_untrusted_code().values('player_id').annotate(
+                count=models.Count('id')
+            ).values_list('player_id', 'count')
+        )
+
+        counted = dict(
+            OpenFightsCount.objects.exclude(count=0).values_list('user_id', 'count')
+        )
+
+        # These are read at different times and without locks, so a
+        # mismatch may just be a fight being created or finished right
+        # now. Each one is checked again with the counter locked.
+        mismatched = sorted(
+            user_id for user_id in actual.keys() | counted.keys()
+            if actual.get(user_id, 0) != counted.get(user_id, 0)
+        )
+
+        repaired = 0
+        for user_id in mismatched:
+            with transaction.atomic():
+                OpenFightsCount.objects.bulk_create([OpenFightsCount(user_id=user_id)],
+                                                    ignore_conflicts=True)
+
+                # While the counter is locked, any transaction changing the
+                # user's fights is either committed (and seen by the count
+                # below) or will update the counter only after we're done.
+                counter = OpenFightsCount.objects.select_for_update().get(user_id=user_id)
+
+                count = self.get_actual_count(user_id)
+                if counter.count != count:
+                    counter.count = count
+                    counter.save(update_fields=['count'])
+                    repaired += 1
+
+        return repaired
+
+    def handle(self, *args, **options):
+        while True:
+            repaired = self.reconcile()
+
+            self.stdout.write(f'Repaired the open fights counts of {repaired} users.')
+
+            if not options['every']:
+                break
+
+            time.sleep(options['every'])
@@ -5,10 +5,11 @@ from django.utils import timezone
 from django.utils.crypto import get_random_string
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
+from django.contrib.postgres.fields import ArrayField
 
 from common.values import TerminationReasons
 
-from gamespecs.models import GameInfo
+from gamespecs.models import GameInfo, CodeFile
 from accounts.models import User
 
 import uuid
@@ -23,6 +24,7 @@ class TerminationReasonsChoices(models.TextChoices):
     SABOTAGE =        TerminationReasons.SABOTAGE,        'Code Sabotage'
     XCPUTIME =        TerminationReasons.XCPUTIME,        'CPU Time Exeeded'
     SECCOMP =         TerminationReasons.SECCOMP,         'Seccomp'
+    TRUSTED_ERROR =   TerminationReasons.TRUSTED_ERROR,   'Trusted Code Error'
 
 
 class FightQuerySet(models.QuerySet):
@@ -225,6 +227,10 @@ class PlayerFightQuerySet(models.QuerySet):
     def of_player(self, player):
         return self.filter(player=player)
     
+    def of_untrusted_code(self):
+        """Leave out the house bots, i.e., the players with trusted codes (see TrustedCode)."""
+        return self.filter(code__trusted__isnull=True)
+    
     def prefetch_playerfights_with_players_of_fight(self, *, playerfight_fields=None, user_fields=None, order_by=None):
         """Prefetch the PlayerFight's and the players for each Fight of the PlayerFight queryset.
         
@@ -310,6 +316,13 @@ class PlayerFight(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['fight', 'player'], name='unique_fight_and_player')
         ]
+        
+        indexes = [
+            # For the keyset pagination of the fights of a player (see
+            # FightSummaryQuerySet.of_player()). The unique constraint
+            # above can't serve it, as it leads with the fight.
+            models.Index(fields=['player', '-fight'], name='playerfight_player_fight_idx')
+        ]
     
     def get_code_upload_path(self, _):
         return settings.FIGHT_CODES_DIR / f'{get_random_string(length=32)}.py'
@@ -317,7 +330,14 @@ class PlayerFight(models.Model):
     fight = models.ForeignKey(Fight, on_delete=models.CASCADE)
     player = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET(get_sentinel_user))
     
-    code_file = models.FileField(upload_to=get_code_upload_path)
+    # The column holds the hash of the code, which the simulator
+    # can also use as the key of whatever it caches per code.
+    code = models.ForeignKey(CodeFile, on_delete=models.PROTECT, null=True)
+    
+    # Only for the fights created before the codes were content-addressed;
+    # the command 'import_legacy_code_files' moves them to 'code'. To be
+    # removed once that's done.
+    code_file = models.FileField(upload_to=get_code_upload_path, blank=True)
     
     # Empty string will mean that the execution was fully successful for
     # the player code through the entire length of the simulation.
@@ -348,11 +368,220 @@ class PlayerFight(models.Model):
     # 1 for win and 0 for lost.
     won_or_rank = models.IntegerField(blank=True, null=True)
     
+    # The encoded performance report of the player code (see fights.perf),
+    # for the player to see where their code took its time and memory.
+    # Null for the fights simulated before these were measured.
+    perf_report = models.BinaryField(blank=True, null=True)
+    
     def __str__(self):       
         return f'{self.id}. {self.fight.game.title} (@{self.player.username})'
     
     objects = models.Manager.from_queryset(PlayerFightQuerySet)()
+
+
+class FightSummaryQuerySet(models.QuerySet):
+    def of_player(self, player):
+        """Filter the summaries of the fights of a player, annotated with the player's outcome as 'player_outcome'.
+        
+        They're also annotated with the fight id as seen from the player's
+        PlayerFight, as 'playerfight_fight_id'. Ordering (and paginating)
+        by it, rather than by the summary's own columns, lets the database
+        walk the player's fights in the order of playerfight_player_fight_idx
+        and stop at the page size, rather than sorting all of them.
+        """
+        return self.filter(
+            fight__playerfight__player=player
+        ).annotate(
+            # Both use the same join as the filter above.
+            player_outcome=models.F('fight__playerfight__won_or_rank'),
+            playerfight_fight_id=models.F('fight__playerfight__fight')
+        )
+
+
+class PublicFightSummariesManager(models.Manager):
+    def get_queryset(self):
+        return super().get_queryset().filter(is_public=True)
+
+
+# A denormalized, compact summary of each finished fight; everything the
+# fight lists need, in a single row, so that they can be rendered from a
+# single query with no joins or prefetches, regardless of the number of
+# players in each fight. It's written by the result processor along with
+# the results (in the same transaction), and never changes afterwards.
+# So, for instance, the usernames are the ones at the end of the fight.
+class FightSummary(models.Model):
+    class Meta:
+        indexes = [
+            # For the keyset pagination of the public fights.
+            models.Index(
+                fields=['is_public', '-finished_at', '-fight'],
+                name='fightsummary_public_idx'
+            )
+        ]
+    
+    fight = models.OneToOneField(Fight, on_delete=models.CASCADE,
+                                 primary_key=True, related_name='summary')
+    
+    # Copied from the fight and its game.
+    uuid = models.UUIDField()
+    finished_at = models.DateTimeField()
+    is_public = models.BooleanField()
+    game_title = models.CharField(max_length=50)
+    game_conclusion_system = models.CharField(max_length=2, choices=GameInfo.ConclusionSystems)
+    
+    # For each player, ordered the same as the PlayerFight's ids (i.e.,
+    # by the player indices in the game); the 'won_or_rank' of each
+    # player is its outcome (see PlayerFight).
+    player_usernames = ArrayField(models.CharField(max_length=150))
+    outcomes = ArrayField(models.IntegerField(null=True))
+    
+    @classmethod
+    def from_fight(cls, fight, playerfights):
+        """Make the summary of a finished fight.
+        
+        Parameters
+        ----------
+        fight : Fight
+            The fight, with 'uuid', 'finished_at', 'is_public', 'game__title'
+            and 'game__conclusion_system' loaded.
+        
+        playerfights : Iterable[PlayerFight]
+            The playerfights of the fight, ordered by the id, with
+            'won_or_rank' and 'player__username' loaded.
+        """
+        return cls(
+            fight=fight,
+            uuid=fight.uuid,
+            finished_at=fight.finished_at,
+            is_public=fight.is_public,
+            game_title=fight.game.title,
+            game_conclusion_system=fight.game.conclusion_system,
+            player_usernames=[pf.player.username for pf in playerfights],
+            outcomes=[pf.won_or_rank for pf in playerfights]
+        )
+    
+    def get_absolute_url(self):
+        return reverse('view_fight', kwargs={'uuid': self.uuid.hex})
+    
+    # The helpers below are for the templates.
+    
+    @property
+    def players(self):
+        return list(zip(self.player_usernames, self.outcomes))
+    
+    @property
+    def winners(self):
+        return [username for username, outcome in self.players if outcome]
+    
+    @property
+    def losers(self):
+        return [username for username, outcome in self.players if not outcome]
     
+    @property
+    def ranked_players(self):
+        # The players without a rank (e.g., those whose code crashed)
+        # come last, rather than failing the comparison.
+        return sorted(self.players, key=lambda p: (p[1] is None, p[1] or 0))
+    
+    def __str__(self):
+        return f'{self.fight_id}. {self.game_title} ({", ".join(self.player_usernames)})'
+    
+    objects = models.Manager.from_queryset(FightSummaryQuerySet)()
+    public = PublicFightSummariesManager.from_queryset(FightSummaryQuerySet)()
+    
+
+class OpenFightsCountQuerySet(models.QuerySet):
+    def get_count(self, user):
+        return self.filter(user=user).values_list('count', flat=True).first() or 0
+    
+    def add(self, user_ids, delta):
+        """Add delta to the counts of the users; must be called in a transaction."""
+        self.bulk_create([
+            OpenFightsCount(user_id=user_id) for user_id in user_ids
+        ], ignore_conflicts=True)
+        
+        # Locked in the order of the user ids first, so that the
+        # concurrent updates of overlapping users can't deadlock.
+        list(self.select_for_update().filter(
+            user_id__in=user_ids
+        ).order_by('user_id').values_list('user_id'))
+        
+        self.filter(user_id__in=user_ids).update(count=models.F('count') + delta)
+
+
+# The number of the unfinished fights each user has attended (i.e., has
+# a PlayerFight in), so that checking whether a user can attend another
+# fight is a primary key read rather than a count over their fights. It's
+# maintained by the services that create, accept, cancel and finish the
+# fights; the command 'reconcile_open_fights_counts' repairs any drift.
+class OpenFightsCount(models.Model):
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+                                primary_key=True)
+    
+    count = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f'@{self.user_id}: {self.count}'
+    
+    objects = models.Manager.from_queryset(OpenFightsCountQuerySet)()
+
+
+class PlayerGameStatsQuerySet(models.QuerySet):
+    def leaderboard(self, game):
+        return self.filter(game=game, rated_fights__gt=0).order_by('-rating', 'player_id')
+
+
+# The aggregate statistics of each player in each game, kept up to date
+# incrementally by the result processor as each fight finishes (see
+# fights.stats), so that they can be read without scanning the player's
+# fights. They can always be rebuilt from the history with the command
+# 'rebuild_player_game_stats'.
+class PlayerGameStats(models.Model):
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['player', 'game'],
+                                    name='player_game_stats_unique_player_game'),
+        ]
+        
+        indexes = [
+            # For the leaderboards.
+            models.Index(fields=['game', '-rating'], name='player_game_stats_rating_idx')
+        ]
+    
+    player = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    game = models.ForeignKey(GameInfo, on_delete=models.CASCADE)
+    
+    fights = models.IntegerField(default=0)
+    
+    # For the rank-based games, a win is ranking first; the rest are losses.
+    wins = models.IntegerField(default=0)
+    losses = models.IntegerField(default=0)
+    draws = models.IntegerField(default=0)
+    
+    # The number of the player's codes terminated, by the reason
+    # (see TerminationReasons), e.g., {"EM": 2}.
+    terminations = models.JSONField(default=dict)
+    
+    # Only counts the fights with scores; for the average score.
+    scored_fights = models.IntegerField(default=0)
+    score_sum = models.BigIntegerField(default=0)
+    
+    # Elo rating; see fights.stats.
+    rating = models.FloatField(default=1500)
+    rated_fights = models.IntegerField(default=0)
+    
+    @property
+    def average_score(self):
+        if not self.scored_fights:
+            return None
+        
+        return self.score_sum / self.scored_fights
+    
+    def __str__(self):
+        return f'{self.id}. {self.game_id} (@{self.player_id}): {self.rating:.0f}'
+    
+    objects = models.Manager.from_queryset(PlayerGameStatsQuerySet)()
+
 
 class HostingQuerySet(models.QuerySet):
     def of_host(self, host):
@@ -570,7 +799,13 @@ class PendingInvitationsManager(models.Manager):
 class Invitation(models.Model):
     class Meta:
         indexes = [
-            models.Index('target', 'uuid', name='invitation_target_and_uuid_idx')
+            models.Index('target', 'uuid', name='invitation_target_and_uuid_idx'),
+            
+            # For the keyset pagination of the invitations of a player.
+            models.Index(
+                fields=['target', '-is_accepted', '-id'],
+                name='invitation_target_accepted_idx'
+            )
         ]
     
     hosting = models.ForeignKey(Hosting, on_delete=models.CASCADE)
@@ -0,0 +1,57 @@
+from games._base.flow import (
+    FlowFormatError,
+    write_varint,
+    read_varint,
+    read_varints,
+    write_delta_column,
+    read_delta_column
+)
+
+
+# The performance report of a player code in a fight: what it took on
+# each command of the game (e.g., on each tick), as measured by the
+# simulator while the code was stopped between the commands:
+#   - 'cpu': the CPU time, in microseconds
+#   - 'memory': the size of the address space (which is what the memory
+#     limit applies to) after the command, in KiB
+#   - 'response': the size of the response, in bytes
+#
+# Stored in its own compact format, with the same helpers as the flows
+# (see games._base.flow):
+#   - the format version, as a byte
+#   - the command count, as a varint
+#   - 'cpu' and 'response', as varints
+#   - 'memory', as a delta column, as it rarely changes
+#
+# The version must be bumped on any change, and the older versions must
+# still be decoded, as with the flows.
+PERF_REPORT_FORMAT_VERSION = 1
+
+
+def encode_perf_report(perf):
+    buffer = bytearray([PERF_REPORT_FORMAT_VERSION])
+
+    write_varint(buffer, len(perf['cpu']))
+
+    for v in perf['cpu']:
+        write_varint(buffer, v)
+
+    write_delta_column(buffer, perf['memory'])
+
+    for v in perf['response']:
+        write_varint(buffer, v)
+
+    return bytes(buffer)
+
+
+def decode_perf_report(data):
+    if not data or data[0] != PERF_REPORT_FORMAT_VERSION:
+        raise FlowFormatError('unknown perf report format')
+
+    count, offset = read_varint(data, 1)
+
+    cpu, offset = read_varints(data, offset, count)
+    memory, offset = read_delta_column(data, offset, count)
+    response, offset = read_varints(data, offset, count)
+
+    return {'cpu': cpu, 'memory': memory, 'response': response}
@@ -0,0 +1,121 @@
+import time
+
+import redis
+
+from django.conf import settings
+from django.core.cache import cache
+
+from common.pools import get_pool_name_of_game, get_game_stream, get_pool_key
+
+
+# The lanes that the simulations are queued in; see
+# SIMULATOR_LANE_WEIGHTS in the global config. The probes
+# (see ProbeCodeService) aren't simulations as such, and
+# aren't weighted; they're always taken first.
+class SimulationLanes:
+    INTERACTIVE = 'interactive'
+    BATCH = 'batch'
+    PROBE = 'probe'
+
+
+def get_lane_stream(lane, game_name):
+    """Get the stream that the simulations of a game are sent to in a lane (see common.pools)."""
+    if lane == SimulationLanes.INTERACTIVE:
+        lane_stream = settings.REDIS_SIMULATOR_STREAM
+    else:
+        lane_stream = settings.REDIS_SIMULATOR_LANE_STREAMS[lane]
+    
+    return get_game_stream(settings.SIMULATOR_POOLS, lane_stream, game_name)
+
+
+def get_queue_entry_cache_key(fight_id):
+    return f'fight_queue_entry_{fight_id}'
+
+
+def parse_entry_id(entry_id):
+    # e.g., '1700000000000-0'
+    return tuple(int(part) for part in entry_id.split('-'))
+
+
+def get_queue_estimate(redis_client, fight_id):
+    """Estimate the position of a fight in its simulation queue, and how long it'll wait.
+    
+    Returns
+    -------
+    dict | None
+        'position' (the number of the simulations ahead of it in its lane)
+        and 'wait' (in seconds, or None if there's nothing to estimate with
+        yet); or None if the fight is no longer waiting (or was never sent).
+    
+    Notes
+    -----
+    The wait is the time it takes the live workers (of the pool of the
+    fight's game) to get through the simulations ahead, given the recent
+    durations, and given that the lane only gets its share of the
+    workers (among the lanes that have something waiting). For the pools
+    of more than one game, the other games' streams aren't counted.
+    """
+    entry = cache.get(get_queue_entry_cache_key(fight_id))
+    if entry is None:
+        return None
+    
+    lane, game_name, entry_id = entry
+    
+    pool_name = get_pool_name_of_game(settings.SIMULATOR_POOLS, game_name)
+    
+    groups = {}  # by the lane
+    for l in settings.SIMULATOR_LANE_WEIGHTS:
+        try:
+            lane_groups = redis_client.xinfo_groups(get_lane_stream(l, game_name))
+        # The stream isn't created yet (by the simulators).
+        except redis.exceptions.ResponseError:
+            continue
+        
+        for group in lane_groups:
+            if group['name'] == settings.REDIS_SIMULATOR_GROUP:
+                groups[l] = group
+    
+    if lane not in groups:
+        return None
+    
+    last_delivered_id = groups[lane]['last-delivered-id']
+    
+    # Already taken by a worker.
+    if parse_entry_id(entry_id) <= parse_entry_id(last_delivered_id):
+        return None
+    
+    position = len(redis_client.xrange(
+        get_lane_stream(lane, game_name),
+        min=f'({last_delivered_id}',
+        max=f'({entry_id}',
+        count=settings.QUEUE_ESTIMATE_MAX_POSITION
+    ))
+    
+    durations = [float(d) for d in redis_client.lrange(
+        get_pool_key(settings.REDIS_SIMULATION_DURATIONS_KEY, pool_name), 0, -1
+    )]
+    
+    workers = redis_client.zcount(
+        get_pool_key(settings.REDIS_SIMULATOR_WORKERS_KEY, pool_name),
+        time.time() - settings.SIMULATOR_WORKER_ALIVE_TIMEOUT,
+        '+inf'
+    )
+    
+    if not durations or not workers:
+        return {'position': position, 'wait': None}
+    
+    # The lag (the number of the undelivered entries) is only
+    # reported by the newer versions of Redis; if it's missing,
+    # the lane is taken as busy.
+    busy_weight = sum(
+        weight for l, weight in settings.SIMULATOR_LANE_WEIGHTS.items()
+        if l == lane or groups.get(l, {}).get('lag') != 0
+    )
+    share = settings.SIMULATOR_LANE_WEIGHTS[lane] / busy_weight
+    
+    average_duration = sum(durations) / len(durations)
+    
+    # +1 for the fight itself.
+    wait = (position + 1) * average_duration / (workers * share)
+    
+    return {'position': position, 'wait': round(wait)}
@@ -1,11 +1,19 @@
 import redis
 import json
+import time
+import hashlib
 
 from django.db import transaction, models
 from django.conf import settings
+from django.core.cache import cache
 from utils import postgres
+from common.trusted import sign_trusted_code
 
-from fights.models import Fight, Invitation, PlayerFight, Hosting
+from fights.models import Fight, Invitation, PlayerFight, Hosting, OpenFightsCount
+from fights import events
+from fights.queue import SimulationLanes, get_lane_stream, get_queue_entry_cache_key, get_queue_estimate
+from gamespecs.models import CodeFile, TrustedCode
+from gamespecs.codes import acquire_code
 
 
 # We'll want everything in text form, so enable auto-decoding.
@@ -29,7 +37,7 @@ class AdvisoryLocks:
         Notes
         -----
         Since the number of simultaneous fights must be monitored to not
-        exceed a certain number (currently only one), here we create an
+        exceed a certain number (see MAX_USER_ATTENDED_FIGHTS), here we create an
         advisory PostgreSQL lock to prevent another transaction from
         attending or creating another fight. Another way would be to hold
         a row-level lock (SELECT FOR UPDATE) on the user object, or to
@@ -57,9 +65,7 @@ class CheckUserAttendedFightsFullService:
     
     def execute(self) -> bool:
         # >= instead of == for safe measure.
-        return Fight.objects.filter(
-            players__in=[self.user],
-        ).unfinished().count() >= settings.MAX_USER_ATTENDED_FIGHTS
+        return OpenFightsCount.objects.get_count(self.user) >= settings.MAX_USER_ATTENDED_FIGHTS
 
 
 class CreateFightService:
@@ -67,19 +73,25 @@ class CreateFightService:
     SUCCESS = 0
     ERROR_ATTENDED_FIGHTS_FULL = 1
     ERROR_BAD_REQUEST = 2
+    ERROR_ALREADY_HOSTING = 3
     
     def __init__(self, *,
             game_info,
             host,
             host_code,
             invited_players,
-            is_public
+            is_public,
+            house_bots=()
         ):
         self.game_info = game_info
         self.host = host
         self.host_code = host_code
         self.invited_players = invited_players
         self.is_public = is_public
+        
+        # The presets of the house bots to play in the fight, with their
+        # 'player' loaded; see GameCodePresetQuerySet.house_bots().
+        self.house_bots = house_bots
     
     def execute(self):
         with transaction.atomic(durable=True):
@@ -88,14 +100,26 @@ class CreateFightService:
             if CheckUserAttendedFightsFullService(self.host).execute():
                 return CreateFightService.ERROR_ATTENDED_FIGHTS_FULL
             
+            # Only one hosting at a time (see StartHostedFightService),
+            # even though the user may attend more fights.
+            if Hosting.objects.of_host(self.host).exists():
+                return CreateFightService.ERROR_ALREADY_HOSTING
+            
             # +1 for the host.
-            players_count = len(self.invited_players) + 1
+            players_count = len(self.invited_players) + len(self.house_bots) + 1
+            
+            bot_players = [preset.player for preset in self.house_bots]
             
             if any([
                 players_count < self.game_info.min_players,
                 players_count > self.game_info.max_players,
                 
-                self.host in self.invited_players
+                self.host in self.invited_players,
+                
+                # Each player plays once.
+                len(set(bot_players)) < len(bot_players),
+                self.host in bot_players,
+                any(player in self.invited_players for player in bot_players)
             ]):
                 return CreateFightService.ERROR_BAD_REQUEST
             
@@ -109,14 +133,38 @@ class CreateFightService:
             PlayerFight.objects.create(
                 fight=fight,
                 player=self.host,
-                code_file=self.host_code
+                code_id=acquire_code(self.host_code)
             )
             
+            # The house bots join right away, with their (trusted) codes
+            # referred to as they are. Their open fights aren't counted,
+            # as they're in any number of fights; otherwise, the counter
+            # of each bot would be a row locked by all of its fights.
+            PlayerFight.objects.bulk_create([
+                PlayerFight(fight=fight, player=preset.player,
+                            code_id=acquire_code(preset))
+                for preset in self.house_bots
+            ])
+            
+            OpenFightsCount.objects.add([self.host.id], 1)
+            
             hosting = Hosting.objects.create(host=self.host, fight=fight)
             
             Invitation.objects.bulk_create([
                 Invitation(hosting=hosting, target=player) for player in self.invited_players
             ])
+        
+        # Signal the invited players only after the commit, so that the
+        # invitations are already visible when their dashboards update.
+        for player in self.invited_players:
+            redis_client.publish(
+                events.INVITATION_RECEIVED.format(user_id=player.id), ''
+            )
+        
+        # Against the house bots only, there's no invitation to wait for
+        # (see PerformHostingAutoActionService).
+        if not self.invited_players:
+            PerformHostingAutoActionService.start_fight(self.host)
 
         return CreateFightService.SUCCESS
 
@@ -126,6 +174,7 @@ class StartHostedFightService:
     SUCCESS = 0
     ERROR_NO_SUCH_HOSTING = 1
     ERROR_BAD_REQUEST = 2
+    ERROR_TOO_MANY_IN_FLIGHT = 3
     
     def __init__(self, host):
         self.host = host
@@ -170,6 +219,14 @@ class StartHostedFightService:
             
             fight = hosting.fight  # cache
             
+            # Held back, with nothing changed, until the players have fewer
+            # fights being simulated; see MAX_USER_STARTED_SIMULATIONS. The
+            # fight isn't started yet, so it's not counted.
+            if is_any_player_over_in_flight_limit(
+                fight, settings.MAX_USER_STARTED_SIMULATIONS - 1
+            ):
+                return StartHostedFightService.ERROR_TOO_MANY_IN_FLIGHT
+            
             # Delete the hosting, which will in turn delete all the invitations
             # by a cascade delete. This will block until all concurrent invitation
             # acceptances or attendance cancelings are processed. Therefore, it's
@@ -213,49 +270,226 @@ class CancelHostedFightService:
         # the fight gets started, then we shouldn't cancel (=delete) the
         # fight.
         #
-        # We don't care about locking the fight here, but merely not
-        # blocking (and not doing anything) in case the fight is locked
-        # (thus we don't even have a transaction). For that, select_for_update()
-        # is necessary.
+        # We don't care about waiting for the fight's lock here, but
+        # merely not blocking (and not doing anything) in case the fight
+        # is locked. For that, select_for_update(skip_locked=True) is
+        # necessary.
         #
-        # Note that this will also cascade delete the hosting and the
-        # invitations.
-        deleted = Fight.objects.select_for_update(skip_locked=True).filter(
-            pk=models.Subquery(
-                Hosting.objects.filter(host=self.host).values('fight__id')
+        # The open fights counts of the players (and the reference counts
+        # of their codes) must be decremented, so we need to know exactly
+        # who the players are when the fight is deleted. Similar to
+        # StartHostedFightService, we first delete the hosting (and thus
+        # the invitations), which blocks until all the concurrent
+        # invitation acceptances are processed; after that, the set of
+        # the PlayerFight's won't change.
+        with transaction.atomic(durable=True):
+            fight = Fight.objects.select_for_update(skip_locked=True).filter(
+                pk=models.Subquery(
+                    Hosting.objects.filter(host=self.host).values('fight__id')
+                )
+            ).not_started().only('id').first()
+            
+            if not fight:
+                return CancelHostedFightService.ERROR_NO_SUCH_HOSTING
+            
+            Hosting.objects.filter(fight=fight).delete()
+            
+            playerfights = list(PlayerFight.objects.filter(
+                fight=fight
+            ).annotate(
+                is_trusted=models.Exists(
+                    TrustedCode.objects.filter(code_id=models.OuterRef('code_id'))
+                )
+            ).values_list('player_id', 'code_id', 'is_trusted'))
+            
+            # Also cascade deletes the PlayerFight's.
+            fight.delete()
+            
+            # The code files are always locked before the counts (as in
+            # creating and accepting), so that these can't deadlock. The
+            # house bots aren't counted (see CreateFightService).
+            CodeFile.objects.add_references([code_id for _, code_id, _ in playerfights], -1)
+            OpenFightsCount.objects.add(
+                [player_id for player_id, _, is_trusted in playerfights if not is_trusted], -1
             )
-        ).not_started().delete()[0]
-    
-        if deleted == 0:
-            return CancelHostedFightService.ERROR_NO_SUCH_HOSTING
         
         return CancelHostedFightService.SUCCESS
 
 
 
+# Set in place of the verdict of a code while its probe is on the way.
+PENDING_PROBE_VERDICT = 'pending'
+
+
+def get_probe_verdict_key(game_name, sha256):
+    return f'{settings.REDIS_PROBE_VERDICT_KEY_PREFIX}{game_name}_{sha256}'
+
+
+def get_probe_verdicts(codes):
+    """Get the verdicts of the probes of the given codes; see ProbeCodeService.
+    
+    Parameters
+    ----------
+    codes : list[tuple[str, str]]
+        The name of the game, and the hash of the code, of each code.
+    
+    Returns
+    -------
+    list[dict | None]
+        The verdict of each code, i.e., {'ok': True} or {'ok': False,
+        'termination_reason': ...}, or None if it isn't known (yet).
+    """
+    if not codes:
+        return []
+    
+    verdicts = redis_client.mget([
+        get_probe_verdict_key(game_name, sha256) for game_name, sha256 in codes
+    ])
+    
+    return [
+        None if verdict in (None, PENDING_PROBE_VERDICT) else json.loads(verdict)
+        for verdict in verdicts
+    ]
+
+
+class ProbeCodeService:
+    """A service to have a player code tried in the sandbox, without waiting for the verdict.
+    
+    The simulator sets up the code on its own and gives it the game's
+    probe command (see Game.get_probe_command()); if the code doesn't
+    survive that, it would be eliminated right at the start of a fight.
+    
+    A code is only probed once it's been accepted for a fight, so that
+    the probes are bounded by the attended fights limit. The verdict is
+    kept by the hash of the code, so that the player is told about it
+    on the dashboard, and the code is rejected if it's uploaded again
+    (see PlayerCodeForm); see get_probe_verdicts().
+    """
+    
+    # Results
+    SENT = 0
+    ALREADY_PROBED = 1
+    
+    def __init__(self, *, game_info, code):
+        self.game_info = game_info
+        self.code = code
+    
+    def execute(self):
+        content = b''.join(self.code.chunks())
+        verdict_key = get_probe_verdict_key(self.game_info.name,
+                                            hashlib.sha256(content).hexdigest())
+        
+        # Unless the code has a verdict, or a probe on the way already.
+        # If the probe is dropped, the mark expires along with it.
+        if not redis_client.set(verdict_key, PENDING_PROBE_VERDICT,
+                                nx=True, ex=settings.CODE_PROBE_TIMEOUT):
+            return ProbeCodeService.ALREADY_PROBED
+        
+        data = {
+            'type': 'probe',
+            'game': self.game_info.name,
+            # The same as the default of Fight.game_settings, since
+            # the settings aren't implemented yet.
+            'game_settings': Fight._meta.get_field('game_settings').default,
+            'player_count': self.game_info.min_players,
+            
+            # Already validated (see PlayerCodeForm), so it's text.
+            'code': content.decode(),
+            
+            'verdict_key': verdict_key,
+            'verdict_timeout': settings.CODE_PROBE_VERDICT_TIMEOUT,
+            
+            # The simulator drops the probe if it only gets to it later.
+            'deadline': time.time() + settings.CODE_PROBE_TIMEOUT,
+        }
+        
+        redis_client.xadd(get_lane_stream(SimulationLanes.PROBE, self.game_info.name),
+            {'data': json.dumps(data)}
+        )
+        
+        return ProbeCodeService.SENT
+
+
+def is_any_player_over_in_flight_limit(fight, limit):
+    """Tell whether any player of a fight has more than the given number of fights being simulated.
+    
+    The fight itself is counted too, if it's started. The house bots
+    (i.e., the players with trusted codes) are in any number of fights,
+    so they aren't counted.
+    """
+    return PlayerFight.objects.of_ongoing_fight().filter(
+        player__in=models.Subquery(
+            PlayerFight.objects.filter(
+                fight=fight
+            ).of_untrusted_code().values('player_id')
+        )
+    ).values('player_id').annotate(
+        in_flight=models.Count('id')
+    ).filter(
+        in_flight__gt=limit
+    ).exists()
+
+
 class SendFightForSimulationService:
-    def __init__(self, fight):
+    def __init__(self, fight, lane=SimulationLanes.INTERACTIVE):
         self.fight = fight
+        self.lane = lane
     
     def execute(self):
+        lane = self.lane
+        if lane != SimulationLanes.BATCH and is_any_player_over_in_flight_limit(
+            self.fight, settings.MAX_USER_IN_FLIGHT_SIMULATIONS
+        ):
+            lane = SimulationLanes.BATCH
+        
+        # The file, the hash and whether it's trusted, of each code.
+        codes = list(self.fight.playerfight_set.annotate(
+            is_trusted=models.Exists(
+                TrustedCode.objects.filter(code_id=models.OuterRef('code_id'))
+            )
+        ).values_list(
+            'code__file',
+            'code_id',
+            'is_trusted'
+        ).order_by('id'))
+        
         data = {
             'fight_id': self.fight.id,
             'game': self.fight.game.name,
             'game_settings': self.fight.game_settings,
             
-            # Each item from this .values_list() will be a 1-tuple. We order by
-            # ID, so that when the results arrive, we know which code belonged
-            # to which player.
-            'codes_filenames': [
-                q[0] for q in self.fight.playerfight_set.values_list(
-                    'code_file'
-                ).order_by('id')
+            # We order by ID, so that when the results arrive, we
+            # know which code belonged to which player.
+            'codes_filenames': [code_file for code_file, _, _ in codes],
+            
+            # None for each code that isn't trusted; see common.trusted.
+            'trusted_signatures': [
+                sign_trusted_code(settings.TRUSTED_CODES_KEY, sha256)
+                if is_trusted and settings.TRUSTED_CODES_KEY else None
+                for _, sha256, is_trusted in codes
             ]
         }
 
-        redis_client.xadd(settings.REDIS_SIMULATOR_STREAM,
+        # Each game has its own streams if it has its own pool
+        # of simulators; see common.pools.
+        entry_id = redis_client.xadd(get_lane_stream(lane, self.fight.game.name),
             {'data': json.dumps(data)}
         )
+        
+        # For estimating the wait; see fights.queue.
+        cache.set(get_queue_entry_cache_key(self.fight.id),
+                  (lane, self.fight.game.name, entry_id),
+                  timeout=settings.QUEUE_ENTRY_CACHE_TIMEOUT)
+
+
+class EstimateSimulationWaitService:
+    """A service to estimate the queue position and the wait of a fight sent for simulation; see get_queue_estimate()."""
+    
+    def __init__(self, fight):
+        self.fight = fight
+    
+    def execute(self):
+        return get_queue_estimate(redis_client, self.fight.id)
 
 
 class PerformHostingAutoActionService:
@@ -312,9 +546,21 @@ class PerformHostingAutoActionService:
             if inv_count+1 < hosting.fight.game.min_players:
                 transaction.on_commit(CancelHostedFightService(hosting.host).execute)
             elif hosting.invitation_set.pending().count() == 0:
-                transaction.on_commit(StartHostedFightService(hosting.host).execute)
+                transaction.on_commit(lambda: self.start_fight(hosting.host))
         
         return PerformHostingAutoActionService.SUCCESS
+    
+    @staticmethod
+    def start_fight(host):
+        result = StartHostedFightService(host).execute()
+        
+        # Nobody asked for this start, so the host is told that the fight
+        # is held back (see MAX_USER_STARTED_SIMULATIONS); the dashboard
+        # then shows why, and the host can start it later on.
+        if result == StartHostedFightService.ERROR_TOO_MANY_IN_FLIGHT:
+            redis_client.publish(events.FIGHT_HELD_BACK.format(user_id=host.id), '')
+        
+        return result
 
 
 class AcceptInvitationService:
@@ -379,15 +625,21 @@ class AcceptInvitationService:
             PlayerFight.objects.create(
                 fight=invitation.hosting.fight,
                 player=self.target,
-                code_file=self.code
+                code_id=acquire_code(self.code)
             )
             
+            OpenFightsCount.objects.add([self.target.id], 1)
+            
             # Must be inside this transaction, so that the invitation cannot
             # be deleted while being updated.
             invitation.mark_accepted()
             
             PerformHostingAutoActionService(invitation.hosting.host).execute()
-
+        
+        # Signal the host after the commit (see CreateFightService).
+        redis_client.publish(
+            events.INVITATION_ACCEPTED.format(user_id=invitation.hosting.host.id), ''
+        )
         
         # Note that we're only storing the cached version of the invitation.
         # It might have been deleted in the mean time after we exit the
@@ -477,10 +729,16 @@ class CancelAcceptedInvitationService:
             if not invitation:
                 return CancelAcceptedInvitationService.ERROR_NO_SUCH_INVITATION
             
-            PlayerFight.objects.filter(
+            playerfight = PlayerFight.objects.filter(
                 player=self.target,
                 fight=invitation.hosting.fight
-            ).delete()
+            ).only('code_id').first()
+            
+            if playerfight:
+                playerfight.delete()
+                
+                CodeFile.objects.add_references([playerfight.code_id], -1)
+                OpenFightsCount.objects.add([self.target.id], -1)
             
             # Must be inside the transaction to make sure that the invitation
             # was not removed while performing this.
@@ -0,0 +1,145 @@
+from django.db import transaction
+
+from fights.models import PlayerGameStats
+from gamespecs.models import GameInfo
+
+# Cache
+ConclusionSystems = GameInfo.ConclusionSystems
+
+
+# The Elo K-factor; the most a rating can change by in a fight.
+ELO_K = 32
+
+
+def get_pairwise_score(conclusion_system, outcome, other_outcome):
+    """Get the Elo score (1, 0.5 or 0) of a player against another player of the same fight.
+
+    The outcomes are the 'won_or_rank' of the players (see PlayerFight).
+    """
+    if conclusion_system == ConclusionSystems.VICTORY_DRAW:
+        # Draws and equal outcomes (e.g., both lost) are even.
+        if outcome == other_outcome or outcome is None or other_outcome is None:
+            return 0.5
+        return 1.0 if outcome else 0.0
+    else:  # rank-based; the lower the rank, the better.
+        # A missing rank (not reported by the game) is even with
+        # anything, as with the draws above.
+        if outcome == other_outcome or outcome is None or other_outcome is None:
+            return 0.5
+        return 1.0 if outcome < other_outcome else 0.0
+
+
+def get_rating_changes(conclusion_system, ratings, outcomes):
+    """Get the change of the Elo rating of each player of a fight.
+
+    A fight of more than two players is rated as if each player played
+    each other player, with the K-factor divided between the opponents.
+    """
+    count = len(ratings)
+    if count < 2:
+        return [0.0] * count
+
+    k = ELO_K / (count - 1)
+
+    changes = []
+    for i in range(count):
+        change = 0.0
+        for j in range(count):
+            if i == j:
+                continue
+
+            expected = 1 / (1 + 10 ** ((ratings[j] - ratings[i]) / 400))
+            actual = get_pairwise_score(conclusion_system, outcomes[i], outcomes[j])
+            change += k * (actual - expected)
+
+        changes.append(change)
+
+    return changes
+
+
+def apply_fight_to_stats(stats, game, playerfights):
+    """Add a finished fight to the stats of its players.
+
+    Parameters
+    ----------
+    stats : list[PlayerGameStats]
+        The stats of each player in the game, in the same order as the
+        playerfights. They're modified in place, but not saved.
+
+    game : GameInfo
+        The game, with 'conclusion_system' and 'has_scores' loaded.
+
+    playerfights : list[PlayerFight]
+        The playerfights of the fight, with 'won_or_rank', 'score' and
+        'termination_reason' loaded.
+    """
+    outcomes = [pf.won_or_rank for pf in playerfights]
+
+    rating_changes = get_rating_changes(game.conclusion_system,
+                                        [s.rating for s in stats],
+                                        outcomes)
+
+    for s, pf, rating_change in zip(stats, playerfights, rating_changes):
+        s.fights += 1
+
+        if pf.won_or_rank is None:
+            s.draws += 1
+        elif pf.won_or_rank == 1:  # won, or ranked first
+            s.wins += 1
+        else:
+            s.losses += 1
+
+        if pf.termination_reason:
+            s.terminations[pf.termination_reason] =  \
+                s.terminations.get(pf.termination_reason, 0) + 1
+
+        if game.has_scores and pf.score is not None:
+            s.scored_fights += 1
+            s.score_sum += pf.score
+
+        if len(playerfights) > 1:
+            s.rating += rating_change
+            s.rated_fights += 1
+
+
+@transaction.atomic
+def update_stats_for_fight(game, playerfights):
+    """Add a finished fight to the stored stats of its players; see apply_fight_to_stats().
+
+    This must be done in the same transaction as saving the results,
+    so that the stats count each fight exactly once. The 'player_id'
+    of the playerfights must be loaded.
+    """
+    player_ids = [pf.player_id for pf in playerfights]
+
+    # Create the missing ones first, so that all of them can be locked.
+    PlayerGameStats.objects.bulk_create([
+        PlayerGameStats(player_id=player_id, game=game)
+        for player_id in player_ids
+    ], ignore_conflicts=True)
+
+    # Locked in the order of the player ids, so that two fights
+    # of the same players finishing together can't deadlock.
+    locked = {
+        s.player_id: s
+        for s in PlayerGameStats.objects.select_for_update().filter(
+            game=game,
+            player_id__in=player_ids
+        ).order_by('player_id')
+    }
+
+    stats = [locked[player_id] for player_id in player_ids]
+
+    apply_fight_to_stats(stats, game, playerfights)
+
+    PlayerGameStats.objects.bulk_update(stats, [
+        'fights',
+        'wins',
+        'losses',
+        'draws',
+        'terminations',
+        'scored_fights',
+        'score_sum',
+        'rating',
+        'rated_fights'
+    ])
@@ -1,3 +1,700 @@
-from django.test import TestCase
+import json
+import time
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.core import signing
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import Http404
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from accounts.models import User
+from gamespecs.models import GameInfo, GameCodePreset, TrustedCode
+from gamespecs.codes import store_code
+from fights.models import Fight, PlayerFight, FightSummary, PlayerGameStats, Hosting, Invitation, OpenFightsCount
+from fights.management.commands.reconcile_open_fights_counts import Command as ReconcileCommand
+from fights.stats import get_pairwise_score, get_rating_changes, apply_fight_to_stats
+from fights.views import BeforeAfterPaginator
+from fights.forms import AcceptInvitationForm
+from fights.services import (
+    ProbeCodeService,
+    CreateFightService,
+    StartHostedFightService,
+    AcceptInvitationService,
+    CancelHostedFightService,
+    SendFightForSimulationService
+)
+from fights import events
+from common.values import TerminationReasons
+from fights.queue import SimulationLanes, get_lane_stream, get_queue_entry_cache_key, get_queue_estimate
+from fights.perf import PERF_REPORT_FORMAT_VERSION, encode_perf_report, decode_perf_report
+from games._base.flow import FlowFormatError
+
+# Cache
+ConclusionSystems = GameInfo.ConclusionSystems
+
+
+# Only what get_queue_estimate() uses, over plain dicts and lists.
+class FakeRedis:
+    def __init__(self):
+        self.streams = {}   # stream: [entry id]
+        self.groups = {}    # stream: [group info]
+        self.lists = {}
+        self.sorted_sets = {}
+
+    def xinfo_groups(self, stream):
+        return self.groups[stream]
+
+    def xrange(self, stream, min, max, count):
+        # Only the exclusive ranges, as used.
+        low, high = min.lstrip('('), max.lstrip('(')
+        parse = lambda entry_id: tuple(int(p) for p in entry_id.split('-'))
+
+        return [
+            (entry_id, {}) for entry_id in self.streams[stream]
+            if parse(low) < parse(entry_id) < parse(high)
+        ][:count]
+
+    def lrange(self, key, start, end):
+        return self.lists.get(key, [])
+
+    def zcount(self, key, min, max):
+        return sum(1 for score in self.sorted_sets.get(key, {}).values() if score >= min)
+
+
+# Only what the services use, with a clock of its own for the expiry.
+class FakeServicesRedis:
+    def __init__(self):
+        self.now = 0
+        self.values = {}  # key: (value, expires at)
+        self.streams = {}
+        self.published = []
+
+    def get(self, key):
+        value, expires_at = self.values.get(key, (None, None))
+        if expires_at is not None and expires_at <= self.now:
+            return None
+        return value
+
+    def mget(self, keys):
+        return [self.get(key) for key in keys]
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and self.get(key) is not None:
+            return None
+        self.values[key] = (value, None if ex is None else self.now + ex)
+        return True
+
+    def xadd(self, stream, fields):
+        self.streams.setdefault(stream, []).append(fields)
+        return f'{len(self.streams[stream])}-0'
+
+    def publish(self, channel, message):
+        self.published.append(channel)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    SIMULATOR_POOLS={'default': {'games': None, 'workers': 2, 'cpus': None}},
+    SIMULATOR_LANE_WEIGHTS={'interactive': 3, 'batch': 1},
+    REDIS_SIMULATOR_STREAM='stream',
+    REDIS_SIMULATOR_LANE_STREAMS={'batch': 'stream_batch', 'probe': 'stream_probe'},
+    REDIS_SIMULATOR_GROUP='group',
+    REDIS_SIMULATION_DURATIONS_KEY='durations',
+    REDIS_SIMULATOR_WORKERS_KEY='workers',
+)
+class QueueEstimateTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+        self.redis = FakeRedis()
+
+        # Five waiting in the interactive lane, after the one
+        # delivered last; nothing waiting in the batch lane.
+        self.redis.streams['stream'] = [f'{i}-0' for i in range(1, 7)]
+        self.redis.groups['stream'] = [
+            {'name': 'group', 'last-delivered-id': '1-0', 'lag': 5}
+        ]
+        self.redis.streams['stream_batch'] = []
+        self.redis.groups['stream_batch'] = [
+            {'name': 'group', 'last-delivered-id': '0-0', 'lag': 0}
+        ]
+
+        self.redis.lists['durations:default'] = ['4', '2']
+        self.redis.sorted_sets['workers:default'] = {
+            'worker_1': time.time(),
+            'worker_2': time.time(),
+            # Not seen for long; not counted.
+            'worker_3': 0,
+        }
+
+    def send(self, fight_id, lane, entry_id):
+        cache.set(get_queue_entry_cache_key(fight_id), (lane, 'tanks', entry_id))
+
+    def test_position_and_wait(self):
+        self.send(1, SimulationLanes.INTERACTIVE, '4-0')
+
+        # 2 ahead, with the whole of the 2 workers (the batch lane is
+        # idle), at 3 seconds each.
+        self.assertEqual(get_queue_estimate(self.redis, 1), {'position': 2, 'wait': 4})
+
+    def test_wait_shared_with_busy_lane(self):
+        self.redis.groups['stream_batch'][0]['lag'] = 1
+        self.send(1, SimulationLanes.INTERACTIVE, '4-0')
+
+        # Only 3/4 of the workers.
+        self.assertEqual(get_queue_estimate(self.redis, 1), {'position': 2, 'wait': 6})
+
+    def test_no_durations(self):
+        del self.redis.lists['durations:default']
+        self.send(1, SimulationLanes.INTERACTIVE, '4-0')
+
+        self.assertEqual(get_queue_estimate(self.redis, 1), {'position': 2, 'wait': None})
+
+    def test_already_taken(self):
+        self.send(1, SimulationLanes.INTERACTIVE, '1-0')
+
+        self.assertIsNone(get_queue_estimate(self.redis, 1))
+
+    def test_never_sent(self):
+        self.assertIsNone(get_queue_estimate(self.redis, 1))
+
+    def test_lane_stream(self):
+        self.assertEqual(get_lane_stream(SimulationLanes.INTERACTIVE, 'tanks'), 'stream')
+        self.assertEqual(get_lane_stream(SimulationLanes.BATCH, 'tanks'), 'stream_batch')
+
+        with self.settings(SIMULATOR_POOLS={
+            'default': {'games': None, 'workers': 1, 'cpus': None},
+            'heavy': {'games': ['tanks'], 'workers': 1, 'cpus': None},
+        }):
+            self.assertEqual(get_lane_stream(SimulationLanes.BATCH, 'tanks'), 'stream_batch:tanks')
+
+
+class PerfReportTest(SimpleTestCase):
+    def test_round_trip(self):
+        perf = {
+            'cpu': [120, 5000, 0, 1_000_000],
+            'memory': [40_000, 40_000, 40_128, 39_000],
+            'response': [14, 14, 200, 3],
+        }
+
+        self.assertEqual(decode_perf_report(encode_perf_report(perf)), perf)
+
+    def test_empty(self):
+        perf = {'cpu': [], 'memory': [], 'response': []}
+
+        self.assertEqual(decode_perf_report(encode_perf_report(perf)), perf)
+
+    def test_unknown_version(self):
+        data = bytearray(encode_perf_report({'cpu': [1], 'memory': [1], 'response': [1]}))
+        data[0] = PERF_REPORT_FORMAT_VERSION + 1
+
+        with self.assertRaises(FlowFormatError):
+            decode_perf_report(bytes(data))
+
+        with self.assertRaises(FlowFormatError):
+            decode_perf_report(b'')
+
+    def test_truncated(self):
+        data = encode_perf_report({'cpu': [1, 2], 'memory': [1, 2], 'response': [300, 400]})
+
+        with self.assertRaises(FlowFormatError):
+            decode_perf_report(data[:-1])
+
+
+class BeforeAfterPaginatorTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        game = GameInfo.objects.create(
+            name='paginator_test',
+            title='Paginator Test',
+            short_description='',
+            conclusion_system=GameInfo.ConclusionSystems.VICTORY_DRAW,
+            has_scores=False,
+            min_players=2,
+            max_players=2,
+            documentation='',
+            slug='paginator-test'
+        )
+
+        cls.player = User.objects.create_user(username='player', email='player@example.com', password='x')
+
+        # 7 fights; the last 4 finished at the very same time, so that
+        # only their ids tell them apart. The player is in every other.
+        now = timezone.now()
+        finished_times = [now - timedelta(minutes=m) for m in [6, 5, 4]] + [now] * 4
+
+        for i, finished_at in enumerate(finished_times):
+            fight = Fight.objects.create(game=game, started_at=finished_at, finished_at=finished_at)
+            FightSummary.from_fight(fight, []).save()
+
+            if i % 2 == 0:
+                PlayerFight.objects.create(fight=fight, player=cls.player)
+
+    def make_paginator(self, items_queryset=None, orders=('-finished_at', '-fight_id'), cursor_salt='test'):
+        return BeforeAfterPaginator(
+            items_queryset=FightSummary.objects.all() if items_queryset is None else items_queryset,
+            orders=list(orders),
+            cursor_salt=cursor_salt,
+            items_per_page=3
+        )
+
+    def get_ids(self, paginator):
+        return [summary.fight_id for summary in paginator.items]
+
+    def test_forward_and_back(self):
+        all_ids = list(FightSummary.objects.order_by(
+            '-finished_at', '-fight_id'
+        ).values_list('fight_id', flat=True))
+
+        # (page ids, has previous page, has next page)
+        expected_pages = [
+            (all_ids[0:3], False, True),
+            (all_ids[3:6], True, True),
+            (all_ids[6:7], True, False),
+        ]
+
+        paginator = self.make_paginator()
+        paginator.paginate()
+        pages = [(self.get_ids(paginator), paginator.has_previous_page, paginator.has_next_page)]
+
+        while paginator.has_next_page:
+            paginator.paginate(before=paginator.next_cursor)
+            pages.append((self.get_ids(paginator), paginator.has_previous_page, paginator.has_next_page))
+
+        self.assertEqual(pages, expected_pages)
+
+        # And back from the last page.
+        pages = [pages[-1]]
+        while paginator.has_previous_page:
+            paginator.paginate(after=paginator.previous_cursor)
+            pages.insert(0, (self.get_ids(paginator), paginator.has_previous_page, paginator.has_next_page))
+
+        self.assertEqual(pages, expected_pages)
+
+    def test_past_the_boundaries(self):
+        paginator = self.make_paginator()
+        summaries = list(FightSummary.objects.order_by('-finished_at', '-fight_id'))
+
+        # Nothing after the last one, or before the first one.
+        with self.assertRaises(Http404):
+            paginator.paginate(before=paginator.get_cursor(summaries[-1]))
+
+        with self.assertRaises(Http404):
+            paginator.paginate(after=paginator.get_cursor(summaries[0]))
+
+        # Right next to the boundaries.
+        paginator.paginate(before=paginator.get_cursor(summaries[-2]))
+        self.assertEqual(self.get_ids(paginator), [summaries[-1].fight_id])
+        self.assertFalse(paginator.has_next_page)
+
+        paginator.paginate(after=paginator.get_cursor(summaries[1]))
+        self.assertEqual(self.get_ids(paginator), [summaries[0].fight_id])
+        self.assertFalse(paginator.has_previous_page)
+
+    def test_bad_cursors(self):
+        paginator = self.make_paginator()
+        cursor = paginator.get_cursor(FightSummary.objects.first())
+
+        tampered = signing.Signer(salt='test').sign_object(['2000-01-01T00:00:00+00:00', 1])[:-1] + 'x'
+        foreign = self.make_paginator(cursor_salt='other').get_cursor(FightSummary.objects.first())
+        wrong_length = signing.Signer(salt='test').sign_object(['2000-01-01T00:00:00+00:00'])
+
+        for bad_cursor in [tampered, foreign, wrong_length, 'garbage']:
+            for direction in ['before', 'after']:
+                with self.subTest(cursor=bad_cursor, direction=direction):
+                    with self.assertRaises(Http404):
+                        paginator.paginate(**{direction: bad_cursor})
+
+        with self.assertRaises(Http404):
+            paginator.paginate(before=cursor, after=cursor)
+
+    def test_player_fights(self):
+        player_ids = list(PlayerFight.objects.filter(
+            player=self.player
+        ).order_by('-fight_id').values_list('fight_id', flat=True))
+
+        paginator = self.make_paginator(
+            FightSummary.objects.of_player(self.player),
+            orders=['-playerfight_fight_id']
+        )
+
+        paginator.paginate()
+        ids = self.get_ids(paginator)
+
+        paginator.paginate(before=paginator.next_cursor)
+        ids += self.get_ids(paginator)
+
+        self.assertEqual(ids, player_ids)
+        self.assertFalse(paginator.has_next_page)
+
+
+class StatsTest(SimpleTestCase):
+    def test_pairwise_score(self):
+        VD, RB = ConclusionSystems.VICTORY_DRAW, ConclusionSystems.RANK_BASED
+
+        # (conclusion system, outcome, other outcome, score)
+        cases = [
+            (VD, 1, 0, 1.0),
+            (VD, 0, 1, 0.0),
+            (VD, 1, 1, 0.5),
+            (VD, 0, 0, 0.5),        # both lost
+            (VD, None, None, 0.5),  # a draw
+            (VD, 1, None, 0.5),
+            (VD, None, 0, 0.5),
+            (RB, 1, 2, 1.0),
+            (RB, 3, 2, 0.0),
+            (RB, 2, 2, 0.5),        # tied
+            (RB, 1, None, 0.5),     # a missing rank
+            (RB, None, 1, 0.5),
+            (RB, None, None, 0.5),
+        ]
+
+        for conclusion_system, outcome, other_outcome, score in cases:
+            with self.subTest(conclusion_system=conclusion_system, outcome=outcome, other_outcome=other_outcome):
+                self.assertEqual(get_pairwise_score(conclusion_system, outcome, other_outcome), score)
+
+    def test_rating_changes(self):
+        VD, RB = ConclusionSystems.VICTORY_DRAW, ConclusionSystems.RANK_BASED
+
+        # (conclusion system, ratings, outcomes, changes)
+        cases = [
+            (VD, [1500, 1500], [1, 0], [16, -16]),
+            (VD, [1500, 1500], [None, None], [0, 0]),
+            (VD, [1500, 1500], [0, 0], [0, 0]),
+            # The favorite gains less by winning than it'd lose by losing.
+            (VD, [1700, 1300], [1, 0], [2.9091, -2.9091]),
+            (VD, [1700, 1300], [0, 1], [-29.0909, 29.0909]),
+            (VD, [1500], [1], [0]),
+            # Each of 3 players against the other 2, with half the K.
+            (RB, [1500, 1500, 1500], [1, 2, 3], [16, 0, -16]),
+            (RB, [1500, 1500, 1500], [1, 1, 3], [8, 8, -16]),
+            (RB, [1500, 1500, 1500], [1, None, 2], [8, 0, -8]),
+            (RB, [1500, 1500, 1500, 1500], [4, 3, 2, 1], [-16, -5.3333, 5.3333, 16]),
+        ]
+
+        for conclusion_system, ratings, outcomes, changes in cases:
+            with self.subTest(conclusion_system=conclusion_system, ratings=ratings, outcomes=outcomes):
+                result = get_rating_changes(conclusion_system, ratings, outcomes)
+
+                self.assertEqual(len(result), len(changes))
+                for change, expected in zip(result, changes):
+                    self.assertAlmostEqual(change, expected, places=4)
+
+                # Nothing is made or lost overall.
+                self.assertAlmostEqual(sum(result), 0)
+
+    def test_apply_fight(self):
+        game = GameInfo(conclusion_system=ConclusionSystems.RANK_BASED, has_scores=True)
+
+        stats = [PlayerGameStats(), PlayerGameStats(), PlayerGameStats()]
+        playerfights = [
+            PlayerFight(won_or_rank=1, score=10, termination_reason=''),
+            PlayerFight(won_or_rank=2, score=None, termination_reason='XC'),
+            PlayerFight(won_or_rank=None, score=4, termination_reason='XC'),
+        ]
+
+        apply_fight_to_stats(stats, game, playerfights)
+        apply_fight_to_stats(stats, game, playerfights)
+
+        self.assertEqual(
+            [(s.fights, s.wins, s.losses, s.draws) for s in stats],
+            [(2, 2, 0, 0), (2, 0, 2, 0), (2, 0, 0, 2)]
+        )
+        self.assertEqual([s.terminations for s in stats], [{}, {'XC': 2}, {'XC': 2}])
+        self.assertEqual([(s.scored_fights, s.score_sum) for s in stats], [(2, 20), (0, 0), (2, 8)])
+        self.assertEqual([s.rated_fights for s in stats], [2, 2, 2])
+
+        self.assertGreater(stats[0].rating, 1500)
+        self.assertLess(stats[1].rating, 1500)
+        self.assertAlmostEqual(sum(s.rating for s in stats), 3 * 1500)
+
+    def test_apply_fight_without_scores_or_opponents(self):
+        game = GameInfo(conclusion_system=ConclusionSystems.VICTORY_DRAW, has_scores=False)
+
+        stats = [PlayerGameStats()]
+        apply_fight_to_stats(stats, game, [PlayerFight(won_or_rank=1, score=3, termination_reason='')])
+
+        self.assertEqual((stats[0].fights, stats[0].wins), (1, 1))
+        self.assertEqual(stats[0].scored_fights, 0)
+
+        # Not rated; there's no one to be rated against.
+        self.assertEqual((stats[0].rating, stats[0].rated_fights), (1500, 0))
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    SIMULATOR_POOLS={'default': {'games': None, 'workers': 1, 'cpus': None}},
+    REDIS_SIMULATOR_LANE_STREAMS={'batch': 'stream_batch', 'probe': 'stream_probe'},
+    REDIS_PROBE_VERDICT_KEY_PREFIX='verdict_',
+    CODE_PROBE_TIMEOUT=60,
+    CODE_PROBE_VERDICT_TIMEOUT=3600,
+)
+class ProbeCodeTest(SimpleTestCase):
+    CODE = (Path(__file__).parent.parent / 'games/tanks/tests/codes/do_nothing.py').read_bytes()
+
+    def setUp(self):
+        cache.clear()
+
+        self.redis = FakeServicesRedis()
+
+        patcher = mock.patch('fights.services.redis_client', self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.game_info = GameInfo(name='tanks', min_players=2)
+
+    def upload(self):
+        return SimpleUploadedFile('code.py', self.CODE)
+
+    def probe(self):
+        return ProbeCodeService(game_info=self.game_info, code=self.upload()).execute()
+
+    def get_form(self):
+        form = AcceptInvitationForm({}, {'code': self.upload()}, game_info=self.game_info)
+        form.is_valid()
+        return form
+
+    def get_sent_probes(self):
+        return [json.loads(fields['data']) for fields in self.redis.streams.get('stream_probe', [])]
+
+    def set_verdict(self, verdict):
+        [probe] = self.get_sent_probes()[-1:]
+        self.redis.set(probe['verdict_key'], json.dumps(verdict), ex=probe['verdict_timeout'])
+
+    def test_sent_once_without_waiting(self):
+        self.assertEqual(self.probe(), ProbeCodeService.SENT)
+
+        # Not again while it's on the way.
+        self.assertEqual(self.probe(), ProbeCodeService.ALREADY_PROBED)
+        self.assertEqual(len(self.get_sent_probes()), 1)
+
+        # Not rejected meanwhile.
+        self.assertNotIn('code', self.get_form().errors)
+
+    def test_timed_out(self):
+        self.probe()
+
+        # The simulators drop it if they don't get to it by then.
+        [probe] = self.get_sent_probes()
+        self.assertAlmostEqual(probe['deadline'], time.time() + 60, delta=5)
+
+        # They never got to it; the code is left without a verdict. It's
+        # let through, and probed again once it's accepted again.
+        self.redis.now += 61
+
+        self.assertNotIn('code', self.get_form().errors)
+
+        self.assertEqual(self.probe(), ProbeCodeService.SENT)
+        self.assertEqual(len(self.get_sent_probes()), 2)
+
+    def test_failed(self):
+        self.probe()
+        self.set_verdict({'ok': False, 'termination_reason': TerminationReasons.XCPUTIME})
+
+        # Rejected when uploaded again, with no other probe.
+        self.assertEqual(self.get_form().errors['code'], ['The code took too long in a test run of its first tick.'])
+        self.assertEqual(self.probe(), ProbeCodeService.ALREADY_PROBED)
+
+    def test_passed(self):
+        self.probe()
+        self.set_verdict({'ok': True})
+
+        self.assertNotIn('code', self.get_form().errors)
+        self.assertEqual(self.probe(), ProbeCodeService.ALREADY_PROBED)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    SIMULATOR_POOLS={'default': {'games': None, 'workers': 1, 'cpus': None}},
+    REDIS_SIMULATOR_STREAM='stream',
+    REDIS_SIMULATOR_LANE_STREAMS={'batch': 'stream_batch', 'probe': 'stream_probe'},
+    MAX_USER_ATTENDED_FIGHTS=3,
+    MAX_USER_IN_FLIGHT_SIMULATIONS=1,
+    MAX_USER_STARTED_SIMULATIONS=2,
+)
+class InFlightLimitsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.game = GameInfo.objects.create(
+            name='tanks',
+            title='Tanks',
+            short_description='',
+            conclusion_system=ConclusionSystems.VICTORY_DRAW,
+            has_scores=False,
+            min_players=2,
+            max_players=2,
+            documentation='',
+            slug='tanks'
+        )
+
+        cls.host, cls.guest, cls.other = [
+            User.objects.create_user(username=username, email=f'{username}@example.com', password='x')
+            for username in ['host', 'guest', 'other']
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+        self.redis = FakeServicesRedis()
+
+        patcher = mock.patch('fights.services.redis_client', self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+
+        settings_override = override_settings(MEDIA_ROOT=tmp.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def create_fight(self, players, *, started):
+        fight = Fight.objects.create(game=self.game, started_at=timezone.now() if started else None)
+
+        PlayerFight.objects.bulk_create([PlayerFight(fight=fight, player=p) for p in players])
+
+        return fight
+
+    def host_fight(self):
+        fight = self.create_fight([self.host], started=False)
+        hosting = Hosting.objects.create(host=self.host, fight=fight)
+
+        return fight, Invitation.objects.create(hosting=hosting, target=self.guest)
+
+    def test_in_flight_limit(self):
+        fight = self.create_fight([self.host, self.guest], started=True)
+
+        SendFightForSimulationService(fight).execute()
+        self.assertEqual(len(self.redis.streams['stream']), 1)
+
+        # The guest has another fight being simulated now.
+        self.create_fight([self.guest, self.other], started=True)
+
+        SendFightForSimulationService(fight).execute()
+        self.assertEqual(len(self.redis.streams['stream_batch']), 1)
+
+    def test_started_limit(self):
+        fight, invitation = self.host_fight()
+        invitation.mark_accepted()
+        PlayerFight.objects.create(fight=fight, player=self.guest)
+
+        ongoing = self.create_fight([self.guest, self.other], started=True)
+        self.create_fight([self.guest, self.other], started=True)
+
+        result = StartHostedFightService(self.host).execute(no_simulation=True)
+        self.assertEqual(result, StartHostedFightService.ERROR_TOO_MANY_IN_FLIGHT)
+
+        # Held back, with nothing changed.
+        fight.refresh_from_db()
+        self.assertIsNone(fight.started_at)
+        self.assertTrue(Hosting.objects.filter(fight=fight).exists())
+
+        # Once one of those is finished.
+        Fight.objects.filter(id=ongoing.id).update(finished_at=timezone.now())
+
+        result = StartHostedFightService(self.host).execute(no_simulation=True)
+        self.assertEqual(result, StartHostedFightService.SUCCESS)
+
+    def test_auto_start_held_back(self):
+        fight, invitation = self.host_fight()
+
+        self.create_fight([self.guest, self.other], started=True)
+        self.create_fight([self.guest, self.other], started=True)
+
+        # Accepting the last invitation starts the fight on its own,
+        # which is held back; the host is told.
+        with self.captureOnCommitCallbacks(execute=True):
+            result = AcceptInvitationService(
+                uuid=invitation.uuid, target=self.guest,
+                code=SimpleUploadedFile('code.py', ProbeCodeTest.CODE)
+            ).execute()
+
+        self.assertEqual(result, AcceptInvitationService.SUCCESS)
+
+        fight.refresh_from_db()
+        self.assertIsNone(fight.started_at)
+        self.assertIn(events.FIGHT_HELD_BACK.format(user_id=self.host.id), self.redis.published)
+
+    def test_one_hosting(self):
+        def create():
+            return CreateFightService(
+                game_info=self.game,
+                host=self.host,
+                host_code=SimpleUploadedFile('code.py', ProbeCodeTest.CODE),
+                invited_players=[self.guest],
+                is_public=True
+            ).execute()
+
+        self.assertEqual(create(), CreateFightService.SUCCESS)
+
+        # The host may still attend others' fights, but not host another.
+        self.assertEqual(create(), CreateFightService.ERROR_ALREADY_HOSTING)
+
+
+    def get_house_bot(self):
+        bot = User.objects.create_user(username='bot', email='bot@example.com', password='x')
+
+        # The codes are content-addressed, so the host's must differ.
+        code_id = store_code(ProbeCodeTest.CODE + b'\n# Bot\n')
+        TrustedCode.objects.create(code_id=code_id)
+
+        return GameCodePreset.objects.create(
+            game_info=self.game, player=bot, game_preset_index=0, title='Bot', code_id=code_id
+        )
+
+    def create_with_house_bot(self, invited_players):
+        preset = self.get_house_bot()
+
+        # Room for an invitation too, so that the fight waits for it.
+        self.game.max_players = 3
+        self.game.save(update_fields=['max_players'])
+
+        result = CreateFightService(
+            game_info=self.game,
+            host=self.host,
+            host_code=SimpleUploadedFile('code.py', ProbeCodeTest.CODE),
+            invited_players=invited_players,
+            is_public=True,
+            house_bots=[preset]
+        ).execute()
+
+        self.assertEqual(result, CreateFightService.SUCCESS)
+
+        return preset.player
+
+    def test_house_bots_not_counted(self):
+        bot = self.create_with_house_bot([self.guest])
+
+        self.assertEqual(OpenFightsCount.objects.get_count(self.host), 1)
+        self.assertEqual(OpenFightsCount.objects.get_count(bot), 0)
+
+        result = CancelHostedFightService(self.host).execute()
+        self.assertEqual(result, CancelHostedFightService.SUCCESS)
+
+        self.assertEqual(OpenFightsCount.objects.get_count(self.host), 0)
+        self.assertEqual(OpenFightsCount.objects.get_count(bot), 0)
+
+    def test_house_bots_only_started(self):
+        bot = self.create_with_house_bot([])
+
+        # Nobody to wait for.
+        fight = Fight.objects.get(playerfight__player=bot)
+        self.assertIsNotNone(fight.started_at)
+        self.assertFalse(Hosting.objects.exists())
+        self.assertEqual(len(self.redis.streams['stream']), 1)
+
+    def test_reconcile_house_bots(self):
+        bot = self.create_with_house_bot([self.guest])
+
+        # As counted before the house bots were left out.
+        OpenFightsCount.objects.add([bot.id], 1)
+
+        ReconcileCommand().reconcile()
+
+        self.assertEqual(OpenFightsCount.objects.get_count(self.host), 1)
+        self.assertEqual(OpenFightsCount.objects.get_count(bot), 0)
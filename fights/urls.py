@@ -9,6 +9,7 @@ from fights.views import (
     StartHostedFightView,
     CancelFightAttendanceView,
     ViewFightView,
+    FightReplayView,
     PlayerFightsView,
     InvitationsListView
 )
@@ -22,6 +23,7 @@ urlpatterns = [
     path('invitations/all/', InvitationsListView.as_view(), name='invitations_list'),
     path('invitations/<str:uuid>/', ViewInvitationView.as_view(), name='view_invitation'),
     path('view/<str:uuid>/', ViewFightView.as_view(), name='view_fight'),
+    path('view/<str:uuid>/replay/', FightReplayView.as_view(), name='fight_replay'),
     
     path('api/search/player/', SearchPlayerToInviteAPIView.as_view()),
     path('api/invitation/<str:uuid>/dismiss/', DismissInvitationView.as_view(), name='api_dismiss_invitation'),
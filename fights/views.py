@@ -1,19 +1,34 @@
+from datetime import datetime
+
 from django.db import models, transaction
-from django.http import Http404, HttpRequest, HttpResponseBadRequest
+from django.http import Http404, HttpRequest, HttpResponseBadRequest, FileResponse
 from django.http.response import HttpResponse as HttpResponse
 from django.shortcuts import redirect, render
 from django.views.generic import TemplateView, View
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.safestring import mark_safe
+from django.core import signing
 
-from fights.models import Fight, PlayerFight, Invitation, Hosting, TerminationReasons
+from fights.models import Fight, PlayerFight, FightSummary, Invitation, Hosting, TerminationReasons
 from accounts.models import User
-from gamespecs.models import GameInfo
+from gamespecs.models import GameInfo, GameCodePreset
+from gamespecs.replays import (
+    get_replay_relative_path,
+    get_replay_content_type,
+    choose_replay_encoding,
+    is_game_result_flow_outdated,
+    migrate_game_result_flow,
+    ensure_replay_artifact
+)
 
-from common.forms import BeforeAfterUUIDForm
+from common.forms import BeforeAfterCursorForm
 from fights.forms import (
     CreateFightForm,
     AcceptInvitationForm,
-    ConfirmationForm
+    ConfirmationForm,
+    get_probe_failure_message
 )
 
 from fights.services import (
@@ -23,39 +38,106 @@ from fights.services import (
     StartHostedFightService,
     DismissInvitationService,
     CancelHostedFightService,
-    CancelAcceptedInvitationService
+    CancelAcceptedInvitationService,
+    EstimateSimulationWaitService,
+    ProbeCodeService,
+    get_probe_verdicts,
+    is_any_player_over_in_flight_limit
 )
 
-from games.frontend import EXPLANATION_INDEX
+from fights.cache import (
+    FIGHT_PAGE_CACHE_VERSION,
+    get_fight_page_shared
+)
+from fights.perf import decode_perf_report
 
 # cache
 ConclusionSystems = GameInfo.ConclusionSystems
 
 
 class BeforeAfterPaginator:
-    def __init__(self, *, items_queryset, selection_queryset=None, selection_field, orders, comparison_fields=None, items_per_page):
-        if selection_queryset is None:
-            selection_queryset = items_queryset
-        
-        # Each item in the comparison_fields must be an iterable
-        # of length 2, where the first item shows the field name
-        # and the second one indicates if we should include results
-        # when the value is equal too (i.e., use __gt/__lt or __gte/__lte).
-        if comparison_fields is None:
-            comparison_fields = []
-            for order in orders:
-                if order.startswith('-') or order.startswith('+'):
-                    comparison_fields.append((order[1:], False))
-                else:
-                    comparison_fields.append((order, False))
-        
-        self.comparison_fields = comparison_fields
-        
+    """Keyset pagination, with opaque cursors for the next and the previous pages.
+
+    The items are ordered by the given orders, the last of which must
+    be unique among the items (e.g., the id), to break the ties. Each
+    cursor holds the full sort key of the item at the edge of a page,
+    signed so that it can't be forged, so a page is a single range
+    query with no lookup of the anchor item.
+    
+    Parameters
+    ----------
+    items_queryset : QuerySet
+        The items to paginate. The fields in the orders must be loaded.
+    
+    orders : list[str]
+        The fields to order the items by, as would be given to order_by().
+    
+    cursor_salt : str
+        Distinguishes the cursors of each list, so that they can't be
+        used for one another.
+    
+    items_per_page : int
+    """
+    
+    def __init__(self, *, items_queryset, orders, cursor_salt, items_per_page):
         self.items_queryset = items_queryset
-        self.selection_queryset = selection_queryset
-        self.selection_field = selection_field
         self.orders = orders
+        self.cursor_salt = cursor_salt
         self.items_per_page = items_per_page
+        
+        # (field name, descending)
+        self.order_fields = [
+            (order[1:], True) if order.startswith('-') else (order.lstrip('+'), False)
+            for order in orders
+        ]
+    
+    def get_cursor(self, item):
+        values = []
+        for field_name, _ in self.order_fields:
+            value = item  # to be traversed
+            for attr in field_name.split('__'):
+                value = getattr(value, attr)
+            
+            # Kept in full precision; the lookups parse it back.
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            
+            values.append(value)
+        
+        return signing.Signer(salt=self.cursor_salt).sign_object(values)
+    
+    def get_cursor_values(self, cursor):
+        try:
+            values = signing.Signer(salt=self.cursor_salt).unsign_object(cursor)
+        except signing.BadSignature:
+            raise Http404
+        
+        if not isinstance(values, list) or len(values) != len(self.order_fields):
+            raise Http404
+        
+        return values
+    
+    def get_keyset_filter(self, cursor, *, forward):
+        """Get the filter of the items that come after (if forward) or before the cursor in the ordering."""
+        values = self.get_cursor_values(cursor)
+        
+        # (a, b, c) > (x, y, z) in the ordering is:
+        #   a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+        # where each '>' is '<' for the descending fields.
+        condition = models.Q()
+        equal_so_far = {}
+        for (field_name, descending), value in zip(self.order_fields, values):
+            lookup = 'lt' if descending == forward else 'gt'
+            
+            condition |= models.Q(**equal_so_far, **{f'{field_name}__{lookup}': value})
+            equal_so_far[field_name] = value
+        
+        # Redundant, but it lets the database range-scan the index on
+        # the leading field rather than evaluating the whole OR.
+        field_name, descending = self.order_fields[0]
+        lookup = 'lte' if descending == forward else 'gte'
+        
+        return condition & models.Q(**{f'{field_name}__{lookup}': values[0]})
     
     def paginate(self, *, after=None, before=None):
         if before and after:
@@ -72,80 +154,45 @@ class BeforeAfterPaginator:
             items = items.order_by(*self.orders)
         
         if before:
-            selected_item = self.selection_queryset.filter(
-                **{self.selection_field: before}
-            ).first()
+            items = list(items.filter(
+                self.get_keyset_filter(before, forward=True)
+            )[:self.items_per_page+1])
             
-            if not selected_item:
+            if not items:
                 raise Http404
             
-            filter_dict = {}
-            for field_name, count_equal in self.comparison_fields:
-                comparison_value = selected_item  # to be traversed
-                for attr in field_name.split('__'):
-                    comparison_value = getattr(comparison_value, attr)
-                
-                filter_dict[field_name + ('__lte' if count_equal else '__lt')] = comparison_value
-            
-            # TODO: Check if this is enough; In the case where we
-            # use a timestamp, maybe there is an overlap because, 
-            # for example, a fight finished at the same time as the
-            # fight we compare to its finished_at. If this wasn't
-            # enough, *maybe* compare the id's too.
-            items = items.filter(**filter_dict)
-
-            items = list(items[:self.items_per_page+1])
-            
             if len(items) == self.items_per_page+1:
                 items = items[:-1]
-                self.page_last_item = items[-1]
                 self.has_next_page = True
             
-            self.page_first_item = items[0]
             self.has_previous_page = True
         elif after:
-            selected_item = self.selection_queryset.filter(
-                **{self.selection_field: after}
-            ).first()
-            
-            if not selected_item:
-                raise Http404
-            
-            filter_dict = {}
-            for field_name, count_equal in self.comparison_fields:
-                comparison_value = selected_item  # to be traversed
-                for attr in field_name.split('__'):
-                    comparison_value = getattr(comparison_value, attr)
-                
-                filter_dict[field_name + ('__gte' if count_equal else '__gt')] = comparison_value
-            
-            
-            # TODO: Check if this is enough; In the case where we
-            # use a timestamp, maybe there is an overlap because, 
-            # for example, a fight finished at the same time as the
-            # fight we compare to its finished_at. If this wasn't
-            # enough, *maybe* compare the id's too.
-            items = items.filter(**filter_dict)
-            
             # We want the reversal to happen in Python, not the DB, so we
             # evaluate it by list(...) first.
-            items = list(reversed(list(items[:self.items_per_page+1])))
+            items = list(reversed(list(items.filter(
+                self.get_keyset_filter(after, forward=False)
+            )[:self.items_per_page+1])))
+            
+            if not items:
+                raise Http404
             
             if len(items) == self.items_per_page+1:
                 items = items[1:]
-                self.page_first_item = items[0]
                 self.has_previous_page = True
-                    
-            self.page_last_item = items[-1]
+            
             self.has_next_page = True
         else:
             items = list(items[:self.items_per_page+1])
             
             if len(items) == self.items_per_page+1:
                 items = items[:-1]
-                self.page_last_item = items[-1]
                 self.has_next_page = True
         
+        if self.has_next_page:
+            self.next_cursor = self.get_cursor(items[-1])
+        if self.has_previous_page:
+            self.previous_cursor = self.get_cursor(items[0])
+        
         self.items = items
 
 
@@ -154,28 +201,17 @@ class PublicFightsView(TemplateView):
     items_per_page = 10
     
     def get_context_data(self, **kwargs):
-        ba_form = BeforeAfterUUIDForm(self.request.GET)
+        ba_form = BeforeAfterCursorForm(self.request.GET)
         
         if not ba_form.is_valid():
             raise Http404
         
         context = super().get_context_data(**kwargs)
         
-        fights_list = Fight.public.finished().select_related('game').only(
-            'finished_at',
-            'game__title',
-            'game__conclusion_system'
-        ).prefetch_playerfights_with_players(
-            playerfight_fields=['won_or_rank'],
-            user_fields=['username'],
-            order_by='won_or_rank'  # only useful for rank-based games
-        )
-        
         paginator = BeforeAfterPaginator(
-            items_queryset=fights_list,
-            selection_queryset=Fight.public.finished().only('finished_at', 'uuid'),
-            selection_field='uuid',
-            orders=['-finished_at'],
+            items_queryset=FightSummary.public.all(),
+            orders=['-finished_at', '-fight_id'],
+            cursor_salt='public_fights',
             items_per_page=self.items_per_page
         )
         
@@ -184,32 +220,6 @@ class PublicFightsView(TemplateView):
             after=ba_form.cleaned_data['after']
         )
         
-        
-        # TODO: Separating winners from losers or sorting by ranks
-        # should be done in JS rather than templates or views.
-        for fight in paginator.items:
-            # playerfights = PlayerFight.objects.filter(
-            #     fight_id=fight.id
-            # ).select_related('player').only('won_or_rank', 'player__username')
-            
-            match fight.game.conclusion_system:
-                case ConclusionSystems.VICTORY_DRAW:
-                    winners = []
-                    losers = []
-                    
-                    for playerfight in fight.playerfight_set.all():
-                        if playerfight.won_or_rank:
-                            winners.append(playerfight.player.username)
-                        else:
-                            losers.append(playerfight.player.username)
-                    
-                    fight.winners = winners
-                    fight.losers = losers
-                
-                case ConclusionSystems.RANK_BASED:
-                    pass
-
-        
         context.update({
             'paginator': paginator,
             
@@ -226,17 +236,21 @@ class CreateFightView(LoginRequiredMixin, View):
         game_info = self.get_game_info_or_404()
         
         context = self.get_base_context(request)
-        context.update(game_info=game_info)
+        context.update(
+            game_info=game_info,
+            house_bots=GameCodePreset.objects.house_bots(game_info)
+        )
         
         return render(request, self.template_name, context)
 
     def post(self, request, *args, **kwargs):
         game_info = self.get_game_info_or_404()
         
-        form = CreateFightForm(request.POST, request.FILES)
+        form = CreateFightForm(request.POST, request.FILES, game_info=game_info)
         
         context = {
             'game_info': game_info,
+            'house_bots': form.fields['house_bots'].queryset,
             'form': form
         }
         
@@ -258,17 +272,23 @@ class CreateFightView(LoginRequiredMixin, View):
             invited_players=User.active.from_username_list(
                 form.cleaned_data['usernames_list']
             ),
-            is_public=form.cleaned_data['is_public']
+            is_public=form.cleaned_data['is_public'],
+            house_bots=list(form.cleaned_data['house_bots'])
         ).execute()
         
         match result:
             case CreateFightService.SUCCESS:
-                pass
+                # Only now that the code is accepted; see ProbeCodeService.
+                ProbeCodeService(game_info=game_info, code=form.cleaned_data['code']).execute()
             
             case CreateFightService.ERROR_ATTENDED_FIGHTS_FULL:
                 context['attended_fights_full'] = True
                 return render(request, self.template_name, context)
             
+            case CreateFightService.ERROR_ALREADY_HOSTING:
+                context['already_hosting'] = True
+                return render(request, self.template_name, context)
+            
             case CreateFightService.ERROR_BAD_REQUEST:
                 return HttpResponseBadRequest()
         
@@ -294,7 +314,9 @@ class CreateFightView(LoginRequiredMixin, View):
         
         return {
             'attended_fights_full':
-                CheckUserAttendedFightsFullService(request.user).execute()
+                CheckUserAttendedFightsFullService(request.user).execute(),
+            'already_hosting':
+                Hosting.objects.of_host(request.user).exists()
         }
 
 
@@ -306,7 +328,23 @@ class ViewInvitationView(LoginRequiredMixin, View):
         return render(request, self.template_name, context)
 
     def post(self, request, *args, **kwargs):
-        form = AcceptInvitationForm(request.POST, request.FILES)
+        # Only for validating the code against the game. The invitation
+        # is queried again (and locked) by AcceptInvitationService.
+        invitation = Invitation.objects.select_related(
+            'hosting__fight__game'
+        ).only(
+            'hosting__fight__game__name',
+            'hosting__fight__game__min_players'
+        ).from_uuid_and_target(
+            uuid=self.kwargs['uuid'],
+            target=request.user
+        )
+        
+        if not invitation:
+            raise Http404
+        
+        form = AcceptInvitationForm(request.POST, request.FILES,
+                                    game_info=invitation.hosting.fight.game)
         
         context = {'form': form}
         
@@ -323,7 +361,9 @@ class ViewInvitationView(LoginRequiredMixin, View):
         
         match result:
             case AcceptInvitationService.SUCCESS:
-                pass
+                # See CreateFightView.
+                ProbeCodeService(game_info=invitation.hosting.fight.game,
+                                 code=form.cleaned_data['code']).execute()
             
             case AcceptInvitationService.ERROR_NO_SUCH_INVITATION:
                 raise Http404
@@ -420,6 +460,13 @@ class StartHostedFightView(LoginRequiredMixin, View):
             
             case StartHostedFightService.ERROR_BAD_REQUEST:
                 return HttpResponseBadRequest()
+            
+            case StartHostedFightService.ERROR_TOO_MANY_IN_FLIGHT:
+                return HttpResponse(
+                    'Some of the players have too many fights being simulated; '
+                    'try again once those are finished.',
+                    status=429
+                )
         
         return redirect('dashboard')
 
@@ -478,93 +525,171 @@ class CancelFightAttendanceView(LoginRequiredMixin, View):
 class ViewFightView(TemplateView):
     template_name = 'view_fight.html'
     
-    def get_context_data(self, *args, **kwargs):
-        if self.request.user.is_authenticated:
-            condition = models.Q(players__in=[self.request.user]) | models.Q(is_public=True)
+    def get(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            condition = models.Q(players__in=[request.user]) | models.Q(is_public=True)
         else:
             condition = models.Q(is_public=True)
         
-        fight = Fight.objects.filter(            
+        # Only what is needed for access control and for the parts that
+        # are not cached; the rest is taken from the cache.
+        fight = Fight.objects.filter(
             condition,
-        ).prefetch_playerfights_with_players(
-            playerfight_fields=[
-                'won_or_rank',
-                'score',
-                
-                # Currently only used for the current player,
-                # if they have participated in this fight.
-                'termination_reason',
-                'code_file'
-            ],
-            user_fields=['username'],
-            
-            # We need the playerfights sorted by id so that we
-            # can tell which index belongs to which player.
-            order_by='id'
-        ).select_related(
-            'result',
-            'game',
-        ).only(
+        ).finished().only(
+            'id',
             'uuid',
             'is_public',
-            'game_settings',
-            
-            'result__explanation',
-            'result__data',
-            
-            'game__slug',
-            'game__name',  # to access the explanation index
-            'game__title',
-            'game__conclusion_system',
+            'finished_at',
         ).from_uuid(
             self.kwargs['uuid']
         )
         
-        
         if not fight:
             raise Http404
         
-
+        self.fight = fight
+        
+        # A finished public fight looks the same to every anonymous
+        # viewer, so the browsers (and nginx) may keep it and only
+        # revalidate it by its ETag. For logged-in viewers, the page
+        # also contains the user-specific parts, so it's only private.
+        etag = f'"{fight.uuid.hex}-{FIGHT_PAGE_CACHE_VERSION}"'
+        
+        if fight.is_public and not request.user.is_authenticated:
+            response = get_conditional_response(request, etag=etag)
+            
+            if response is None:
+                response = super().get(request, *args, **kwargs)
+            
+            response['ETag'] = etag
+            patch_cache_control(response, public=True,
+                                max_age=settings.FINISHED_FIGHT_PAGE_MAX_AGE)
+        else:
+            response = super().get(request, *args, **kwargs)
+            patch_cache_control(response, private=True)
+        
+        return response
+    
+    def get_context_data(self, *args, **kwargs):
+        fight = self.fight
+        
+        shared = get_fight_page_shared(fight.id)
+        
         context = {
             'fight': fight,
-            'ConclusionSystems': ConclusionSystems,
+            'shared': {
+                **shared,
+                'canvas': mark_safe(shared['canvas']),
+                'players': mark_safe(shared['players']),
+            },
         }
         
         if self.request.user.is_authenticated:
-            for playerfight in fight.playerfight_set.all():
-                if self.request.user.id == playerfight.player.id:
-                    context.update({
-                        'my_playerfight': playerfight
-                    })
-        
-                    # Other reasons are specialized and the user shall not
-                    # see them. Plus, in some cases if the player code has
-                    # problems, the coderunner would command to exit, which
-                    # would cause an IllegalSyscall error (and they are not
-                    # allowed to exit on their own); so we don't show the
-                    # IllegalSyscall cases either.
-                    #
-                    # TODO: Check certain code problems upon uploading the code
-                    # to make sure it's alright, before even it's sent to the
-                    # simulator. This can be done using Python's 'ast' module,
-                    # with which we can dissect and assess the abstract syntax
-                    # tree of the code. This makes is so that, for example, when
-                    # the code doesn't have the 'Main' class, it wouldn't result
-                    # in an IllegalSyscall error (as explained above).
-                    if playerfight.termination_reason in [TerminationReasons.XCPUTIME, 
-                                                          TerminationReasons.ENOMEM]:
-                        context['show_termination_reason'] = True
-                        
-                    break
-        
-        if fight.result.explanation:
-            context['explanation'] = EXPLANATION_INDEX[fight.game.name].get_explanation_text(
-                fight.result.explanation
-            )
+            my_playerfight = PlayerFight.objects.filter(
+                fight_id=fight.id,
+                player=self.request.user
+            ).select_related(
+                'code'
+            ).only(
+                'termination_reason',
+                'perf_report',
+                'code__file'
+            ).first()
+            
+            if my_playerfight:
+                context['my_playerfight'] = my_playerfight
+                
+                # Drawn as a timeline by view_fight.js.
+                if my_playerfight.perf_report:
+                    context['my_perf_report'] = decode_perf_report(
+                        bytes(my_playerfight.perf_report)
+                    )
+                
+                # Other reasons are specialized and the user shall not
+                # see them. Plus, in some cases if the player code has
+                # problems, the coderunner would command to exit, which
+                # would cause an IllegalSyscall error (and they are not
+                # allowed to exit on their own); so we don't show the
+                # IllegalSyscall cases either.
+                #
+                # The most common such problems (e.g., no 'Main' class) are
+                # caught upon uploading the code; see PlayerCodeForm.
+                if my_playerfight.termination_reason in [TerminationReasons.XCPUTIME, 
+                                                         TerminationReasons.ENOMEM]:
+                    context['show_termination_reason'] = True
         
         return context
 
 
+class FightReplayView(View):
+    """Serve the replay of a finished fight.
+    
+    Django only checks the access here; the replay bytes are served by
+    nginx from the precompressed artifacts through X-Accel-Redirect.
+    """
+    
+    def get(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            condition = models.Q(players__in=[request.user]) | models.Q(is_public=True)
+        else:
+            condition = models.Q(is_public=True)
+        
+        fight = Fight.objects.filter(
+            condition,
+        ).finished().select_related(
+            'result',
+            'game'
+        ).only(
+            'id',
+            'is_public',
+            'game__name',
+            'result__flow_format',
+            'result__replay_hash'
+        ).from_uuid(
+            self.kwargs['uuid']
+        )
+        
+        if not fight:
+            raise Http404
+        
+        result = fight.result
+        
+        if is_game_result_flow_outdated(fight.game.name, result.flow_format, result.replay_hash):
+            result = migrate_game_result_flow(result.id, fight.game.name, settings.REPLAYS_ROOT)
+        else:
+            ensure_replay_artifact(result.id, result.replay_hash, settings.REPLAYS_ROOT)
+        
+        content_type = get_replay_content_type(result.flow_format)
+        
+        encoding = choose_replay_encoding(
+            request.headers.get('Accept-Encoding', '')
+        )
+        
+        path = get_replay_relative_path(result.replay_hash, encoding)
+        
+        if settings.REPLAYS_ACCEL_REDIRECT_URL:
+            # The nginx location for each encoding sets its own
+            # Content-Encoding header (see nginx.conf.template).
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] =  \
+                f'{settings.REPLAYS_ACCEL_REDIRECT_URL}{encoding or "identity"}/{path}'
+        else:
+            response = FileResponse(open(settings.REPLAYS_ROOT / path, 'rb'),
+                                    content_type=content_type)
+            if encoding:
+                response['Content-Encoding'] = encoding
+        
+        patch_vary_headers(response, ['Accept-Encoding'])
+        
+        # A finished fight's replay never changes.
+        if fight.is_public:
+            patch_cache_control(response, public=True, max_age=settings.REPLAY_MAX_AGE)
+        else:
+            patch_cache_control(response, private=True, max_age=settings.REPLAY_MAX_AGE)
+        
+        return response
+
+
 class DashboardView(LoginRequiredMixin, TemplateView):
     template_name = 'dashboard.html'
     
@@ -590,9 +715,26 @@ class DashboardView(LoginRequiredMixin, TemplateView):
             'fight__created_at',
             
             'fight__game__slug',
-            'fight__game__title'
+            'fight__game__title',
+            'fight__game__min_players'
+        ).annotate(
+            # The host, the accepted invitations and the house bots.
+            players_count=models.Count('fight__playerfight')
         ).order_by('-fight__created_at')
         
+        for hosting in hostings:
+            hosting.can_start = hosting.players_count >= hosting.fight.game.min_players
+            
+            # The fights that couldn't be started once all their invitations
+            # were accepted, as some players had too many fights being
+            # simulated; see PerformHostingAutoActionService.start_fight().
+            hosting.is_held_back = (
+                not hosting.pending_invitations
+                and is_any_player_over_in_flight_limit(
+                    hosting.fight, settings.MAX_USER_STARTED_SIMULATIONS - 1
+                )
+            )
+        
         
         ongoing_fights = Fight.objects.ongoing().has_player(
             self.request.user
@@ -608,6 +750,9 @@ class DashboardView(LoginRequiredMixin, TemplateView):
             'game__title'
         ).order_by('-started_at')
         
+        for fight in ongoing_fights:
+            fight.queue_estimate = EstimateSimulationWaitService(fight).execute()
+        
         
         invitations = Invitation.objects.of_target(
             self.request.user
@@ -630,30 +775,38 @@ class DashboardView(LoginRequiredMixin, TemplateView):
         ).order_by('-is_accepted', '-hosting__fight__created_at')
                 
         
-        past_playerfights = PlayerFight.objects.of_finished_fight().of_player(
+        # The player's codes that failed their probes (which are done
+        # after they're accepted; see ProbeCodeService), in the fights
+        # that haven't started yet, so that they can be replaced.
+        waiting_codes = list(PlayerFight.objects.of_player(
             self.request.user
-        ).prefetch_playerfights_with_players_of_fight(
-            playerfight_fields=['won_or_rank'],
-            user_fields=['username']
-        ).select_related(
-            'fight', 'fight__game'
-        ).only(
-            'won_or_rank',
-            
-            'fight__finished_at',
-            'fight__uuid',
-            
-            'fight__game__slug',
-            'fight__game__title',
-            'fight__game__conclusion_system'
-        ).order_by('-fight__finished_at')[:5]
+        ).of_not_started_fight().values_list(
+            'fight__game__name',
+            'code_id',
+            'fight__game__title'
+        ))
+        
+        failed_probes = [
+            (game_title, get_probe_failure_message(verdict['termination_reason']))
+            for (_, _, game_title), verdict in zip(
+                waiting_codes,
+                get_probe_verdicts([(name, code_id) for name, code_id, _ in waiting_codes])
+            )
+            if verdict is not None and not verdict['ok']
+        ]
+        
+        
+        past_fights = FightSummary.objects.of_player(
+            self.request.user
+        ).order_by('-playerfight_fight_id')[:5]
         
         
         context.update({
             'hostings': hostings,
             'ongoing_fights': ongoing_fights,
             'invitations': invitations,
-            'past_playerfights': past_playerfights,
+            'past_fights': past_fights,
+            'failed_probes': failed_probes,
             
             'can_attend_fights': 
                 CheckUserAttendedFightsFullService(self.request.user).execute(),
@@ -669,43 +822,19 @@ class PlayerFightsView(LoginRequiredMixin, TemplateView):
     items_per_page = 10
         
     def get_context_data(self, **kwargs):
-        ba_form = BeforeAfterUUIDForm(self.request.GET)
+        ba_form = BeforeAfterCursorForm(self.request.GET)
         
         if not ba_form.is_valid():
             raise Http404
 
         context = super().get_context_data(**kwargs)
         
-        past_playerfights = PlayerFight.objects.of_finished_fight().of_player(
-            self.request.user
-        ).prefetch_playerfights_with_players_of_fight(
-            playerfight_fields=['won_or_rank'],
-            user_fields=['username']
-        ).select_related(
-            'fight', 'fight__game'
-        ).only(
-            'won_or_rank',
-            
-            'fight__finished_at',
-            'fight__uuid',
-            
-            'fight__game__slug',
-            'fight__game__title',
-            'fight__game__conclusion_system',
-        )
-        
         paginator = BeforeAfterPaginator(
-            items_queryset=past_playerfights,
-            selection_queryset=PlayerFight.objects.of_finished_fight().of_player(
-                self.request.user
-            ).select_related('fight').only(
-                # These fields will be used for comparison and selection
-                # in the paginator.
-                'fight__finished_at',
-                'fight__uuid'
-            ),
-            selection_field='fight__uuid',
-            orders=['-fight__finished_at'],
+            items_queryset=FightSummary.objects.of_player(self.request.user),
+            # By when the fights were created, rather than finished; see
+            # FightSummaryQuerySet.of_player().
+            orders=['-playerfight_fight_id'],
+            cursor_salt='player_fights',
             items_per_page=self.items_per_page
         )
 
@@ -730,7 +859,7 @@ class InvitationsListView(TemplateView):
     items_per_page = 10
         
     def get_context_data(self, **kwargs):
-        ba_form = BeforeAfterUUIDForm(self.request.GET)
+        ba_form = BeforeAfterCursorForm(self.request.GET)
         
         if not ba_form.is_valid():
             raise Http404
@@ -757,20 +886,13 @@ class InvitationsListView(TemplateView):
             'hosting__fight__game__title',
         )
         
+        # The invitations are created along with their fights, so the
+        # id orders them by the creation of the fights, and unlike the
+        # creation time of the fight, it's in the index of the target.
         paginator = BeforeAfterPaginator(
             items_queryset=invitations,
-            selection_queryset=Invitation.objects.of_target(
-                self.request.user
-            ).select_related('hosting__fight').only(
-                'uuid',  # for before/after selection
-                'hosting__fight__created_at'  # for before/after comparison
-            ),
-            selection_field='uuid',
-            orders=['-is_accepted', '-hosting__fight__created_at'],
-            comparison_fields=[
-                ('is_accepted', True),
-                ('hosting__fight__created_at', False)
-            ],
+            orders=['-is_accepted', '-id'],
+            cursor_salt='invitations',
             items_per_page=self.items_per_page
         )
 
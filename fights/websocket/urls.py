@@ -1,6 +1,8 @@
 from django.urls import path
-from fights.websocket.views import TestView
+from fights.websocket.views import TestView, DashboardWSView, FightFinishedWSView
 
 urlpatterns = [
-    path('api1/', TestView)
-]
\ No newline at end of file
+    path('api1/', TestView),
+    path('dashboard/', DashboardWSView),
+    path('finished/<uuid:fight_uuid>/', FightFinishedWSView),
+]
@@ -1,7 +1,14 @@
 from typing import Any, Coroutine
+from django.db import models
 from django_project.websocket.views import WSView
 from django_project.websocket.decorators import ws_login_required
 
+from fights.models import Fight
+from fights import events
+from fights.events import SignalNames
+
+import json
+
 # async def fffff(user ,data):
 #     print('LLLLLLLLLLLLLLLLLLLLL', user ,data)
 #     return 'OOOOOOOOOOOOOOOOOOOOOOOOOOOOOoo you\'re %s' % user
@@ -48,3 +55,67 @@ class TestView(WSView):
     async def process_message(self, message):
         if message == 'shoot':
             return 'shoot back u little shoop'
+
+
+
+class DashboardWSView(WSView):
+    """Notify the dashboard of a player about the changes that concern them.
+    
+    The client is expected to refresh the relevant parts of the dashboard
+    upon each signal, rather than the player reloading the whole page to
+    check for changes.
+    """
+    
+    def get_signals_context(self):
+        return {**super().get_signals_context(), 'user_id': self.user.id}
+    
+    async def render_fight_finished(self, message):
+        return json.dumps({'signal': SignalNames.FIGHT_FINISHED, 'fight': message})
+    
+    async def render_invitation_received(self, message):
+        return json.dumps({'signal': SignalNames.INVITATION_RECEIVED})
+    
+    async def render_invitation_accepted(self, message):
+        return json.dumps({'signal': SignalNames.INVITATION_ACCEPTED})
+    
+    async def render_fight_held_back(self, message):
+        return json.dumps({'signal': SignalNames.FIGHT_HELD_BACK})
+    
+    realtime_signals = {
+        events.PLAYER_FIGHT_FINISHED: render_fight_finished,
+        events.INVITATION_RECEIVED:   render_invitation_received,
+        events.INVITATION_ACCEPTED:   render_invitation_accepted,
+        events.FIGHT_HELD_BACK:       render_fight_held_back,
+    }
+    
+    @ws_login_required
+    async def user_has_permission(self):
+        return True
+
+
+class FightFinishedWSView(WSView):
+    """Notify the client once the given fight is finished."""
+    
+    async def check_fight_finished(self):
+        # A single lookup on the indexed uuid.
+        return await Fight.objects.filter(
+            uuid=self.kwargs['fight_uuid']
+        ).finished().aexists()
+    
+    async def render_fight_finished(self, message=None):
+        return json.dumps({'signal': SignalNames.FIGHT_FINISHED,
+                           'fight': self.kwargs['fight_uuid'].hex})
+    
+    oneoff_signals = {
+        events.FIGHT_FINISHED: (check_fight_finished, render_fight_finished)
+    }
+    
+    async def user_has_permission(self):
+        if self.user.is_authenticated:
+            condition = models.Q(players__in=[self.user]) | models.Q(is_public=True)
+        else:
+            condition = models.Q(is_public=True)
+        
+        return await Fight.objects.filter(
+            condition, uuid=self.kwargs['fight_uuid']
+        ).aexists()
@@ -0,0 +1,75 @@
+# The delta commands: for the functions that the games call on every
+# tick with the same kind of args (e.g., the states of the players),
+# only the first call sends the args as a whole; each of the later
+# calls only sends the fields that changed since the previous call of
+# the same function. The coderunner applies the changes to a master
+# copy of the args that it keeps to itself, and then brings the args
+# that it gives the player up to date with it, in place; so the player
+# gets the very same objects (e.g., the same state dicts) on every call,
+# updated, and whatever the player changed in them on the previous call
+# is undone (as the master copy is never seen by the player).
+#
+# The schema of the args must be stable: the same number of args, and
+# the same keys for the dict args. The changes are listed as
+# [arg index, key, new value]; the key is None (null) if the whole arg
+# is replaced, e.g., for the args that aren't dicts, or the dicts whose
+# keys have changed.
+#
+# apply_args_delta() and refresh_given_args() must be kept in sync with
+# the command loop of the children in simulator/coderunner/run.py.
+
+import json
+
+def get_args_delta(previous, current):
+    """Get the changes of the args of a function since its previous call.
+
+    Both must be as they're taken through JSON, i.e., lists rather
+    than tuples, so that the unchanged values compare equal.
+    """
+    delta = []
+    for index, (old, new) in enumerate(zip(previous, current)):
+        if old == new:
+            continue
+
+        if isinstance(old, dict) and isinstance(new, dict) and old.keys() == new.keys():
+            for key, value in new.items():
+                if old[key] != value:
+                    delta.append([index, key, value])
+        else:
+            delta.append([index, None, new])
+
+    return delta
+
+
+def apply_args_delta(args, delta):
+    for index, key, value in delta:
+        if key is None:
+            args[index] = value
+        else:
+            args[index][key] = value
+
+
+def clone_value(value):
+    if type(value) in (dict, list):
+        return json.loads(json.dumps(value))
+    return value
+
+
+def refresh_given_args(given, kept):
+    """Bring the args given to the player up to date with the master copy, in place.
+
+    Only the values that differ are copied, so this mostly costs the
+    comparisons; the dicts are kept as the same objects unless the
+    player has changed their keys.
+    """
+    for index, arg in enumerate(kept):
+        old = given[index]
+        if old == arg:
+            continue
+
+        if type(old) is dict and type(arg) is dict and old.keys() == arg.keys():
+            for key, value in arg.items():
+                if old[key] != value:
+                    old[key] = clone_value(value)
+        else:
+            given[index] = clone_value(arg)
@@ -0,0 +1,142 @@
+import struct
+from itertools import accumulate, chain
+
+
+# Every encoded flow starts with this header: the magic bytes and the
+# format version of the game's codec. The rest is up to each codec.
+FLOW_MAGIC = b'CF'
+FLOW_HEADER = struct.Struct('<2sB')
+
+
+class FlowFormatError(ValueError):
+    pass
+
+
+# A parent for the flow codecs of the games. The flow (the "data" in
+# the game report; see games._base.game.Game.get_report()) is dumped
+# as JSON by the simulator. Since it's mostly the same few values over
+# and over for each tick, the games can define a compact binary format
+# for it to be stored and served as, which is what the codecs are for.
+# A game's JS frontend must implement the decoder of the same format.
+#
+# The format version must be bumped whenever the format changes, and the
+# decoders (in Python and JS) must keep accepting the older versions, as
+# the encoded flows are never re-encoded.
+class FlowCodec:
+    FORMAT_VERSION = None
+
+    @classmethod
+    def encode(cls, flow):
+        raise NotImplementedError
+
+    @classmethod
+    def decode(cls, data):
+        raise NotImplementedError
+
+    @classmethod
+    def pack_header(cls):
+        return FLOW_HEADER.pack(FLOW_MAGIC, cls.FORMAT_VERSION)
+
+    @staticmethod
+    def unpack_header(data):
+        """Get the format version of an encoded flow, and the offset at which its body begins."""
+        if len(data) < FLOW_HEADER.size:
+            raise FlowFormatError('truncated header')
+
+        magic, version = FLOW_HEADER.unpack_from(data)
+        if magic != FLOW_MAGIC:
+            raise FlowFormatError('not an encoded flow')
+
+        return version, FLOW_HEADER.size
+
+
+# The helpers below are for the codecs to build their columns from.
+# Integers are written as zigzag-encoded LEB128 varints, so that small
+# values (such as the deltas between ticks) take a single byte, whatever
+# their sign.
+
+def write_varint(buffer, n):
+    n = (n << 1) if n >= 0 else ((-n << 1) - 1)  # zigzag
+    while n > 0x7f:
+        buffer.append((n & 0x7f) | 0x80)
+        n >>= 7
+    buffer.append(n)
+
+
+def read_varint(data, offset):
+    """Read a varint at the offset; return the value and the offset after it."""
+    n = shift = 0
+    while True:
+        try:
+            byte = data[offset]
+        except IndexError:
+            raise FlowFormatError('truncated varint') from None
+
+        offset += 1
+        n |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            break
+        shift += 7
+
+    return ((n >> 1) if not n & 1 else -((n + 1) >> 1)), offset
+
+
+def read_varints(data, offset, count):
+    """Read the given number of varints at the offset; return the values and the offset after them."""
+    # Mostly, all of them are single bytes (i.e., below 64 in absolute
+    # value), which can be read all at once.
+    chunk = data[offset:offset+count]
+    if len(chunk) == count and (not chunk or max(chunk) < 0x80):
+        return [(b >> 1) ^ -(b & 1) for b in chunk], offset + count
+
+    values = []
+    for _ in range(count):
+        v, offset = read_varint(data, offset)
+        values.append(v)
+
+    return values, offset
+
+
+def write_delta_column(buffer, values):
+    previous = 0
+    for v in values:
+        write_varint(buffer, v - previous)
+        previous = v
+
+
+def read_delta_column(data, offset, count):
+    deltas, offset = read_varints(data, offset, count)
+    return list(accumulate(deltas)), offset
+
+
+def write_packed_column(buffer, values, bits):
+    """Write small non-negative integers (below 2**bits), several per byte."""
+    per_byte = 8 // bits
+    for i in range(0, len(values), per_byte):
+        byte = 0
+        for j, v in enumerate(values[i:i+per_byte]):
+            byte |= v << (j * bits)
+        buffer.append(byte)
+
+
+# The values packed in each possible byte, by the bits of each value.
+PACKED_BYTES = {
+    bits: [
+        tuple((byte >> (j * bits)) & ((1 << bits) - 1) for j in range(8 // bits))
+        for byte in range(256)
+    ]
+    for bits in (1, 2, 4, 8)
+}
+
+
+def read_packed_column(data, offset, count, bits):
+    per_byte = 8 // bits
+    size = -(-count // per_byte)  # ceil
+
+    if offset + size > len(data):
+        raise FlowFormatError('truncated column')
+
+    table = PACKED_BYTES[bits]
+    values = list(chain.from_iterable(table[b] for b in data[offset:offset+size]))
+
+    return values[:count], offset + size
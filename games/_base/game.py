@@ -1,5 +1,18 @@
+from games._base.profiles import PROFILE_EXTRA_MEMORY
+
+
 # A parent for all game classes.
 class Game:
+    # In seconds. The longest that a simulation of the game should take
+    # (including the setup of the player codes), with some headroom. A
+    # simulation taken by a worker that's been pending for much longer
+    # is given to another worker (see simulator/entry.py).
+    MAX_EXPECTED_DURATION = 60
+    
+    # The preload profile of the coderunner for the player codes, which
+    # decides the modules that they can import; see games._base.profiles.
+    PRELOAD_PROFILE = 'stdlib'
+    
     def __init__(self, game_settings, player_count):
         self.game_settings = game_settings
         self.player_count = player_count
@@ -8,6 +21,19 @@ class Game:
         self.cr_controllers = cr_controllers
         self.players_alive = initial_players
     
+    # The memory taken by the modules of the game's preload profile, to be
+    # added to the memory limit that the game returns from get_limits().
+    def get_profile_extra_memory(self):
+        return PROFILE_EXTRA_MEMORY[self.PRELOAD_PROFILE]
+    
+    # The command (the function name and the args) that a player code
+    # is given once when it's probed upon uploading, i.e., set up in the
+    # sandbox on its own to see whether it survives the start of a fight.
+    # It should be what the code would get on the first tick. If None,
+    # the probe only sets the code up.
+    def get_probe_command(self):
+        return None
+    
     def simulate(self):
         return NotImplementedError
     
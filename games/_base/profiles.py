@@ -0,0 +1,50 @@
+# The preload profiles of the coderunner. Each game picks one for its
+# player codes (see Game.PRELOAD_PROFILE). The modules of a profile are
+# imported once in a forkserver of its own, before the player codes are
+# run, and are the only modules that the codes can import (along with
+# their submodules that are loaded by then), since the rest are unloaded
+# in the sandbox. PRELOAD_PROFILES in simulator/settings.py is made
+# from these, so this module MUST NOT import anything but the stdlib.
+STDLIB_MODULES = frozenset([
+    'math',
+    'cmath',
+    'decimal',
+    'random',
+    'statistics',
+
+    'collections',
+    'heapq',
+    'queue',
+    'bisect',
+    'graphlib',
+
+    'enum',
+    'functools',
+    'itertools',
+    'dataclasses',
+
+    'uuid',
+    'copy',
+    'difflib',
+])
+
+PROFILE_MODULES = {
+    'stdlib': STDLIB_MODULES,
+
+    # For the vectorized math, which gets much more done than pure
+    # Python in the same CPU time.
+    'numeric': STDLIB_MODULES | {'numpy'},
+}
+
+# In bytes. The memory (the address space, as that's what is limited)
+# that the modules of each profile take on top of the interpreter, to
+# be added to the memory limits of the games; see Game.get_limits().
+PROFILE_EXTRA_MEMORY = {
+    'stdlib': 0,
+    'numeric': 300_000_000,  # mostly the mappings of the BLAS library
+}
+
+
+def is_module_allowed(profile, name):
+    """Whether the player codes of a profile can import a module, given its full name."""
+    return name.split('.')[0] in PROFILE_MODULES[profile]
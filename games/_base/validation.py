@@ -0,0 +1,105 @@
+import ast
+
+from games._base.profiles import is_module_allowed
+
+
+MAIN_CLASS_NAME = 'Main'
+
+
+# A parent for the static validators of the player codes of the games,
+# which catch the codes that could never run (e.g., with no 'Main' class)
+# upon uploading, before they're sent to the simulator. This is only for
+# the players' convenience; nothing about the sandbox relies on it.
+#
+# The checks err on the side of accepting the code: anything that can't
+# be told without running the code (e.g., a 'Main' class with bases,
+# which may inherit the methods) is left for the simulator to find out.
+class CodeValidator:
+    # The names of the methods that the 'Main' class must have.
+    REQUIRED_METHODS = []
+    
+    # The preload profile of the game, which decides the modules that
+    # the codes can import; must be the same as the game class's.
+    PRELOAD_PROFILE = 'stdlib'
+
+    @classmethod
+    def validate(cls, source):
+        """Get the problems of a player code as a list of messages; empty if none.
+
+        Parameters
+        ----------
+        source : bytes
+            The content of the code.
+        """
+        try:
+            tree = ast.parse(source)
+        except SyntaxError as e:
+            return [f'Syntax error on line {e.lineno}: {e.msg}']
+        except ValueError:  # e.g., null bytes
+            return ['The code is not a valid Python source file.']
+
+        return cls.check_imports(tree) + cls.check_main_class(tree)
+
+    @classmethod
+    def check_imports(cls, tree):
+        errors = []
+
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom):
+                names = ['.' * node.level + (node.module or '')]
+            else:
+                continue
+
+            for name in names:
+                if not is_module_allowed(cls.PRELOAD_PROFILE, name):
+                    errors.append(f"Importing '{name}' (line {node.lineno}) is not allowed.")
+
+        return errors
+
+    @classmethod
+    def check_main_class(cls, tree):
+        main_class = None
+
+        for node in tree.body:
+            if isinstance(node, ast.ClassDef) and node.name == MAIN_CLASS_NAME:
+                main_class = node
+
+            # Defined some other way, e.g., 'Main = SomeClass'.
+            elif MAIN_CLASS_NAME in get_assigned_names(node):
+                return []
+
+        if main_class is None:
+            return [f"The code has no '{MAIN_CLASS_NAME}' class."]
+
+        if main_class.bases:
+            return []
+
+        defined = set()
+        for node in main_class.body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                defined.add(node.name)
+            else:
+                defined.update(get_assigned_names(node))
+
+        return [
+            f"The '{MAIN_CLASS_NAME}' class has no '{name}' method."
+            for name in cls.REQUIRED_METHODS if name not in defined
+        ]
+
+
+def get_assigned_names(node):
+    """Get the plain names that a statement assigns to, if it's an assignment or an import."""
+    if isinstance(node, ast.Assign):
+        targets = node.targets
+    elif isinstance(node, (ast.AnnAssign, ast.AugAssign)):
+        targets = [node.target]
+    elif isinstance(node, (ast.Import, ast.ImportFrom)):
+        return {(alias.asname or alias.name).split('.')[0] for alias in node.names}
+    else:
+        return set()
+
+    return {
+        n.id for t in targets for n in ast.walk(t) if isinstance(n, ast.Name)
+    }
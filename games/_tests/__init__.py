@@ -1 +1 @@
-from games._tests.base import GameReportTest
+from games._tests.base import GameReportTest, GameFlowCodecTest
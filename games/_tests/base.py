@@ -3,6 +3,7 @@ from pathlib import Path
 
 from games._tests.coderunner import CRController
 from games.index import GAME_CLASSES
+from games.frontend import FLOW_CODEC_INDEX
 
 
 GAMES_ROOT = Path(__file__).parent.parent
@@ -72,3 +73,13 @@ class GameReportTest:
             json.dumps(json.loads(expected_report))
         )
 
+
+
+# A parent for the tests of the games' flow codecs, which checks that
+# the flows of the expected reports survive encoding and decoding.
+class GameFlowCodecTest:
+    def run_and_test_flow_roundtrip(self, game_name, report_file):
+        flow = json.loads(get_game_test_report(game_name, report_file))[-1]
+        codec = FLOW_CODEC_INDEX[game_name]
+        
+        self.assertEqual(codec.decode(codec.encode(flow)), flow)
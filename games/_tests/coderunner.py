@@ -5,6 +5,8 @@
 
 import json
 
+from games._base.delta import get_args_delta, apply_args_delta, refresh_given_args
+
 
 def take_through_json(data):
     return json.loads(json.dumps(data))
@@ -29,6 +31,13 @@ class CRController:
             
             setattr(self.main_instance, 'context', game_settings)
             
+            # The args of the delta commands, as the worker and the
+            # coderunner keep them, respectively, and as the coderunner
+            # gives them to the player.
+            self.sent_args = {}
+            self.kept_args = {}
+            self.given_args = {}
+            
             self.is_alive = True
         except Exception:
             self.is_alive = False
@@ -52,4 +61,19 @@ class CRController:
             return (take_through_json(f(*f_args)),)  # value in tuple
         except Exception:
             return -1  # exception occured; player can still continue
-
+    
+    def run_delta_command(self, f_name, f_args):
+        current = take_through_json(list(f_args))
+        
+        previous = self.sent_args.get(f_name)
+        if previous is None:
+            self.kept_args[f_name] = take_through_json(current)
+            self.given_args[f_name] = take_through_json(current)
+        else:
+            apply_args_delta(self.kept_args[f_name],
+                             take_through_json(get_args_delta(previous, current)))
+            refresh_given_args(self.given_args[f_name], self.kept_args[f_name])
+        
+        self.sent_args[f_name] = current
+        
+        return self.run_command(f_name, self.given_args[f_name])
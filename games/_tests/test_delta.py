@@ -0,0 +1,101 @@
+import json
+import unittest
+
+from games._base.delta import get_args_delta, apply_args_delta, refresh_given_args
+
+
+class ArgsDeltaTest(unittest.TestCase):
+    def run_and_test_delta(self, previous, current):
+        delta = get_args_delta(previous, current)
+
+        args = [a.copy() if isinstance(a, dict) else a for a in previous]
+        kept = args[0]
+        apply_args_delta(args, delta)
+
+        self.assertEqual(args, current)
+        return delta, args, kept
+
+    def test_changed_fields_only(self):
+        previous = [3, {'x': 1, 'y': 2, 'health': 100}, {'x': 5, 'y': 5, 'health': 100}]
+        current = [4, {'x': 1, 'y': 3, 'health': 100}, {'x': 5, 'y': 5, 'health': 90}]
+
+        delta, args, _ = self.run_and_test_delta(previous, current)
+        self.assertEqual(delta, [[0, None, 4], [1, 'y', 3], [2, 'health', 90]])
+
+    def test_unchanged(self):
+        previous = [{'x': 1, 'targeted': [[1, 2], None]}]
+
+        delta, _, _ = self.run_and_test_delta(previous, [{'x': 1, 'targeted': [[1, 2], None]}])
+        self.assertEqual(delta, [])
+
+    def test_dicts_updated_in_place(self):
+        previous = [{'x': 1, 'y': 2}]
+
+        _, args, kept = self.run_and_test_delta(previous, [{'x': 2, 'y': 2}])
+        self.assertIs(args[0], kept)
+
+    def test_changed_keys_replace_whole_arg(self):
+        previous = [{'x': 1, 'y': 2}]
+        current = [{'x': 1, 'z': 2}]
+
+        delta, _, _ = self.run_and_test_delta(previous, current)
+        self.assertEqual(delta, [[0, None, {'x': 1, 'z': 2}]])
+
+
+class GivenArgsTest(unittest.TestCase):
+    def run_ticks(self, ticks, mutate):
+        """Give the args of each tick as the coderunner does, letting the player change them; return what the player got."""
+        kept = json.loads(json.dumps(ticks[0]))
+        given = json.loads(json.dumps(ticks[0]))
+
+        got = [json.loads(json.dumps(given))]
+        mutate(given)
+
+        for previous, current in zip(ticks, ticks[1:]):
+            apply_args_delta(kept, get_args_delta(previous, current))
+            refresh_given_args(given, kept)
+
+            got.append(json.loads(json.dumps(given)))
+            mutate(given)
+
+        return got, given
+
+    def test_player_changes_undone(self):
+        ticks = [
+            [0, {'x': 1, 'targeted': [[1, 2], None]}],
+            [1, {'x': 1, 'targeted': [[1, 2], None]}],
+            [2, {'x': 2, 'targeted': None}],
+        ]
+
+        def mutate(args):
+            args[1]['x'] = 100
+            args[1]['extra'] = True
+            if args[1]['targeted']:
+                args[1]['targeted'][0].append(3)
+
+        got, _ = self.run_ticks(ticks, mutate)
+        self.assertEqual(got, ticks)
+
+    def test_dicts_kept_as_same_objects(self):
+        ticks = [[{'x': 1}], [{'x': 2}], [{'x': 2}]]
+
+        kept = json.loads(json.dumps(ticks[0]))
+        given = json.loads(json.dumps(ticks[0]))
+        state = given[0]
+
+        for previous, current in zip(ticks, ticks[1:]):
+            apply_args_delta(kept, get_args_delta(previous, current))
+            refresh_given_args(given, kept)
+            self.assertIs(given[0], state)
+
+    def test_given_not_shared_with_kept(self):
+        previous, current = [{'path': [1]}], [{'path': [1, 2]}]
+
+        kept = json.loads(json.dumps(previous))
+        given = json.loads(json.dumps(previous))
+
+        apply_args_delta(kept, get_args_delta(previous, current))
+        refresh_given_args(given, kept)
+        given[0]['path'].append(3)
+
+        self.assertEqual(kept, current)
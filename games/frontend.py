@@ -1,10 +1,24 @@
 from games.tanks.frontend import TanksExplanation
+from games.tanks.flow import TanksFlowCodec
+from games.tanks.validation import TanksCodeValidator
 
 
 EXPLANATION_INDEX = {
     'tanks': TanksExplanation
 }
 
+# The games whose flows are stored in a binary format (see
+# games._base.flow). The flows of the other games are kept
+# as the JSON that the simulator reports.
+FLOW_CODEC_INDEX = {
+    'tanks': TanksFlowCodec
+}
+
+# The static validators of the player codes; see games._base.validation.
+CODE_VALIDATOR_INDEX = {
+    'tanks': TanksCodeValidator
+}
+
 # Relative to the project root.
 GAMES_TEMPLATES_DIRS = [
     'games/tanks/web/templates/'
@@ -1,3 +1,25 @@
-from games.tanks.main import Tanks
+import importlib
 
-GAME_CLASSES = {'tanks': Tanks}
+
+# The game classes, as the dotted paths, by the game name. The classes
+# are only imported when needed, so that each simulator pool imports
+# only its own games (see common.pools).
+GAME_CLASS_PATHS = {'tanks': 'games.tanks.main.Tanks'}
+
+
+def load_game_classes(names):
+    classes = {}
+    for name in names:
+        module_path, _, class_name = GAME_CLASS_PATHS[name].rpartition('.')
+        classes[name] = getattr(importlib.import_module(module_path), class_name)
+    
+    return classes
+
+
+# All the game classes, imported upon the first access.
+def __getattr__(name):
+    if name == 'GAME_CLASSES':
+        classes = globals()['GAME_CLASSES'] = load_game_classes(GAME_CLASS_PATHS)
+        return classes
+    
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
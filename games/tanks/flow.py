@@ -0,0 +1,121 @@
+from games._base.flow import (
+    FlowCodec,
+    FlowFormatError,
+    write_varint,
+    read_varint,
+    write_delta_column,
+    read_delta_column,
+    write_packed_column,
+    read_packed_column
+)
+
+from games.tanks.main import UP, RIGHT, DOWN, LEFT
+
+
+# The order matters; it's the 2-bit code of each head direction.
+HEADS = [UP, RIGHT, DOWN, LEFT]
+HEAD_CODES = {h: i for i, h in enumerate(HEADS)}
+
+# The kinds of the 'targeted' values.
+NOT_TARGETED, TARGETED, TARGETED_RANDOMIZED = 0, 1, 2
+
+
+# Format (version 1), after the header:
+#   - the player count, as a varint
+#   - the tick count (i.e., the length of the flow), as a varint
+#   - for each player, the columns of each of the state fields over
+#     all the ticks, in this order:
+#       - x, y and health, each as a delta column
+#       - head, as a 2-bit packed column
+#       - moved, as a 1-bit packed column
+#       - the kind of 'targeted', as a 2-bit packed column
+#       - the coordinates of the targets of the targeted ticks, as
+#         varints: the given target and then, if randomized, the
+#         randomized target.
+#
+# Must be kept in sync with decode_flow() in tanks.js.
+class TanksFlowCodec(FlowCodec):
+    FORMAT_VERSION = 1
+
+    @classmethod
+    def encode(cls, flow):
+        buffer = bytearray(cls.pack_header())
+
+        player_count = len(flow[0])
+        write_varint(buffer, player_count)
+        write_varint(buffer, len(flow))
+
+        for pi in range(player_count):
+            states = [tick_states[pi] for tick_states in flow]
+            x, y, health, head, moved, targeted = zip(*states)
+
+            write_delta_column(buffer, x)
+            write_delta_column(buffer, y)
+            write_delta_column(buffer, health)
+
+            write_packed_column(buffer, [HEAD_CODES[h] for h in head], 2)
+            write_packed_column(buffer, [int(m) for m in moved], 1)
+
+            kinds = [
+                NOT_TARGETED if t is None else
+                TARGETED if t[1] is None else
+                TARGETED_RANDOMIZED
+                for t in targeted
+            ]
+            write_packed_column(buffer, kinds, 2)
+
+            for t in targeted:
+                if t is None:
+                    continue
+
+                for target in t:
+                    if target is not None:
+                        write_varint(buffer, target[0])
+                        write_varint(buffer, target[1])
+
+        return bytes(buffer)
+
+    @classmethod
+    def decode(cls, data):
+        version, offset = cls.unpack_header(data)
+        if version != 1:
+            raise FlowFormatError(f'unknown format version {version}')
+
+        player_count, offset = read_varint(data, offset)
+        tick_count, offset = read_varint(data, offset)
+
+        flow = [[None] * player_count for _ in range(tick_count)]
+
+        for pi in range(player_count):
+            x, offset = read_delta_column(data, offset, tick_count)
+            y, offset = read_delta_column(data, offset, tick_count)
+            health, offset = read_delta_column(data, offset, tick_count)
+
+            head, offset = read_packed_column(data, offset, tick_count, 2)
+            moved, offset = read_packed_column(data, offset, tick_count, 1)
+            kinds, offset = read_packed_column(data, offset, tick_count, 2)
+
+            targeted = []
+            for kind in kinds:
+                if kind == NOT_TARGETED:
+                    targeted.append(None)
+                    continue
+
+                tx, offset = read_varint(data, offset)
+                ty, offset = read_varint(data, offset)
+                target = [[tx, ty], None]
+
+                if kind == TARGETED_RANDOMIZED:
+                    rx, offset = read_varint(data, offset)
+                    ry, offset = read_varint(data, offset)
+                    target[1] = [rx, ry]
+
+                targeted.append(target)
+
+            states = zip(x, y, health, [HEADS[h] for h in head],
+                         [m == 1 for m in moved], targeted)
+
+            for tick_states, state in zip(flow, states):
+                tick_states[pi] = list(state)
+
+        return flow
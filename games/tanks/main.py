@@ -27,6 +27,26 @@ MISSILE_RAND_RADIUS = 1  # 1 square around the given dest
 DECIDE_FUNC_NAME = 'decide_tick'
 
 
+def get_initial_players_states():
+    return [
+        # Player 1
+        {'x': 0,
+         'y': 0,
+         'health': 100,
+         'head': RIGHT,
+         'moved': False,
+         'targeted': None},
+        
+        # Player 2
+        {'x': BOARD_WIDTH-1,
+         'y': BOARD_HEIGHT-1,
+         'health': 100,
+         'head': LEFT,
+         'moved': False,
+         'targeted': None}
+    ]
+
+
 # For now, this is only a 2-player game. It should
 # be made multiplayer later.
 #
@@ -39,6 +59,10 @@ DECIDE_FUNC_NAME = 'decide_tick'
 #    certain number of times throughout the game. but
 #    after the boost, it cannot move (just an idea).
 class Tanks(Game):  
+    # At most a second of CPU time for each of the two players, plus
+    # the tracing overhead of a few hundred commands.
+    MAX_EXPECTED_DURATION = 30
+    
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         
@@ -48,15 +72,26 @@ class Tanks(Game):
         return {
             'cpu_sec': 1,
             'cpu_nsec': 0,
-            'mem_bytes': 70_000_000  # 70MB
+            'mem_bytes': 70_000_000 + self.get_profile_extra_memory(),  # 70MB
+            
+            # 5ms for each tick, and half a second in the bank for the
+            # slower ticks; at most a second over all the 100 ticks.
+            'cpu_turn': 0.005,
+            'cpu_bank': 0.5
         }
     
+    def get_probe_command(self):
+        # The first tick, as player 1.
+        my_state, enemy_state = get_initial_players_states()
+        return DECIDE_FUNC_NAME, [0, my_state, enemy_state]
+    
     # This function is game-specific; not part of the
     # general interface of game classes. Even though
     # later we might factor a similar funtionality into
     # a parent class for all games.
     def get_decision(self, i, f, args):
-        res = self.cr_controllers[i].run_command(f_name=f, f_args=list(args))
+        # The states change by a few fields on each tick.
+        res = self.cr_controllers[i].run_delta_command(f_name=f, f_args=list(args))
         if res is None:  # player eliminated
             self.players_alive.remove(i)
             return None
@@ -254,23 +289,7 @@ class Tanks(Game):
         # tick, which will be affecting the next tick's state.
         # The decision to add the states to the flow at the end
         # of the tick just makes the job at the front-end simpler.
-        self.players_states = [
-            # Player 1
-            {'x': 0,
-             'y': 0,
-             'health': 100,
-             'head': RIGHT,
-             'moved': False,
-             'targeted': None},
-            
-            # Player 2
-            {'x': BOARD_WIDTH-1,
-             'y': BOARD_HEIGHT-1,
-             'health': 100,
-             'head': LEFT,
-             'moved': False,
-             'targeted': None}
-        ]
+        self.players_states = get_initial_players_states()
         
         # The initial states.
         self.flow.append(deepcopy([list(i.values()) for i in self.players_states]))
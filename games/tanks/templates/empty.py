@@ -20,5 +20,8 @@ MISSILE_RAND_RADIUS = 1
 
 
 class Main:
+    # 'my_state' and 'enemy_state' are the same dicts on every tick,
+    # updated in place; copy them if you want to keep those of a tick.
+    # Whatever you change in them is undone on the next tick.
     def decide_tick(self, tick, my_state, enemy_state):
         ...
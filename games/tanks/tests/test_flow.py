@@ -0,0 +1,31 @@
+import unittest
+
+from games._tests import GameFlowCodecTest
+from games._base.flow import FlowFormatError
+from games.tanks.flow import TanksFlowCodec
+
+
+class TanksFlowCodecTest(GameFlowCodecTest, unittest.TestCase):
+    def test_roundtrip_draw_both_lost(self):
+        self.run_and_test_flow_roundtrip('tanks', 'draw_both_lost.json')
+
+    def test_roundtrip_draw_tick_limit_exceed(self):
+        self.run_and_test_flow_roundtrip('tanks', 'draw_tick_limit_exceed.json')
+
+    def test_roundtrip_win_by_missile(self):
+        self.run_and_test_flow_roundtrip('tanks', 'win_by_missile.json')
+
+    def test_roundtrip_randomized_and_out_of_board_targets(self):
+        flow = [
+            [[0, 0, 100, 'R', False, None], [9, 9, 100, 'L', False, None]],
+            [[1, 0, 100, 'R', True, [[-5, 1_000_000], [0, 1]]], [9, 8, 100, 'D', True, [[1, 0], None]]],
+            [[1, 0, 90, 'U', False, None], [9, 8, -10, 'D', False, None]],
+        ]
+
+        self.assertEqual(TanksFlowCodec.decode(TanksFlowCodec.encode(flow)), flow)
+
+    def test_decode_truncated(self):
+        data = TanksFlowCodec.encode([[[0, 0, 100, 'R', False, [[9, 9], None]]]])
+
+        with self.assertRaises(FlowFormatError):
+            TanksFlowCodec.decode(data[:-1])
@@ -0,0 +1,60 @@
+import unittest
+
+from games._tests.base import get_game_test_codes
+from games.tanks.validation import TanksCodeValidator
+
+
+class TanksCodeValidatorTest(unittest.TestCase):
+    def test_test_codes_are_valid(self):
+        codes = get_game_test_codes('tanks', [
+            'do_nothing.py',
+            'fire_enemy_no_move.py',
+            'move_to_x0y9.py',
+            'move_to_x9y9.py'
+        ])
+
+        for code in codes:
+            self.assertEqual(TanksCodeValidator.validate(code.encode()), [])
+
+    def test_syntax_error(self):
+        errors = TanksCodeValidator.validate(b'class Main:\n    def decide_tick(self\n')
+        self.assertEqual(len(errors), 1)
+        self.assertTrue(errors[0].startswith('Syntax error on line'))
+
+    def test_no_main_class(self):
+        errors = TanksCodeValidator.validate(b'class Mian:\n    pass\n')
+        self.assertEqual(errors, ["The code has no 'Main' class."])
+
+    def test_no_required_method(self):
+        errors = TanksCodeValidator.validate(b'class Main:\n    def decide(self):\n        pass\n')
+        self.assertEqual(errors, ["The 'Main' class has no 'decide_tick' method."])
+
+    def test_main_with_bases_is_left_to_the_simulator(self):
+        code = b'class Base:\n    def decide_tick(self, *a):\n        pass\n\nclass Main(Base):\n    pass\n'
+        self.assertEqual(TanksCodeValidator.validate(code), [])
+
+    def test_imports(self):
+        code = (b'import math, os\n'
+                b'from collections import deque\n'
+                b'from . import x\n'
+                b'class Main:\n'
+                b'    def decide_tick(self, *a):\n'
+                b'        import socket\n')
+
+        self.assertEqual(TanksCodeValidator.validate(code), [
+            "Importing 'os' (line 1) is not allowed.",
+            "Importing '.' (line 3) is not allowed.",
+            "Importing 'socket' (line 6) is not allowed.",
+        ])
+
+    def test_imports_of_the_preload_profile(self):
+        code = (b'import collections.abc\n'
+                b'import numpy\n'
+                b'class Main:\n'
+                b'    def decide_tick(self, *a):\n'
+                b'        pass\n')
+
+        # Tanks is of the 'stdlib' profile, with no numpy.
+        self.assertEqual(TanksCodeValidator.validate(code), [
+            "Importing 'numpy' (line 2) is not allowed.",
+        ])
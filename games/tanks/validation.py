@@ -0,0 +1,8 @@
+from games._base.validation import CodeValidator
+
+from games.tanks.main import Tanks, DECIDE_FUNC_NAME
+
+
+class TanksCodeValidator(CodeValidator):
+    REQUIRED_METHODS = [DECIDE_FUNC_NAME]
+    PRELOAD_PROFILE = Tanks.PRELOAD_PROFILE
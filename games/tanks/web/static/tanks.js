@@ -211,6 +211,100 @@ function setup_board() {
 }
 
 
+// Decoding the stored flows; see games/tanks/flow.py for the format.
+const FLOW_HEADS = [UP, RIGHT, DOWN, LEFT];
+const FLOW_NOT_TARGETED = 0;
+const FLOW_TARGETED_RANDOMIZED = 2;
+
+
+// The interface for the website's machinery. Takes the encoded
+// flow as a Uint8Array and returns the same flow the simulator
+// reported.
+function decode_flow(data) {
+    let offset = 0;
+
+    // Zigzag LEB128; no bitwise operations, as they would
+    // truncate to 32 bits.
+    function read_varint() {
+        let n = 0, scale = 1, byte;
+        do {
+            if (offset >= data.length) throw new Error("truncated flow");
+            byte = data[offset++];
+            n += (byte & 0x7f) * scale;
+            scale *= 128;
+        } while (byte & 0x80);
+
+        return (n % 2 === 0) ? n / 2 : -(n + 1) / 2;
+    }
+
+    function read_delta_column(count) {
+        let values = new Array(count);
+        let previous = 0;
+        for (let i = 0; i < count; i++) {
+            previous += read_varint();
+            values[i] = previous;
+        }
+        return values;
+    }
+
+    function read_packed_column(count, bits) {
+        let per_byte = 8 / bits;
+        let mask = (1 << bits) - 1;
+        let values = new Array(count);
+        for (let i = 0; i < count; i++) {
+            values[i] = (data[offset + Math.floor(i / per_byte)] >> ((i % per_byte) * bits)) & mask;
+        }
+        offset += Math.ceil(count / per_byte);
+        return values;
+    }
+
+    // The header: 'CF' and the format version.
+    if (data[0] !== 0x43 || data[1] !== 0x46) throw new Error("not an encoded flow");
+    let version = data[2];
+    offset = 3;
+
+    if (version !== 1) throw new Error("unknown flow format version " + version);
+
+    let player_count = read_varint();
+    let tick_count = read_varint();
+
+    let decoded = [];
+    for (let tick = 0; tick < tick_count; tick++) {
+        decoded.push(new Array(player_count));
+    }
+
+    for (let pi = 0; pi < player_count; pi++) {
+        let x = read_delta_column(tick_count);
+        let y = read_delta_column(tick_count);
+        let health = read_delta_column(tick_count);
+        let head = read_packed_column(tick_count, 2);
+        let moved = read_packed_column(tick_count, 1);
+        let kinds = read_packed_column(tick_count, 2);
+
+        for (let tick = 0; tick < tick_count; tick++) {
+            let targeted = null;
+            if (kinds[tick] !== FLOW_NOT_TARGETED) {
+                targeted = [[read_varint(), read_varint()], null];
+                if (kinds[tick] === FLOW_TARGETED_RANDOMIZED) {
+                    targeted[1] = [read_varint(), read_varint()];
+                }
+            }
+
+            decoded[tick][pi] = [
+                x[tick],
+                y[tick],
+                health[tick],
+                FLOW_HEADS[head[tick]],
+                moved[tick] === 1,
+                targeted,
+            ];
+        }
+    }
+
+    return decoded;
+}
+
+
 // The interface for the website's machinery.
 function setup(_settings, _result, _flow) {
     settings = _settings;
@@ -1,6 +1,38 @@
 from django.contrib import admin
+from django.db import transaction
 
-from gamespecs.models import GameInfo, GameTemplate, GameCodePreset, GameResult
+from gamespecs.models import GameInfo, GameTemplate, CodeFile, GameCodePreset, GameResult, TrustedCode
+from gamespecs.codes import import_preset_code
 
-for model in [GameInfo, GameTemplate, GameCodePreset, GameResult]:
+for model in [GameInfo, GameTemplate, CodeFile, GameResult]:
     admin.site.register(model)
+
+
+@admin.register(GameCodePreset)
+class GameCodePresetAdmin(admin.ModelAdmin):
+    list_display = ['title', 'game_info', 'player', 'code', 'created_at']
+    raw_id_fields = ['player', 'code']
+    
+    def save_model(self, request, obj, form, change):
+        # An uploaded file is stored right away, so that its code can
+        # be approved as trusted (e.g., for a house bot; see TrustedCode).
+        with transaction.atomic():
+            super().save_model(request, obj, form, change)
+            
+            if obj.code_id is None and obj.code_file:
+                obj.code_id = import_preset_code(obj.id)
+                obj.code_file = ''
+
+
+@admin.register(TrustedCode)
+class TrustedCodeAdmin(admin.ModelAdmin):
+    list_display = ['code', 'note', 'approved_by', 'approved_at']
+    readonly_fields = ['approved_by', 'approved_at']
+    raw_id_fields = ['code']
+    
+    def save_model(self, request, obj, form, change):
+        # Signed off by whoever approves it.
+        if not change:
+            obj.approved_by = request.user
+        
+        super().save_model(request, obj, form, change)
@@ -0,0 +1,208 @@
+import json
+import struct
+from pathlib import Path
+
+import brotli
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from gamespecs.models import GameResult
+from utils.files import write_file_atomically, fsync_directory
+
+# Cache
+FlowFormats = GameResult.FlowFormats
+
+
+# The flows of the old fights are rarely read, but they make up most of
+# the size of the database (and its backups). So we move them out of the
+# database into segment files, many results per file, and keep a pointer
+# to each in its GameResult.
+#
+# A segment file is laid out as:
+#   - the records: the stored flows (i.e., the 'data' or the 'flow' of
+#     the results, as bytes), each compressed on its own, so that any of
+#     them can be read without reading the rest
+#   - the index: a JSON object of {result id: [offset, length]}
+#   - the footer: the offset of the index, and the magic bytes
+#
+# The index isn't needed for reading (the pointers in the database are
+# enough); it's there so that a segment describes itself, e.g., to check
+# or recover the pointers from the segments.
+SEGMENT_SUFFIX = '.seg'
+SEGMENT_MAGIC = b'CFSG'
+SEGMENT_FOOTER = struct.Struct('<Q4s')
+
+
+class ArchiveFormatError(ValueError):
+    pass
+
+
+def get_segment_path(archives_root, segment):
+    return Path(archives_root) / f'{segment}{SEGMENT_SUFFIX}'
+
+
+def write_segment(archives_root, records):
+    """Write the given records to a new segment file.
+
+    Parameters
+    ----------
+    archives_root : Path
+        The directory of the segment files.
+
+    records : list[tuple[int, bytes]]
+        The game result ids and their stored flows, sorted by the id.
+
+    Returns
+    -------
+    tuple[str, dict]
+        The name of the segment, and the (offset, length) of the record
+        of each game result id in it.
+    """
+    # Named by the range of the ids in it, plus a random part, since a
+    # result can be archived again (see store_game_result_flow()) and an
+    # existing segment must never be overwritten. If archiving a batch
+    # fails after its segment is written, the segment is just left unused.
+    segment = f'{records[0][0]:012d}-{records[-1][0]:012d}-{get_random_string(8)}'
+
+    content = bytearray()
+    index = {}
+    for result_id, raw in records:
+        compressed = brotli.compress(raw)
+        index[result_id] = (len(content), len(compressed))
+        content += compressed
+
+    index_offset = len(content)
+    content += json.dumps(index).encode()
+    content += SEGMENT_FOOTER.pack(index_offset, SEGMENT_MAGIC)
+
+    path = get_segment_path(archives_root, segment)
+    if not path.parent.is_dir():
+        path.parent.mkdir(parents=True)
+        # The new directory itself must survive a crash too.
+        fsync_directory(path.parent.parent)
+
+    # The database will no longer have these flows once the pointers
+    # are saved, so the segment (with its index) must be on the disk
+    # for real by then; see write_file_atomically().
+    write_file_atomically(path, bytes(content), durable=True)
+
+    return segment, index
+
+
+def read_segment_index(archives_root, segment):
+    """Read the index of a segment, i.e., the (offset, length) of the record of each game result id in it.
+
+    Raises ArchiveFormatError if the segment is truncated or corrupted.
+    """
+    with open(get_segment_path(archives_root, segment), 'rb') as f:
+        footer_offset = f.seek(0, 2) - SEGMENT_FOOTER.size
+
+        if footer_offset < 0:
+            raise ArchiveFormatError(f'{segment} is not a segment')
+
+        f.seek(footer_offset)
+        index_offset, magic = SEGMENT_FOOTER.unpack(f.read())
+
+        if magic != SEGMENT_MAGIC or index_offset > footer_offset:
+            raise ArchiveFormatError(f'{segment} is not a segment')
+
+        f.seek(index_offset)
+        index = f.read(footer_offset - index_offset)
+
+    try:
+        index = json.loads(index)
+        return {int(k): (int(v[0]), int(v[1])) for k, v in index.items()}
+    except (ValueError, TypeError, AttributeError, IndexError, KeyError):
+        raise ArchiveFormatError(f'corrupted index in {segment}')
+
+
+def read_archived_flow(archives_root, segment, offset, length):
+    """Read a stored flow from a segment, given its pointer.
+
+    Raises ArchiveFormatError if the record is truncated or corrupted.
+    """
+    with open(get_segment_path(archives_root, segment), 'rb') as f:
+        f.seek(offset)
+        compressed = f.read(length)
+
+    if len(compressed) != length:
+        raise ArchiveFormatError(f'truncated record in {segment}')
+
+    try:
+        return brotli.decompress(compressed)
+    except brotli.error:
+        raise ArchiveFormatError(f'corrupted record in {segment}')
+
+
+def archive_game_results(archives_root, older_than, batch_size):
+    """Move the flows of the fights finished before the given age out of the database.
+
+    Parameters
+    ----------
+    archives_root : Path
+        The directory of the segment files.
+
+    older_than : datetime.timedelta
+        The age of the fights (since they were finished) after which
+        their flows are archived.
+
+    batch_size : int
+        The number of results in each segment.
+
+    Returns
+    -------
+    int
+        The number of the archived results.
+
+    Notes
+    -----
+    Each batch is archived in a transaction that holds row-level locks on
+    its results, so that a result isn't changed (e.g., migrated to a new
+    flow format) while its flow is being archived. The results locked by
+    others are skipped, to be archived in the next run.
+    """
+    cutoff = timezone.now() - older_than
+    archived = 0
+
+    while True:
+        with transaction.atomic():
+            results = list(GameResult.objects.filter(
+                fight__finished_at__lt=cutoff,
+                archive_segment=''
+            ).select_for_update(
+                skip_locked=True,
+                of=('self',)
+            ).only(
+                'id',
+                'flow_format',
+                'data',
+                'flow'
+            ).order_by('id')[:batch_size])
+
+            if not results:
+                return archived
+
+            records = [
+                (r.id, bytes(r.flow) if r.flow_format == FlowFormats.ENCODED else r.data.encode())
+                for r in results
+            ]
+
+            segment, index = write_segment(archives_root, records)
+
+            for r in results:
+                r.archive_segment = segment
+                r.archive_offset, r.archive_length = index[r.id]
+                r.data = ''
+                r.flow = None
+
+            GameResult.objects.bulk_update(results, [
+                'archive_segment',
+                'archive_offset',
+                'archive_length',
+                'data',
+                'flow'
+            ])
+
+        archived += len(results)
@@ -0,0 +1,165 @@
+import hashlib
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from gamespecs.models import CodeFile, GameCodePreset
+from games.frontend import CODE_VALIDATOR_INDEX
+from utils.files import write_file_atomically
+
+
+# Bump this whenever the validators change, so that the cached
+# results of the older validators are no longer used.
+CODE_VALIDATION_CACHE_VERSION = 2
+
+
+# The uploaded codes are stored by the SHA-256 of their content, so
+# that a player submitting the same code for many fights doesn't add
+# a file per fight. A stored code is never changed; it's only deleted
+# once nothing refers to it (see the command 'collect_code_files').
+
+def get_code_file_name(sha256):
+    """Get the name (relative to the MEDIA_ROOT) of a code file, given its hash.
+
+    The files are sharded by the first two pairs of characters of the
+    hash, so that no directory ends up with too many files.
+    """
+    return str(Path(settings.CODES_DIR, sha256[:2], sha256[2:4], f'{sha256}.py'))
+
+
+def store_code(content):
+    """Store a code, unless it's already stored, and take a reference to it.
+
+    Parameters
+    ----------
+    content : bytes
+        The content of the code.
+
+    Returns
+    -------
+    str
+        The hash of the code, i.e., the primary key of its CodeFile.
+
+    Notes
+    -----
+    This must be called in the same transaction that saves whatever
+    refers to the code, so that the reference count stays exact.
+
+    The code file row is locked before its file is checked, so that the
+    garbage collector (which deletes the file along with the row, under
+    the same lock) can't delete the file in between. Then again, if the
+    transaction is rolled back after a new file is written, the file is
+    left without a row; the garbage collector deletes those too.
+    """
+    sha256 = hashlib.sha256(content).hexdigest()
+    name = get_code_file_name(sha256)
+
+    CodeFile.objects.bulk_create([
+        CodeFile(sha256=sha256, file=name, size=len(content))
+    ], ignore_conflicts=True)
+
+    # Also locks the row.
+    CodeFile.objects.add_references([sha256], 1)
+
+    path = Path(settings.MEDIA_ROOT) / name
+    if not path.is_file():
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Durable, since the commit will make the fight refer to it.
+        write_file_atomically(path, content, durable=True)
+
+    return sha256
+
+
+def acquire_code(code):
+    """Take a reference to the code of a fight player; see store_code().
+
+    Parameters
+    ----------
+    code : UploadedFile | GameCodePreset
+        An uploaded code, or a preset of the player. The code of
+        a preset is referred to as it is, without copying.
+
+    Returns
+    -------
+    str
+        The hash of the code.
+
+    Notes
+    -----
+    A preset that has no stored code yet (i.e., one saved before the
+    codes were content-addressed, or uploaded through the admin) has
+    its file stored first, as 'import_legacy_code_files' would.
+    """
+    if isinstance(code, GameCodePreset):
+        code_id = code.code_id
+        if code_id is None:
+            code_id = import_preset_code(code.id)
+
+        CodeFile.objects.add_references([code_id], 1)
+        return code_id
+
+    return store_code(b''.join(code.chunks()))
+
+
+def import_preset_code(preset_id):
+    """Store the file of a preset that has no stored code yet; see acquire_code().
+
+    Returns
+    -------
+    str
+        The hash of the code, which the preset now refers to.
+    """
+    # Locked, so that concurrent fights (or the import command) don't
+    # store it twice; it might have been imported while we waited.
+    preset = GameCodePreset.objects.select_for_update().only(
+        'code', 'code_file'
+    ).get(id=preset_id)
+
+    if preset.code_id is not None:
+        return preset.code_id
+
+    if not preset.code_file:
+        raise ValueError(f'The preset {preset_id} has no code.')
+
+    path = Path(settings.MEDIA_ROOT, preset.code_file.name)
+
+    # The preset's own reference; the caller takes the fight's.
+    preset.code_id = store_code(path.read_bytes())
+    preset.code_file = ''
+    preset.save(update_fields=['code', 'code_file'])
+
+    # Only after the commit, as the row referred to it until then.
+    transaction.on_commit(lambda: path.unlink(missing_ok=True))
+
+    return preset.code_id
+
+
+def get_code_validation_cache_key(game_name, sha256):
+    return f'code_validation_{game_name}_{sha256}'
+
+
+def validate_player_code(game_name, content):
+    """Statically validate a player code for a game; see games._base.validation.
+
+    The results are cached by the hash of the code, as the same code
+    is usually uploaded many times.
+
+    Returns
+    -------
+    list[str]
+        The problems of the code; empty if none, or if the game has no
+        validator.
+    """
+    validator = CODE_VALIDATOR_INDEX.get(game_name)
+    if validator is None:
+        return []
+
+    return cache.get_or_set(
+        get_code_validation_cache_key(game_name, hashlib.sha256(content).hexdigest()),
+        lambda: validator.validate(content),
+        timeout=settings.CODE_VALIDATION_CACHE_TIMEOUT,
+        version=CODE_VALIDATION_CACHE_VERSION
+    )
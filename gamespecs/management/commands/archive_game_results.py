@@ -0,0 +1,53 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.conf import settings
+
+from gamespecs.archive import archive_game_results
+
+
+class Command(BaseCommand):
+    help = 'Move the flows of the old fights out of the database into archive segments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days',
+            type=int,
+            help='Archive the fights finished at least this many days ago '
+                 '(defaults to GAME_RESULT_ARCHIVE_AGE).'
+        )
+
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.GAME_RESULT_ARCHIVE_BATCH_SIZE,
+            help='The number of results in each segment file.'
+        )
+
+        # To run it as a background job (see the 'archiver' service
+        # in the compose files).
+        parser.add_argument(
+            '--every',
+            type=int,
+            metavar='SECONDS',
+            help='Keep running, archiving once every this many seconds.'
+        )
+
+    def handle(self, *args, **options):
+        if options['older_than_days'] is not None:
+            older_than = timedelta(days=options['older_than_days'])
+        else:
+            older_than = settings.GAME_RESULT_ARCHIVE_AGE
+
+        while True:
+            archived = archive_game_results(settings.ARCHIVES_ROOT,
+                                            older_than,
+                                            options['batch_size'])
+
+            self.stdout.write(f'Archived {archived} game results.')
+
+            if not options['every']:
+                break
+
+            time.sleep(options['every'])
@@ -0,0 +1,107 @@
+import os
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db import transaction
+
+from gamespecs.models import CodeFile, GameCodePreset, TrustedCode
+from fights.models import PlayerFight
+
+
+class Command(BaseCommand):
+    help = 'Delete the stored code files that nothing refers to anymore.'
+
+    def add_arguments(self, parser):
+        # The reference counts are only decremented by the services
+        # that delete the fights; anything deleted otherwise (e.g., in
+        # the admin) leaves them higher than they are.
+        parser.add_argument(
+            '--recount',
+            action='store_true',
+            help='Recompute the reference counts of all the code files first.'
+        )
+
+    def get_actual_ref_count(self, sha256):
+        return (PlayerFight.objects.filter(code_id=sha256).count()
+                + GameCodePreset.objects.filter(code_id=sha256).count()
+                + TrustedCode.objects.filter(code_id=sha256).count())
+
+    def recount(self):
+        for sha256 in CodeFile.objects.values_list('sha256', flat=True).iterator():
+            with transaction.atomic():
+                # The references are only added with the row locked
+                # (see CodeFileQuerySet.add_references()).
+                code = CodeFile.objects.select_for_update().filter(sha256=sha256).first()
+                if code:
+                    code.ref_count = self.get_actual_ref_count(sha256)
+                    code.save(update_fields=['ref_count'])
+
+    def collect_unreferenced(self):
+        deleted = 0
+
+        candidates = list(CodeFile.objects.filter(
+            ref_count__lte=0
+        ).values_list('sha256', flat=True))
+
+        for sha256 in candidates:
+            with transaction.atomic():
+                # Skipped if locked, i.e., if it's being referenced
+                # right now; it's no longer a candidate anyways.
+                code = CodeFile.objects.select_for_update(
+                    skip_locked=True
+                ).filter(
+                    sha256=sha256,
+                    ref_count__lte=0
+                ).first()
+
+                if not code:
+                    continue
+
+                # Just in case the count has drifted below the actual one.
+                ref_count = self.get_actual_ref_count(sha256)
+                if ref_count:
+                    code.ref_count = ref_count
+                    code.save(update_fields=['ref_count'])
+                    continue
+
+                code.delete()
+
+                # Deleted before the commit (i.e., while still locked), so
+                # that store_code() can't find the file in place and then
+                # have it deleted under its feet.
+                Path(settings.MEDIA_ROOT, code.file.name).unlink(missing_ok=True)
+
+                deleted += 1
+
+        return deleted
+
+    def collect_orphans(self):
+        """Delete the files of the codes that have no row; see store_code()."""
+        deleted = 0
+
+        codes_dir = Path(settings.MEDIA_ROOT) / settings.CODES_DIR
+        if not codes_dir.is_dir():
+            return deleted
+
+        cutoff = time.time() - settings.CODE_FILE_ORPHAN_GRACE
+
+        for path in codes_dir.glob('*/*/*.py'):
+            if os.stat(path).st_mtime > cutoff:
+                continue
+
+            if not CodeFile.objects.filter(sha256=path.stem).exists():
+                path.unlink(missing_ok=True)
+                deleted += 1
+
+        return deleted
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            self.recount()
+
+        deleted = self.collect_unreferenced()
+        orphans = self.collect_orphans()
+
+        self.stdout.write(f'Deleted {deleted} unreferenced code files and {orphans} orphaned files.')
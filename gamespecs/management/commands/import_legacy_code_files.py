@@ -0,0 +1,56 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db import transaction
+
+from gamespecs.models import GameCodePreset
+from gamespecs.codes import store_code
+from fights.models import PlayerFight
+
+
+class Command(BaseCommand):
+    help = ('Move the codes uploaded before the codes were stored by their '
+            'hash into the content-addressed storage, and delete their old files.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def import_model(self, model, batch_size):
+        imported = 0
+
+        while True:
+            old_files = []
+
+            with transaction.atomic():
+                objs = list(model.objects.select_for_update(
+                    skip_locked=True
+                ).filter(
+                    code__isnull=True
+                ).exclude(
+                    code_file=''
+                ).only('code_file').order_by('id')[:batch_size])
+
+                if not objs:
+                    return imported
+
+                for obj in objs:
+                    path = Path(settings.MEDIA_ROOT, obj.code_file.name)
+
+                    obj.code_id = store_code(path.read_bytes())
+                    obj.code_file = ''
+                    old_files.append(path)
+
+                model.objects.bulk_update(objs, ['code', 'code_file'])
+
+            # Only after the commit, as the rows referred to them until then.
+            for path in old_files:
+                path.unlink(missing_ok=True)
+
+            imported += len(objs)
+
+    def handle(self, *args, **options):
+        playerfights = self.import_model(PlayerFight, options['batch_size'])
+        presets = self.import_model(GameCodePreset, options['batch_size'])
+
+        self.stdout.write(f'Imported the codes of {playerfights} fight players and {presets} presets.')
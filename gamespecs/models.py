@@ -1,9 +1,11 @@
 from django.urls import reverse
 from django.db import models
 from django.db.models.lookups import IsNull
+from django.core.exceptions import ValidationError
 from django.conf import settings
 
 from pathlib import Path
+from collections import Counter
 
 from django.utils.crypto import get_random_string
 
@@ -90,6 +92,84 @@ class GameTemplate(models.Model):
     
 
 
+class CodeFileQuerySet(models.QuerySet):
+    def add_references(self, sha256_list, delta):
+        """Add delta to the reference counts of the code files; must be called in a transaction."""
+        # Locked in order, so that the concurrent updates can't deadlock.
+        list(self.select_for_update().filter(
+            sha256__in=sha256_list
+        ).order_by('sha256').values_list('sha256'))
+        
+        # The same code may be referenced more than once (e.g., by
+        # several players of a fight).
+        for sha256, count in Counter(sha256_list).items():
+            self.filter(sha256=sha256).update(ref_count=models.F('ref_count') + delta * count)
+
+
+# The uploaded codes, stored by the SHA-256 of their content (see
+# gamespecs.codes), so that the same code uploaded for many fights
+# is stored once. The PlayerFight's and the presets refer to these,
+# and the reference count lets the unused ones be garbage collected
+# (see the command 'collect_code_files') without scanning those.
+class CodeFile(models.Model):
+    class Meta:
+        indexes = [
+            # For the garbage collection.
+            models.Index(fields=['ref_count'],
+                         condition=models.Q(ref_count__lte=0),
+                         name='codefile_unreferenced_idx')
+        ]
+    
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    
+    # The name is derived from the hash; see gamespecs.codes.
+    file = models.FileField()
+    
+    size = models.IntegerField()
+    
+    ref_count = models.IntegerField(default=0)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f'{self.sha256} ({self.ref_count} refs)'
+    
+    objects = models.Manager.from_queryset(CodeFileQuerySet)()
+
+
+# The codes that the admins have approved to be run by the simulator in
+# its own process, out of the sandbox (see common.trusted); e.g., the
+# house bots that the players practice against. Such a code runs with
+# all the permissions of the simulator, and with no limits, so it must
+# be reviewed as our own code would be. A trusted code is also kept from
+# being collected while it's trusted.
+class TrustedCode(models.Model):
+    code = models.OneToOneField(CodeFile, on_delete=models.PROTECT,
+                                primary_key=True, related_name='trusted')
+    
+    approved_by = models.ForeignKey(settings.AUTH_USER_MODEL,
+                                    on_delete=models.SET_NULL, null=True)
+    approved_at = models.DateTimeField(auto_now_add=True)
+    
+    note = models.CharField(max_length=120, blank=True)
+    
+    def __str__(self):
+        return f'{self.code_id} ({self.note})'
+
+
+class GameCodePresetQuerySet(models.QuerySet):
+    def house_bots(self, game_info):
+        """Get the house bots of a game: the presets whose code is approved as trusted (see TrustedCode).
+        
+        The players pick them as opponents when creating a fight; they're
+        set up by the admins, under the accounts of the bots.
+        """
+        return self.filter(
+            game_info=game_info,
+            code__trusted__isnull=False
+        ).select_related('player').order_by('game_preset_index')
+
+
 class GameCodePreset(models.Model):
     def get_code_upload_path(self, _):
         return settings.PRESET_CODES_DIR / f'{get_random_string(length=32)}.py'
@@ -102,12 +182,34 @@ class GameCodePreset(models.Model):
     game_preset_index = models.SmallIntegerField()
     
     title = models.CharField(max_length=50)
-    code_file = models.FileField(upload_to=get_code_upload_path)
+    
+    # Shared with the fights that the preset is used in, without copying.
+    code = models.ForeignKey(CodeFile, on_delete=models.PROTECT, null=True, blank=True)
+    
+    # Only for the presets saved before the codes were content-addressed
+    # (or uploaded through the admin); the command 'import_legacy_code_files'
+    # moves them to 'code', as does using them in a fight. To be removed
+    # once that's done.
+    code_file = models.FileField(upload_to=get_code_upload_path, blank=True)
     
     created_at = models.DateTimeField(auto_now_add=True)
+    
+    def clean(self):
+        # One of the two must be there; see acquire_code().
+        if self.code_id is None and not self.code_file:
+            raise ValidationError('A preset must have a code.')
+    
+    def __str__(self):
+        return f'{self.title} (@{self.player.username}, {self.game_info.title})'
+    
+    objects = models.Manager.from_queryset(GameCodePresetQuerySet)()
 
 
 class GameResult(models.Model):
+    class FlowFormats(models.IntegerChoices):
+        JSON = 0, 'JSON'
+        ENCODED = 1, "The game's binary format"
+    
     fight = models.OneToOneField('fights.Fight', on_delete=models.CASCADE, related_name='result')
     
     # This is mostly meant to be containing small strings. If later
@@ -115,4 +217,26 @@ class GameResult(models.Model):
     # a JSON storage (and possibly increase the max length).
     explanation = models.CharField(max_length=100, blank=True)
 
-    data = models.TextField()
+    # The flow (the "data" of the game report) is stored in one of these,
+    # depending on the format: 'data' holds it as JSON and 'flow' holds it
+    # in the game's binary format (see games._base.flow), for the games
+    # that have a flow codec. The results saved in the JSON format before
+    # their game had a codec are migrated to it when they're first read
+    # (see gamespecs.replays.migrate_game_result_flow()).
+    flow_format = models.PositiveSmallIntegerField(choices=FlowFormats, default=FlowFormats.JSON)
+    data = models.TextField(blank=True)
+    flow = models.BinaryField(null=True)
+    
+    # Once a fight gets old enough, its flow is moved out of the database
+    # into an archive segment file, and these point to where it is in
+    # there; both 'data' and 'flow' are then emptied. The flow format
+    # stays as it was. See gamespecs.archive.
+    archive_segment = models.CharField(max_length=64, blank=True)
+    archive_offset = models.BigIntegerField(null=True)
+    archive_length = models.IntegerField(null=True)
+    
+    # The content hash of the replay artifact, i.e., the stored flow written
+    # to the replays root along with its precompressed versions (see
+    # gamespecs.replays). It's empty for the results saved before the
+    # artifacts existed, until they're migrated.
+    replay_hash = models.CharField(max_length=64, blank=True)
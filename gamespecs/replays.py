@@ -0,0 +1,287 @@
+import gzip
+import json
+import hashlib
+from pathlib import Path
+
+import brotli
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from gamespecs.models import GameResult
+from gamespecs.archive import read_archived_flow
+from games.frontend import FLOW_CODEC_INDEX
+from utils.files import write_file_atomically
+
+# Cache
+FlowFormats = GameResult.FlowFormats
+
+
+# The encodings each replay artifact is stored with, by the
+# name used in the Accept-Encoding header, ordered by preference.
+# The raw (identity) version is kept for the clients that accept
+# neither.
+REPLAY_ENCODINGS = {
+    'br': '.br',
+    'gzip': '.gz',
+}
+
+
+def get_replay_relative_path(replay_hash, encoding=None):
+    """Get the path of a replay artifact, relative to the replays root.
+
+    The artifacts are sharded by the first two characters of their
+    hash, so that no directory ends up with too many files.
+    """
+    suffix = REPLAY_ENCODINGS[encoding] if encoding else ''
+
+    return Path(replay_hash[:2]) / f'{replay_hash}{suffix}'
+
+
+def write_replay_artifact(replays_root, raw):
+    """Write a serialized replay, along with its precompressed versions, under the replays root.
+
+    Parameters
+    ----------
+    replays_root : Path
+        The root directory of the replay artifacts.
+
+    raw : bytes
+        The serialized replay, i.e., the flow in its stored format.
+
+    Returns
+    -------
+    str
+        The content hash of the replay, by which it can be located.
+
+    Notes
+    -----
+    Since the artifacts are named by their content, writing the same
+    replay twice (e.g., if the result processor crashes and redoes a
+    result) simply leaves the same files in place.
+    """
+    replay_hash = hashlib.sha256(raw).hexdigest()
+
+    path = Path(replays_root) / get_replay_relative_path(replay_hash)
+
+    if path.is_file():
+        return replay_hash
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    # The compressed versions are written first, so that once the
+    # raw version exists, all the others are guaranteed to exist too.
+    write_file_atomically(
+        Path(replays_root) / get_replay_relative_path(replay_hash, 'br'),
+        brotli.compress(raw)
+    )
+
+    write_file_atomically(
+        Path(replays_root) / get_replay_relative_path(replay_hash, 'gzip'),
+        gzip.compress(raw, compresslevel=9, mtime=0)
+    )
+
+    write_file_atomically(path, raw)
+
+    return replay_hash
+
+
+def remove_replay_artifact(replays_root, replay_hash):
+    """Remove a replay artifact, along with its precompressed versions, unless a game result still refers to it.
+
+    Notes
+    -----
+    The raw version is removed first, which keeps the guarantee
+    of write_replay_artifact(). In the unlikely case that another
+    result with the same content is saved meanwhile, its artifact
+    is rebuilt by ensure_replay_artifact() the next time it's read.
+    """
+    if GameResult.objects.filter(replay_hash=replay_hash).exists():
+        return
+
+    for encoding in [None, *REPLAY_ENCODINGS]:
+        path = Path(replays_root) / get_replay_relative_path(replay_hash, encoding)
+        path.unlink(missing_ok=True)
+
+
+def choose_replay_encoding(accept_encoding):
+    """Choose the most preferred replay encoding the client accepts, given its Accept-Encoding header.
+
+    Returns None if none of the precompressed versions are accepted.
+    """
+    accepted = set()
+    for item in accept_encoding.split(','):
+        coding, _, params = item.partition(';')
+
+        # Explicitly refused, e.g., 'br;q=0'.
+        if params.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+
+        accepted.add(coding.strip().lower())
+
+    for encoding in REPLAY_ENCODINGS:
+        if encoding in accepted:
+            return encoding
+
+    return None
+
+
+def get_replay_content_type(flow_format):
+    if flow_format == FlowFormats.ENCODED:
+        return 'application/octet-stream'
+    else:
+        return 'application/json'
+
+
+def store_game_result_flow(game_result, game_name, flow, replays_root):
+    """Set the flow of a game result in the format of its game, and write its replay artifact.
+
+    Parameters
+    ----------
+    game_result : GameResult
+        The game result to set the flow fields of; it won't be saved.
+
+    game_name : str
+        The name of the game (directory) of the fight.
+
+    flow : list
+        The flow, as reported by the simulator.
+
+    replays_root : Path
+        The root directory of the replay artifacts.
+
+    Notes
+    -----
+    The artifact is written before the game result is saved (by the
+    caller), so that a saved result never refers to a replay that
+    doesn't exist.
+    """
+    codec = FLOW_CODEC_INDEX.get(game_name)
+
+    if codec:
+        raw = codec.encode(flow)
+
+        game_result.flow_format = FlowFormats.ENCODED
+        game_result.flow = raw
+        game_result.data = ''
+    else:
+        data = json.dumps(flow)
+        raw = data.encode()
+
+        game_result.flow_format = FlowFormats.JSON
+        game_result.flow = None
+        game_result.data = data
+
+    # Back in the database, if it was archived.
+    game_result.archive_segment = ''
+    game_result.archive_offset = None
+    game_result.archive_length = None
+
+    game_result.replay_hash = write_replay_artifact(replays_root, raw)
+
+
+def get_archived_flow_cache_key(game_result_id):
+    return f'archived_flow_{game_result_id}'
+
+
+def get_stored_flow(game_result):
+    """Get the stored flow of a game result as bytes, in its flow format, wherever it's stored.
+
+    The game result must have the flow and the archive fields loaded.
+    The archived flows are read from their segment (and decompressed)
+    only when needed, and are cached.
+    """
+    if game_result.archive_segment:
+        return cache.get_or_set(
+            get_archived_flow_cache_key(game_result.id),
+            lambda: read_archived_flow(settings.ARCHIVES_ROOT,
+                                       game_result.archive_segment,
+                                       game_result.archive_offset,
+                                       game_result.archive_length),
+            timeout=settings.ARCHIVED_FLOW_CACHE_TIMEOUT
+        )
+
+    if game_result.flow_format == FlowFormats.ENCODED:
+        return bytes(game_result.flow)
+    else:
+        return game_result.data.encode()
+
+
+# The fields needed by get_stored_flow().
+STORED_FLOW_FIELDS = [
+    'flow_format',
+    'data',
+    'flow',
+    'archive_segment',
+    'archive_offset',
+    'archive_length'
+]
+
+
+def is_game_result_flow_outdated(game_name, flow_format, replay_hash):
+    """Tell whether a game result was saved before its game's current storage format (or the replay artifacts) existed."""
+    return not replay_hash or (
+        flow_format == FlowFormats.JSON and game_name in FLOW_CODEC_INDEX
+    )
+
+
+def migrate_game_result_flow(game_result_id, game_name, replays_root):
+    """Bring the flow of an outdated game result to its game's current storage format.
+
+    The old results are migrated lazily, when they're first read,
+    rather than all at once. An archived result is brought back to
+    the database upon migration, to be archived again later.
+
+    Returns
+    -------
+    GameResult
+        The migrated game result, with only the flow fields loaded.
+    """
+    with transaction.atomic():
+        # Locked, so that it isn't archived meanwhile.
+        game_result = GameResult.objects.select_for_update().only(
+            *STORED_FLOW_FIELDS,
+            'replay_hash'
+        ).get(id=game_result_id)
+
+        # It might have been migrated while we were waiting for the lock.
+        if not is_game_result_flow_outdated(game_name,
+                                            game_result.flow_format,
+                                            game_result.replay_hash):
+            return game_result
+
+        old_replay_hash = game_result.replay_hash
+
+        # The outdated results are always in JSON.
+        flow = json.loads(get_stored_flow(game_result))
+
+        store_game_result_flow(game_result, game_name, flow, replays_root)
+
+        game_result.save(update_fields=[*STORED_FLOW_FIELDS, 'replay_hash'])
+
+        # The JSON artifact (if any) would otherwise be left orphaned,
+        # since nothing refers to it anymore. It's removed only once
+        # the new hash is committed, and only if no other result (with
+        # the same content) still uses it.
+        if old_replay_hash and old_replay_hash != game_result.replay_hash:
+            transaction.on_commit(
+                lambda: remove_replay_artifact(replays_root, old_replay_hash)
+            )
+
+    return game_result
+
+
+def ensure_replay_artifact(game_result_id, replay_hash, replays_root):
+    """Write the replay artifact of a game result again from its stored flow, if it's missing.
+
+    This is for when the replays root is lost or restored partially
+    (e.g., from a backup); the artifacts can always be rebuilt from
+    the stored flows, be they in the database or archived.
+    """
+    if (Path(replays_root) / get_replay_relative_path(replay_hash)).is_file():
+        return
+
+    game_result = GameResult.objects.only(*STORED_FLOW_FIELDS).get(id=game_result_id)
+
+    write_replay_artifact(replays_root, get_stored_flow(game_result))
@@ -0,0 +1,230 @@
+import json
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from fights.models import Fight
+from gamespecs.models import GameInfo, GameResult
+from gamespecs.archive import (
+    ArchiveFormatError,
+    get_segment_path,
+    write_segment,
+    read_segment_index,
+    read_archived_flow,
+    archive_game_results
+)
+from gamespecs.replays import (
+    get_replay_relative_path,
+    write_replay_artifact,
+    get_stored_flow,
+    STORED_FLOW_FIELDS
+)
+
+# Cache
+FlowFormats = GameResult.FlowFormats
+
+
+class SegmentTest(SimpleTestCase):
+    RECORDS = [
+        (3, b'[1, 2, 3]'),
+        (7, b''),
+        (12, bytes(range(256)) * 40),
+    ]
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+
+        # Not created yet; write_segment() creates it.
+        self.archives_root = Path(tmp.name) / 'archives'
+
+    def test_round_trip(self):
+        segment, index = write_segment(self.archives_root, self.RECORDS)
+
+        self.assertEqual(read_segment_index(self.archives_root, segment), index)
+
+        for result_id, raw in self.RECORDS:
+            with self.subTest(result_id=result_id):
+                self.assertEqual(
+                    read_archived_flow(self.archives_root, segment, *index[result_id]),
+                    raw
+                )
+
+    def test_never_overwritten(self):
+        first, _ = write_segment(self.archives_root, self.RECORDS)
+        second, _ = write_segment(self.archives_root, self.RECORDS)
+
+        self.assertNotEqual(first, second)
+
+    def test_truncated(self):
+        segment, index = write_segment(self.archives_root, self.RECORDS)
+        path = get_segment_path(self.archives_root, segment)
+        content = path.read_bytes()
+
+        offset, length = index[12]
+
+        # Cut in the footer, in the index, in the last record, and
+        # before even a footer would fit.
+        for size in [len(content) - 1, offset + length + 5, offset + 10, 4]:
+            with self.subTest(size=size):
+                path.write_bytes(content[:size])
+
+                with self.assertRaises(ArchiveFormatError):
+                    read_segment_index(self.archives_root, segment)
+
+        path.write_bytes(content[:offset + 10])
+
+        # The records before the cut are still readable by their pointers.
+        self.assertEqual(read_archived_flow(self.archives_root, segment, *index[3]), b'[1, 2, 3]')
+
+        with self.assertRaises(ArchiveFormatError):
+            read_archived_flow(self.archives_root, segment, offset, length)
+
+    def test_corrupted(self):
+        segment, index = write_segment(self.archives_root, self.RECORDS)
+        path = get_segment_path(self.archives_root, segment)
+        content = bytearray(path.read_bytes())
+
+        offset, length = index[12]
+        index_offset = offset + length
+
+        # A broken record.
+        corrupted = content.copy()
+        corrupted[offset:offset + length] = b'\xff' * length
+        path.write_bytes(corrupted)
+
+        with self.assertRaises(ArchiveFormatError):
+            read_archived_flow(self.archives_root, segment, offset, length)
+
+        # A broken index.
+        corrupted = content.copy()
+        corrupted[index_offset] = ord('[')
+        path.write_bytes(corrupted)
+
+        with self.assertRaises(ArchiveFormatError):
+            read_segment_index(self.archives_root, segment)
+
+        # Not a segment at all.
+        corrupted = content.copy()
+        corrupted[-1] ^= 0xff
+        path.write_bytes(corrupted)
+
+        with self.assertRaises(ArchiveFormatError):
+            read_segment_index(self.archives_root, segment)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+)
+class ArchiveGameResultsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # No flow codec for this game; its flows stay in JSON.
+        cls.game = GameInfo.objects.create(
+            name='archive_test',
+            title='Archive Test',
+            short_description='',
+            conclusion_system=GameInfo.ConclusionSystems.VICTORY_DRAW,
+            has_scores=False,
+            min_players=2,
+            max_players=2,
+            documentation='',
+            slug='archive-test'
+        )
+
+    def setUp(self):
+        cache.clear()
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+
+        self.archives_root = Path(tmp.name) / 'archives'
+        self.replays_root = Path(tmp.name) / 'replays'
+
+        settings_override = override_settings(
+            ARCHIVES_ROOT=self.archives_root,
+            REPLAYS_ROOT=self.replays_root,
+            REPLAYS_ACCEL_REDIRECT_URL=''
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def create_result(self, finished_days_ago, flow_format, raw):
+        fight = Fight.objects.create(
+            game=self.game,
+            started_at=timezone.now() - timedelta(days=finished_days_ago, minutes=1),
+            finished_at=timezone.now() - timedelta(days=finished_days_ago)
+        )
+
+        return GameResult.objects.create(
+            fight=fight,
+            flow_format=flow_format,
+            data=raw.decode() if flow_format == FlowFormats.JSON else '',
+            flow=raw if flow_format == FlowFormats.ENCODED else None,
+            replay_hash=write_replay_artifact(self.replays_root, raw)
+        )
+
+    def test_archive_and_load(self):
+        flows = {
+            self.create_result(40, FlowFormats.JSON, json.dumps([{'tick': i}]).encode()).id:
+                json.dumps([{'tick': i}]).encode()
+            for i in range(3)
+        }
+        encoded = self.create_result(40, FlowFormats.ENCODED, b'\x01\x02\x00\xff')
+        flows[encoded.id] = b'\x01\x02\x00\xff'
+
+        recent = self.create_result(1, FlowFormats.JSON, b'[]')
+
+        # In two segments.
+        archived = archive_game_results(self.archives_root, timedelta(days=30), batch_size=3)
+        self.assertEqual(archived, 4)
+
+        results = GameResult.objects.only(*STORED_FLOW_FIELDS, 'replay_hash').in_bulk(flows)
+        self.assertEqual(len({r.archive_segment for r in results.values()}), 2)
+
+        for result_id, raw in flows.items():
+            result = results[result_id]
+
+            with self.subTest(result_id=result_id):
+                # Only in the archive now.
+                self.assertEqual(result.data, '')
+                self.assertIsNone(result.flow)
+
+                self.assertEqual(get_stored_flow(result), raw)
+
+                # The segment describes itself too.
+                self.assertEqual(
+                    read_segment_index(self.archives_root, result.archive_segment)[result_id],
+                    (result.archive_offset, result.archive_length)
+                )
+
+        recent.refresh_from_db()
+        self.assertEqual(recent.archive_segment, '')
+
+        # Nothing more to archive.
+        self.assertEqual(archive_game_results(self.archives_root, timedelta(days=30), batch_size=3), 0)
+
+    def test_replay_loaded_from_archive(self):
+        raw = json.dumps([{'tick': 0}]).encode()
+        result = self.create_result(40, FlowFormats.JSON, raw)
+
+        archive_game_results(self.archives_root, timedelta(days=30), batch_size=10)
+
+        # The replays root is lost; the artifact is rebuilt lazily,
+        # from the archive, when the replay is next read.
+        path = self.replays_root / get_replay_relative_path(result.replay_hash)
+        path.unlink()
+
+        response = self.client.get(
+            reverse('fight_replay', kwargs={'uuid': result.fight.uuid.hex}),
+            HTTP_ACCEPT_ENCODING='identity'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), raw)
+        self.assertEqual(path.read_bytes(), raw)
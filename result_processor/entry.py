@@ -19,6 +19,7 @@ WORKER_NAME = sys.argv[1]
 import redis.asyncio as redis
 import asyncio
 import json
+import time
 import importlib
 
 # Apparently the error class is from the sync version.
@@ -33,14 +34,19 @@ django.setup()
 
 
 from django.utils import timezone
-from django.db import transaction
+from django.conf import settings
+from django.db import transaction, models
 from asgiref.sync import sync_to_async
 
 from common.values import TerminationReasons
 from games._base.report import VictoryDrawResult
 
-from fights.models import Fight, PlayerFight
-from gamespecs.models import GameInfo, GameResult
+from fights.models import Fight, PlayerFight, FightSummary, OpenFightsCount
+from fights.stats import update_stats_for_fight
+from fights.perf import encode_perf_report
+from fights import events
+from gamespecs.models import GameInfo, GameResult, TrustedCode
+from gamespecs.replays import store_game_result_flow
 
 # Cache
 ConclusionSystems = GameInfo.ConclusionSystems
@@ -72,8 +78,29 @@ def save_to_db(fight, game_result, playerfights):
         'termination_reason_extra',
         'final_waitpid_state',
         'won_or_rank',
-        'score'
+        'score',
+        'perf_report'
     ])
+    
+    FightSummary.from_fight(fight, playerfights).save()
+    
+    # The house bots aren't counted (see CreateFightService).
+    OpenFightsCount.objects.add([pf.player_id for pf in playerfights if not pf.is_trusted], -1)
+    
+    update_stats_for_fight(fight.game, playerfights)
+
+
+async def publish_fight_finished(fight, playerfights):
+    await redis_client.publish(
+        events.FIGHT_FINISHED.format(fight_uuid=fight.uuid),
+        fight.uuid.hex
+    )
+    
+    for pf in playerfights:
+        await redis_client.publish(
+            events.PLAYER_FIGHT_FINISHED.format(user_id=pf.player_id),
+            fight.uuid.hex
+        )
 
 
 async def process(message):
@@ -85,16 +112,50 @@ async def process(message):
     report = data['report']
     final_states = data['final_states']
     
+    # Missing in the results of the older workers.
+    perf_reports = data.get('perf_reports')
+    
     fight = await Fight.objects.select_related(
         'game'
     ).only(
+        'uuid',  # for the signals and the summary
+        'is_public',  # for the summary
+        'finished_at',
+        
+        'game__name',  # for the flow's storage format
+        'game__title',  # for the summary
         'game__conclusion_system',
         'game__has_scores'
     ).aget(id=fight_id)
     
+    # Already processed (and committed) by a worker that died
+    # before acknowledging it; the result was then requeued.
+    if fight.finished_at is not None:
+        await redis_client.xack(global_config.REDIS_RESULT_PROCESSOR_STREAM,
+                                global_config.REDIS_RESULT_PROCESSOR_GROUP,
+                                message_id)
+        return
+    
     # The ordering is to know which index belongs to which player.
     # We cannot use .update() directly, as it doesn't support ordering.
-    playerfights = fight.playerfight_set.only('id').order_by('id')
+    # The player is only needed for the signals and the summary. The
+    # result fields are loaded (though they're set below) so that the
+    # stats can read them without hitting the database again.
+    playerfights = fight.playerfight_set.select_related(
+        'player'
+    ).only(
+        'id',
+        'player__username',
+        
+        'termination_reason',
+        'won_or_rank',
+        'score'
+    ).annotate(
+        # For the open fights counts; see save_to_db().
+        is_trusted=models.Exists(
+            TrustedCode.objects.filter(code_id=models.OuterRef('code_id'))
+        )
+    ).order_by('id')
     
     if fight.game.has_scores:
         result, scores, explanation, data = report
@@ -108,6 +169,9 @@ async def process(message):
     async for pf in playerfights:
         fs = final_states[index]
         
+        if perf_reports is not None:
+            pf.perf_report = encode_perf_report(perf_reports[index])
+        
         if fs == 0:
             pf.final_waitpid_state = 0
         else:  # the player was terminated.
@@ -153,21 +217,60 @@ async def process(message):
     game_result = GameResult(
         fight=fight,
         explanation=(json.dumps(explanation) if explanation else ''),
-        data=json.dumps(data)  # may never be empty
     )
     
+    # Encodes the flow and writes its replay artifact (to the disk).
+    await asyncio.to_thread(store_game_result_flow,
+                            game_result,
+                            fight.game.name,
+                            data,
+                            settings.REPLAYS_ROOT)
+    
     await sync_to_async(save_to_db)(fight, game_result, playerfights)
     
+    # The transaction is committed at this point, so whoever gets
+    # these signals will find the results in the database.
+    await publish_fight_finished(fight, playerfights)
+    
     await redis_client.xack(global_config.REDIS_RESULT_PROCESSOR_STREAM,
                             global_config.REDIS_RESULT_PROCESSOR_GROUP,
                             message_id)
 
 
 
+async def requeue(message):
+    """Put a pending result (of any worker) back in the stream, or in the dead-letter stream after too many attempts.
+    
+    The same as requeue() in simulator/entry.py.
+    """
+    message_id, fields = message
+    
+    stream = global_config.REDIS_RESULT_PROCESSOR_STREAM
+    group = global_config.REDIS_RESULT_PROCESSOR_GROUP
+    
+    # Entries trimmed from the stream while pending.
+    if not fields:
+        await redis_client.xack(stream, group, message_id)
+        return
+    
+    attempts = int(fields.get('attempts', 0)) + 1
+    
+    async with redis_client.pipeline(transaction=True) as pipe:
+        if attempts >= global_config.MAX_DELIVERY_ATTEMPTS:
+            pipe.xadd(global_config.REDIS_RESULT_PROCESSOR_DEAD_LETTER_STREAM,
+                      {**fields, 'attempts': attempts})
+        else:
+            pipe.xadd(stream, {**fields, 'attempts': attempts})
+        
+        pipe.xack(stream, group, message_id)
+        await pipe.execute()
+
+
 async def process_unacked():
     # The worker might crash while some results have not
     # been acknowledged yet (which shouldn't really be
-    # more than one per worker). We redo those simulations.
+    # more than one per worker). Those are requeued right
+    # away, rather than waiting for a reclaim.
     unacked = (await redis_client.xreadgroup(
             groupname=global_config.REDIS_RESULT_PROCESSOR_GROUP,
             consumername=WORKER_NAME,
@@ -175,21 +278,45 @@ async def process_unacked():
     ))[0][1]  # get for the one and only relevant stream.
 
     for msg in unacked:
-        await process(msg)
+        await requeue(msg)
+
+
+async def reclaim_stuck():
+    """Requeue the results that have been pending for too long, e.g., with a worker that died."""
+    _, claimed, *_ = await redis_client.xautoclaim(
+        global_config.REDIS_RESULT_PROCESSOR_STREAM,
+        global_config.REDIS_RESULT_PROCESSOR_GROUP,
+        WORKER_NAME,
+        min_idle_time=settings.RESULT_RECLAIM_MIN_IDLE * 1000,
+        count=settings.RESULT_RECLAIM_BATCH_SIZE
+    )
+    
+    for msg in claimed:
+        await requeue(msg)
 
 
 async def process_forever():
+    last_reclaimed = 0
+    
     while True:
-        query = (await redis_client.xreadgroup(
+        if time.monotonic() - last_reclaimed >= settings.RESULT_RECLAIM_INTERVAL:
+            await reclaim_stuck()
+            last_reclaimed = time.monotonic()
+        
+        query = await redis_client.xreadgroup(
             groupname=global_config.REDIS_RESULT_PROCESSOR_GROUP,
             consumername=WORKER_NAME,
             streams={global_config.REDIS_RESULT_PROCESSOR_STREAM: '>'},  # only the new messages
-            block=0,  # block until a new message arrives.
+            # Not forever, so that we get to reclaim the stuck results.
+            block=settings.RESULT_RECLAIM_INTERVAL * 1000,
             count=1
-        ))[0]  # get for the one and only relevant stream.
-                
-        # Process the one and only message.
-        await process(query[1][0])
+        )
+        
+        if not query:
+            continue
+        
+        # Process the one and only message (of the one and only stream).
+        await process(query[0][1][0])
 
 
 async def main():
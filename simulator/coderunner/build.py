@@ -11,6 +11,8 @@ INCLUDED_SETTINGS = [
     
     'SECCOMP_ALLOWED_SYSCALLS',
     
+    'PRELOAD_PROFILES',
+    
     'CPU_TIME_EXCEED_SIGNAL',
     
     # -------- Control codes --------
@@ -28,6 +28,8 @@ from settings import (
     
     SECCOMP_ALLOWED_SYSCALLS,
     
+    PRELOAD_PROFILES,
+    
     CPU_TIME_EXCEED_SIGNAL,
     
     # -------- Control codes --------
@@ -44,33 +46,27 @@ from settings import (
 )
 
 
+# The one and only argument is the name of the preload profile of
+# this forkserver (see PRELOAD_PROFILES in the simulator settings).
+if len(sys.argv) != 2 or sys.argv[1] not in PRELOAD_PROFILES:
+    _exit(1)
+
+PROFILE = sys.argv[1]
+
+
+# The numeric libraries start a pool of threads upon being imported,
+# which wouldn't survive the fork() (and the children can't make any
+# threads anyway), so they're kept to the main thread.
+for _var in ('OPENBLAS_NUM_THREADS', 'OMP_NUM_THREADS', 'MKL_NUM_THREADS'):
+    os.environ[_var] = '1'
+
 # These modules must be imported before applying seccomp rules,
 # since there is a good change they won't be imported after, since
 # we can no more access their source file. Note that AppArmor
 # makes no problem here, since, in the profile, we allow access
-# to all the builtin python library source files.
-PRELOADED_MODULES = [
-    'math',
-    'cmath',
-    'decimal',
-    'random',
-    'statistics',
-    
-    'collections',
-    'heapq',
-    'queue',
-    'bisect',
-    'graphlib',
-    
-    'enum',
-    'functools',
-    'itertools',
-    'dataclasses',
-    
-    'uuid',
-    'copy',
-    'difflib',
-]
+# to all the builtin python library source files (and all the
+# packages installed for the interpreter).
+PRELOADED_MODULES = list(PRELOAD_PROFILES[PROFILE]['modules'])
 
 for pm in PRELOADED_MODULES:
     sys.modules[pm] = __import__(pm)
@@ -79,6 +75,13 @@ for pm in PRELOADED_MODULES:
 REQUIRED_MODULES = PRELOADED_MODULES + ['builtins', '__main__']
 
 
+def is_module_required(name):
+    # The submodules of the preloaded modules are kept too, as
+    # a package (e.g., numpy) might import its own submodules
+    # in its functions, rather than upon being imported.
+    return name in REQUIRED_MODULES or name.split('.')[0] in PRELOADED_MODULES
+
+
 def build_talker(read_fd, write_fd): 
     # The reason we use closefd=False here is to prevent the forked children
     # from attempting to close the fd's of the forkserver's streams upon
@@ -113,12 +116,13 @@ def build_talker(read_fd, write_fd):
 
 def child():
     # We'll delete these, so we need to 'global' them.
-    global print, input, open, exit, quit, sys, PRELOADED_MODULES
+    global print, input, open, exit, quit, sys
     
     # Keep these before deleting the globals.
     jloads = json.loads
     jdumps = functools.partial(json.dumps, separators=(',', ':'), ensure_ascii=True)
     gcollect = gc.collect
+    scrubbed_globals = SCRUBBED_GLOBALS
     
     # Close all the fds that were inherited from the parent.
     # This should be done before dup2()ing the child fd's,
@@ -167,53 +171,36 @@ def child():
                                   0, 0, data['cpu_sec'], data['cpu_nsec']) != 0:
         _exit(1)
     
-    if tracee.apply_seccomp(SECCOMP_ALLOWED_SYSCALLS) != 0:
+    if tracee.apply_seccomp(SECCOMP_ALLOWED_SYSCALLS[PROFILE]) != 0:
         _exit(1)
     
 
-    # This prevents unallowed modules from being 'import'ed later.
-    # Still, there are ways around this. For example, see:
-    #  * https://stackoverflow.com/questions/33880646/access-module-sys-without
-    # Again, this is just an added security, and NOT reliable on its own.
-    # TODO: Maybe this really gives us no advantage at all. Check
-    # and research later as to whether I should keep this. By the way,
-    # note that seccomp will also disallows importing from source files.
-    # Also I'm assuming that the preloaded modules either don't import
-    # any other modules, or if they do, they can work without them.
-    # I feel like just by accessing the module 'sys' one can somehow
-    # refersh/load modules. I'm still unsure. Check later.
-    module_names = list(sys.modules.keys())
-    module_names.remove('sys')  # need it yet; will del later.
-    for k in module_names:
-        if k not in REQUIRED_MODULES:
-            sys.modules[k] = None
-    
+    # The unallowed modules have already been removed from sys.modules
+    # by the forkserver (see below), which prevents them from being
+    # 'import'ed later. Only 'sys' is left, which we remove at the end.
     
     # We just get rid of the names, and remove their objects through
     # gc. This is just to make it more secure, but we CANNOT solely
-    # rely on it to for security.
-    for g in list(globals().keys()):
-        if g not in ('__builtins__', '_exit', 'PRELOADED_MODULES', 'sys') and  \
-            g not in PRELOADED_MODULES and  \
-            not g.startswith('CC_C_'):  # Keep the control codes
-                del globals()[g]
-    
-    del PRELOADED_MODULES
+    # rely on it to for security. The names are listed once by the
+    # forkserver, so that we don't go over all the globals here.
+    for g in scrubbed_globals:
+        del globals()[g]
     
     
     # Local variables in Python are stored in arrays
     # rather than a dictionary, as an optimization; so
     # we have to take care of the local variables the
     # manual way.
-    del module_names
-    del g, k, _fd  # loop objects
+    del scrubbed_globals
+    del g, _fd  # loop objects
     del r, _w, _r, w
     del data
     
+    # Since the forkserver froze its objects (see below),
+    # this only goes over the objects made in this child.
     gcollect()
     del gcollect
     
-    sys.modules['gc'] = None
     sys.modules['sys'] = None
     del sys
     
@@ -295,10 +282,56 @@ def child():
     # here to avoid looking them up again.
     resolved_names = {}
     
+    # The args of the delta commands, by the function name. The game
+    # sends the args as a whole ('s') on the first call, and only the
+    # changes ('d') on the later ones. These are applied to a master
+    # copy, which the player never sees; the args given to the player
+    # are then brought up to date with it in place, so that the player
+    # gets the same objects on each call, and can't throw them off by
+    # changing them. Must be kept in sync with games/_base/delta.py.
+    kept_args = {}
+    given_args = {}
+    
+    def clone(value):
+        if type(value) in (dict, list):
+            return jloads(jdumps(value))
+        return value
+    
     while True:
         cmd = jloads(recv())
         
-        func_name, args = cmd['f'], cmd['args']
+        func_name = cmd['f']
+        
+        if 'd' in cmd:
+            args = kept_args.get(func_name)
+            if args is None:
+                _exit(1)  # Will be killed by seccomp or tracer.
+            
+            for index, key, value in cmd['d']:
+                if key is None:
+                    args[index] = value
+                else:
+                    args[index][key] = value
+            
+            given = given_args[func_name]
+            for index, arg in enumerate(args):
+                old = given[index]
+                if old == arg:
+                    continue
+                
+                if type(old) is dict and type(arg) is dict and old.keys() == arg.keys():
+                    for key, value in arg.items():
+                        if old[key] != value:
+                            old[key] = clone(value)
+                else:
+                    given[index] = clone(arg)
+            
+            args = given
+        elif 's' in cmd:
+            kept_args[func_name] = cmd['s']
+            args = given_args[func_name] = clone(cmd['s'])
+        else:
+            args = cmd['args']
         
         f = resolved_names.get(func_name, None)
         
@@ -378,6 +411,50 @@ if __name__ == '__main__':
     # FORKSERVER_PIPES_FDS['r'] and FORKSERVER_PIPES_FDS['w'],
     # which MUST be closed by the children in the beginning.
     
+    
+    # The part of the scrubbing of the children that doesn't depend on
+    # the child is done here, once, rather than in each child. Besides
+    # the setup time of the children, this is for their memory: a child
+    # shares the memory pages of the forkserver until it writes to them,
+    # and touching an object (even just changing its refcount, or a pass
+    # of the gc over it) writes to its page.
+    
+    # This prevents unallowed modules from being 'import'ed later.
+    # Still, there are ways around this. For example, see:
+    #  * https://stackoverflow.com/questions/33880646/access-module-sys-without
+    # Again, this is just an added security, and NOT reliable on its own.
+    # TODO: Maybe this really gives us no advantage at all. Check
+    # and research later as to whether I should keep this. By the way,
+    # note that seccomp will also disallows importing from source files.
+    # Also I'm assuming that the preloaded modules either don't import
+    # any other modules, or if they do, they can work without them.
+    # I feel like just by accessing the module 'sys' one can somehow
+    # refersh/load modules. I'm still unsure. Check later.
+    #
+    # The forkserver doesn't import anything from here on either, and
+    # the modules it uses are kept alive by its globals. 'sys' is still
+    # needed by the children; they remove it themselves.
+    sys.modules.update({
+        k: None for k in sys.modules
+        if not is_module_required(k) and k != 'sys'
+    })
+    
+    # The globals that the children delete. All of them must exist in
+    # the children, so the names of the loop below are added by hand.
+    SCRUBBED_GLOBALS = tuple(
+        g for g in globals()
+        if g not in ('__builtins__', '_exit', 'sys') and  \
+            g not in PRELOADED_MODULES and  \
+            not g.startswith('CC_C_')  # Keep the control codes
+    ) + ('SCRUBBED_GLOBALS', 'cmd', 'res')
+    
+    # Collect what's garbage by now (e.g., the modules removed above),
+    # and move the rest out of the reach of the gc for good, so that the
+    # gc passes (of the children, or of the forkserver itself) never go
+    # over them again.
+    gc.collect()
+    gc.freeze()
+    
     while True:
         cmd = recv()
         
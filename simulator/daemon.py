@@ -2,58 +2,173 @@ import os
 import sys
 import importlib
 import subprocess
-import signal
 import atexit
+import functools
+import json
+import time
 from pathlib import Path
 
+import redis
+
 # The config file can be either inside the docker container
 # as a docker config, or out of docker in the project root.
 # This is so that we can run this both with and without docker.
 os.environ.setdefault('GLOBAL_CONFIG_MODULE', 'config')
 
+os.environ.setdefault('SIMULATOR_SETTINGS_MODULE', 'simulator.settings')
+
+settings = importlib.import_module(os.environ.get('SIMULATOR_SETTINGS_MODULE'))
 global_config = importlib.import_module(os.environ.get('GLOBAL_CONFIG_MODULE'))
 
+from simulator.placement import (
+    assign_worker_cpus,
+    read_cpu_times,
+    get_cpu_usage
+)
+
 
 WORKER_NAME_FORMAT = global_config.WORKER_NAME_FORMATS['simulator']
 
 BASE_DIR = Path(__file__).parent.parent
 
 
-workers = []
-
-
-@atexit.register
-def end_all(*args, **kwargs):
-    for w in workers:
-        w.kill()  # will not error even if already dead
-
-
-# If one worker dies, kill all of them. Basically
-# there should be no occasion when a worker exits
-# on its own. If so, that's a serious bug.
-signal.signal(signal.SIGCHLD, end_all)
-
-
-if __name__ == '__main__':
-    for i in range(1, global_config.WORKERS['simulator']+1):
-        worker_name = WORKER_NAME_FORMAT.format(i)
+# A worker, restarted on its own when it exits. There should be no
+# occasion when a worker exits on its own; if so, that's a serious
+# bug, but the rest of the workers don't have to go down with it.
+# The simulations left pending by it are requeued by itself when it
+# restarts (see entry.py), and the worker's forkserver containers are
+# removed along with it, as they're killed once it's gone.
+class Worker:
+    def __init__(self, name, pool_name, cpus):
+        self.name = name
+        self.pool_name = pool_name
+        self.cpus = cpus
+        
+        self.process = None
+        self.started_at = None
         
-        workers.append(subprocess.Popen(
+        # When the worker is to be restarted, if it's exited.
+        self.restart_at = None
+        self.backoff = settings.WORKER_RESTART_BACKOFF['MIN']
+    
+    def start(self):
+        self.process = subprocess.Popen(
             [
                 sys.executable,
                 '-m',
                 'simulator.entry',
-                worker_name
+                self.name,
+                self.pool_name
             ],
-            
+        
             # So that we can run the entry.py script through its parent
             # directory name. This way the modules in this level will
             # also be accessible for import to the script.
             cwd=BASE_DIR,
+        
+            stderr=sys.stderr,
+            
+            # Pinned before it starts, so that everything it starts
+            # (i.e., the forkserver containers; see entry.py) can be
+            # pinned to the same CPUs.
+            preexec_fn=(functools.partial(os.sched_setaffinity, 0, self.cpus)
+                        if self.cpus is not None else None)
+        )
+        
+        self.started_at = time.monotonic()
+        self.restart_at = None
+    
+    def check(self):
+        """Restart the worker if it's exited and its delay is over."""
+        now = time.monotonic()
+        
+        if self.restart_at is None:
+            returncode = self.process.poll()
+            if returncode is None:
+                return
+            
+            if now - self.started_at >= settings.WORKER_RESTART_BACKOFF['RESET_AFTER']:
+                self.backoff = settings.WORKER_RESTART_BACKOFF['MIN']
             
-            stderr=sys.stderr
-        ))
+            print(f'The simulator worker {self.name} has exited with code '
+                  f'{returncode}; restarting it in {self.backoff} seconds.',
+                  file=sys.stderr)
+            
+            self.restart_at = now + self.backoff
+            self.backoff = min(self.backoff * 2, settings.WORKER_RESTART_BACKOFF['MAX'])
+        
+        if now >= self.restart_at:
+            self.start()
 
 
-# Exit with literally any signal.
-signal.pause()
+workers = []
+
+
+@atexit.register
+def end_all(*args, **kwargs):
+    for w in workers:
+        w.process.kill()  # will not error even if already dead
+
+
+def report_cpu_usage(redis_client, usage, worker_cpus):
+    workers_of_cpu = {}
+    for worker_name, cpus in worker_cpus.items():
+        for cpu in cpus:
+            workers_of_cpu.setdefault(cpu, []).append(worker_name)
+    
+    with redis_client.pipeline() as pipe:
+        pipe.delete(global_config.REDIS_SIMULATOR_CPU_USAGE_KEY)
+        pipe.hset(global_config.REDIS_SIMULATOR_CPU_USAGE_KEY, mapping={
+            cpu: json.dumps({'usage': round(u, 3),
+                             'workers': workers_of_cpu.get(cpu, [])})
+            for cpu, u in usage.items()
+        })
+        pipe.execute()
+
+
+if __name__ == '__main__':
+    worker_names = [
+        (pool_name, WORKER_NAME_FORMAT.format(pool=pool_name, index=i))
+        for pool_name, pool in global_config.SIMULATOR_POOLS.items()
+        for i in range(1, pool['workers']+1)
+    ]
+    
+    placement = global_config.SIMULATOR_CPU_PLACEMENT
+    
+    if placement is not None:
+        worker_cpus, is_shared = assign_worker_cpus(
+            [name for _, name in worker_names],
+            os.sched_getaffinity(0),
+            placement['RESERVED_CPUS'],
+            placement['CPUS_PER_WORKER']
+        )
+        
+        if is_shared:
+            print('There are not enough CPUs for the simulator workers '
+                  'to each have their own; some will share theirs.',
+                  file=sys.stderr)
+    else:
+        worker_cpus = {}
+    
+    for pool_name, worker_name in worker_names:
+        worker = Worker(worker_name, pool_name, worker_cpus.get(worker_name))
+        worker.start()
+        workers.append(worker)
+    
+    redis_client = redis.from_url(global_config.REDIS_SERVER_URL,
+                                  decode_responses=True)
+    
+    # Runs until a signal (with the default action) ends this process.
+    cpu_times = read_cpu_times()
+    cpu_times_read_at = time.monotonic()
+    while True:
+        time.sleep(settings.DAEMON_POLL_INTERVAL)
+        
+        for worker in workers:
+            worker.check()
+        
+        if time.monotonic() - cpu_times_read_at >= global_config.SIMULATOR_CPU_USAGE_INTERVAL:
+            new_cpu_times = read_cpu_times()
+            report_cpu_usage(redis_client, get_cpu_usage(cpu_times, new_cpu_times), worker_cpus)
+            cpu_times = new_cpu_times
+            cpu_times_read_at = time.monotonic()
@@ -9,9 +9,11 @@ if __name__ != '__main__':
 if os.getuid() != 0:
     exit(1)
 
-# The one and only argument must be the worker name,
-# which will also be used as the redis consumer name.
-if len(sys.argv) != 2:
+# The arguments are the worker name, which will also be
+# used as the redis consumer name, and optionally the name
+# of the pool of the worker (see common.pools); it's the
+# default pool if not given.
+if len(sys.argv) not in (2, 3):
     exit(1)
 
 WORKER_NAME = sys.argv[1]
@@ -27,8 +29,21 @@ from pathlib import Path
 import importlib
 import functools
 import json
+import time
+from collections import deque
 from json.decoder import JSONDecodeError
 from common.values import TerminationReasons
+from games._base.delta import get_args_delta
+from simulator.placement import get_own_cpuset
+from simulator.lanes import LaneScheduler
+from simulator.trusted import TrustedCRController
+from common.trusted import is_trusted_code
+from common.pools import (
+    get_default_pool_name,
+    get_pool_game_names,
+    get_pool_streams,
+    get_pool_key
+)
 
 # The C extension for managing the tracer.
 from simulator.extensions.build import tracer
@@ -71,6 +86,10 @@ settings = importlib.import_module(os.environ.get('SIMULATOR_SETTINGS_MODULE'))
 global_config = importlib.import_module(os.environ.get('GLOBAL_CONFIG_MODULE'))
 
 
+POOLS = global_config.SIMULATOR_POOLS
+POOL_NAME = sys.argv[2] if len(sys.argv) == 3 else get_default_pool_name(POOLS)
+
+
 # We'll want everything in text form, so enable auto-decoding.
 redis_client = redis.from_url(global_config.REDIS_SERVER_URL,
                               decode_responses=True)
@@ -108,6 +127,7 @@ logging.basicConfig(
 
 logging.info('Simulation worker started.')
 logging.info(f'> worker pid: {os.getpid()}')
+logging.info(f'> worker pool: {POOL_NAME}')
 
 
 # Note:
@@ -132,12 +152,17 @@ def write_error_with_log(s):
 sys.stderr.write = write_error_with_log
 
 
-# Import/load all the game classes, so they are
-# all ready when needed to be accessed. We import
-# the module separately so that we can use reload()
-# on it.
+# Import/load the game classes of the pool (and only
+# those), so they are all ready when needed to be
+# accessed. We import the module separately so that
+# we can use reload() on it.
+def load_pool_game_classes():
+    return games_index.load_game_classes(
+        get_pool_game_names(POOLS, POOL_NAME, games_index.GAME_CLASS_PATHS)
+    )
+
 games_index = importlib.import_module(settings.GAMES_INDEX_MODULE)
-GAME_CLASSES = games_index.GAME_CLASSES
+GAME_CLASSES = load_pool_game_classes()
 
 logging.info('Game classes have been loaded.')
 logging.info(f'> games list: {list(GAME_CLASSES.keys())}')
@@ -149,7 +174,7 @@ def reload_game_classes(*args, **kwargs):
     global GAME_CLASSES
     
     importlib.reload(games_index)
-    GAME_CLASSES = games_index.GAME_CLASSES
+    GAME_CLASSES = load_pool_game_classes()
     
     logging.info('Game classes have been refreshed by a '
                  f'{settings.GAME_CLASSES_RELOAD_SIGNAL.name}.')
@@ -178,10 +203,7 @@ tracer.set_forked_pipe_fds(settings.FORKED_PIPES_FDS['r'],
 tracer.set_forkserver_pipe_fds(settings.FORKSERVER_PIPES_FDS['r'],
                                settings.FORKSERVER_PIPES_FDS['w'])
 
-# Also defined in coderunner/run.py. Note that the
-# version here MUST NOT contain the read() or the
-# write() syscalls, whereas the one in run.py must.
-tracer.set_allowed_syscalls(settings.PTRACE_ALLOWED_SYSCALLS)
+# The allowed syscalls are set by the preload profile; see use_profile().
 
 tracer.set_write_max_bytes(settings.CHILD_MAX_WRITE_SIZE)
 
@@ -225,93 +247,232 @@ class StreamTalker:
         return res[:-1]
 
 
+# The forkservers, by the preload profile (see PRELOAD_PROFILES in the
+# settings). Each is a container of its own, started when a game of its
+# profile is first simulated (or upon starting, for the current games).
+class ForkServer:
+    def __init__(self, profile, container, pid, talker):
+        self.profile = profile
+        self.container = container
+        self.pid = pid
+        
+        # lookup once
+        self.send = talker.send
+        self.recv = talker.recv
+
+
+# The forkserver containers are labeled with the name of their worker.
+#
+# Those of a previous run of this worker (e.g., before it was restarted
+# by the daemon) can't be reused: their forkservers are killed as soon
+# as the worker tracing them is gone (see PTRACE_O_EXITKILL below), and
+# it must be so, since their children could be left running untraced
+# otherwise. Such containers are removed on their own once they exit,
+# but in case any is left (e.g., if the Docker daemon was restarted in
+# the meantime), they're removed here as the worker starts.
+FORKSERVER_CONTAINER_LABEL = 'codefights.simulator_worker'
+
+def remove_leftover_forkservers():
+    for container in docker_client.containers.list(
+        all=True,
+        filters={'label': f'{FORKSERVER_CONTAINER_LABEL}={WORKER_NAME}'}
+    ):
+        logging.warning(f'Removing a leftover forkserver container: {container.id}')
+        container.remove(force=True)
+
+
 # If anything fails for the forkserver in the beginning, we
 # won't log it directly, and rather let it simply error and exit.
 # It will actually be logged as part of the stderr.
+def start_forkserver(profile):
+    # fs: forkserver
+    fs_container = docker_client.containers.run(
+        global_config.SIMULATOR_CODERUNNER['DOCKER_IMAGE'],
+        # The argument of the forkserver.
+        command=[profile],
+        detach=True,
+        user=pwd.getpwnam(global_config.SIMULATOR_CODERUNNER['USERNAME']).pw_uid,
+        security_opt=[
+            f"apparmor={global_config.SIMULATOR_CODERUNNER['DOCKER_APPARMOR_PROFILE']}"
+        ],
+        read_only=True,
+        labels={FORKSERVER_CONTAINER_LABEL: WORKER_NAME},
+        auto_remove=True,
+        # The pool's limit on the CPUs, if any.
+        **({'nano_cpus': int(POOLS[POOL_NAME]['cpus'] * 1e9)}
+           if POOLS[POOL_NAME].get('cpus') else {}),
+        # On the CPUs this worker is pinned to by the daemon,
+        # along with the coderunner children, if placed.
+        **({'cpuset_cpus': get_own_cpuset()}
+           if global_config.SIMULATOR_CPU_PLACEMENT is not None else {})
+    )
 
-# fs: forkserver
-fs_container = docker_client.containers.run(
-    global_config.SIMULATOR_CODERUNNER['DOCKER_IMAGE'],
-    detach=True,
-    user=pwd.getpwnam(global_config.SIMULATOR_CODERUNNER['USERNAME']).pw_uid,
-    security_opt=[
-        f"apparmor={global_config.SIMULATOR_CODERUNNER['DOCKER_APPARMOR_PROFILE']}"
-    ],
-    read_only=True,
-)
+    logging.info(f"Forkserver container started for the '{profile}' preload profile.")
+    logging.info(f'> forkserver container id: {fs_container.attrs["Id"]}')
+
+    # The forkserver must be the one and only process of the
+    # container, namely, the PID 1 (the init process) in the
+    # PID namespace of the container.
+    _fs_top = fs_container.top()
+    fs_pid = int(_fs_top['Processes'][0][_fs_top['Titles'].index('PID')])
+
+    logging.info(f'> forkserver pid: {fs_pid}')
+
+
+    # Attach to the forkserver and wait for it to stop.
+    #
+    # By tracing the forkserver, we are achieving four goals:
+    #
+    #   1) We can trace the forked children right from the beginning
+    #      when they get forked, thanks to PTRACE_O_TRACEFORK.
+    #   2) We can get the PID of forked children in the host's
+    #      PID namespace without having to resort to "docker top"
+    #      or similar things.
+    #   3) By setting the ptrace option PTRACE_O_EXITKILL, if this
+    #      process (the tracer) dies, the forkserver will also die,
+    #      and since it's the init process of the container, this
+    #      will also cause the forked children to die (we set the
+    #      EXITKILL option on the forked children too, but that is
+    #      not enough since the tracer might die before we set this
+    #      option on the forked child).
+    #   4) We wait for the forkserver to set up its pipe before we
+    #      try and communicate with it. This is done by waiting for
+    #      the first read() call of the forkserver on its side of
+    #      the pipe that it created (which we use the fd 0 for that).
+    #      the forkserver does this read after creating its pipes.
+    #      Note that the forkserver most likely does not even has
+    #      the fd 0 open by default (because we have not set the
+    #      option stdin_open=True for the container); instead, it
+    #      uses dup2() to make the fd's 0 and 1 to the proper ends
+    #      of the pipes it created.
+    #
+    # This doesn't really affect the performace, because we don't
+    # trace the syscalls or CPU instructions of the forkserver after
+    # the pipe initialization phase (where we need to trace the
+    # forkserver to see when read() is called); we only trace the
+    # fork events, and the signals it gets.
+    tracer.forkserver_attach(fs_pid)
+
+    # After the first read, the forkserver should have set up its
+    # pipes, so that we can pidfd_getfd() them after this.
+    tracer.forkserver_wait_first_read(fs_pid)
+
+    fs_pidfd = os.pidfd_open(fs_pid)
+    fs_read_fd = tracer.pidfd_getfd(fs_pidfd, settings.FORKSERVER_PIPES_FDS['_r'])
+    fs_write_fd = tracer.pidfd_getfd(fs_pidfd, settings.FORKSERVER_PIPES_FDS['_w'])
+
+    fs_talker = StreamTalker.from_fd(fs_read_fd, fs_write_fd, 
+                                     ForkServer_UnknownKill)
+
+    fs_talker.send(settings.CC_F_CONTINUE)
+
+    logging.info('Successfully connected to the forkserver pipes.')
+    
+    return ForkServer(profile, fs_container, fs_pid, fs_talker)
+
+
+forkservers = {}
 
-logging.info('Forkserver container started.')
-logging.info(f'> forkserver container id: {fs_container.attrs["Id"]}')
+# The profile of the children being traced, whose syscalls are
+# the ones allowed by the tracer.
+current_profile = None
 
-# The forkserver must be the one and only process of the
-# container, namely, the PID 1 (the init process) in the
-# PID namespace of the container.
-_fs_top = fs_container.top()
-fs_pid = int(_fs_top['Processes'][0][_fs_top['Titles'].index('PID')])
+def use_profile(profile):
+    """Get the forkserver of a preload profile, and let the tracer allow the syscalls of its children."""
+    global current_profile
+    
+    if profile not in forkservers:
+        forkservers[profile] = start_forkserver(profile)
+    
+    # Also defined in coderunner/run.py. Note that the
+    # version here MUST NOT contain the read() or the
+    # write() syscalls, whereas the one in run.py must.
+    if profile != current_profile:
+        tracer.set_allowed_syscalls(settings.PTRACE_ALLOWED_SYSCALLS[profile])
+        current_profile = profile
+    
+    return forkservers[profile]
 
-logging.info(f'> forkserver pid: {fs_pid}')
+remove_leftover_forkservers()
 
+for _profile in sorted({g.PRELOAD_PROFILE for g in GAME_CLASSES.values()}):
+    use_profile(_profile)
 
-# Attach to the forkserver and wait for it to stop.
-#
-# By tracing the forkserver, we are achieving four goals:
-#
-#   1) We can trace the forked children right from the beginning
-#      when they get forked, thanks to PTRACE_O_TRACEFORK.
-#   2) We can get the PID of forked children in the host's
-#      PID namespace without having to resort to "docker top"
-#      or similar things.
-#   3) By setting the ptrace option PTRACE_O_EXITKILL, if this
-#      process (the tracer) dies, the forkserver will also die,
-#      and since it's the init process of the container, this
-#      will also cause the forked children to die (we set the
-#      EXITKILL option on the forked children too, but that is
-#      not enough since the tracer might die before we set this
-#      option on the forked child).
-#   4) We wait for the forkserver to set up its pipe before we
-#      try and communicate with it. This is done by waiting for
-#      the first read() call of the forkserver on its side of
-#      the pipe that it created (which we use the fd 0 for that).
-#      the forkserver does this read after creating its pipes.
-#      Note that the forkserver most likely does not even has
-#      the fd 0 open by default (because we have not set the
-#      option stdin_open=True for the container); instead, it
-#      uses dup2() to make the fd's 0 and 1 to the proper ends
-#      of the pipes it created.
-#
-# This doesn't really affect the performace, because we don't
-# trace the syscalls or CPU instructions of the forkserver after
-# the pipe initialization phase (where we need to trace the
-# forkserver to see when read() is called); we only trace the
-# fork events, and the signals it gets.
-tracer.forkserver_attach(fs_pid)
 
-# After the first read, the forkserver should have set up its
-# pipes, so that we can pidfd_getfd() them after this.
-tracer.forkserver_wait_first_read(fs_pid)
+def get_memory_usage(pid):
+    """Get the PSS and the USS of a process, in bytes, or None if it can't be read.
+    
+    The PSS counts the pages shared with other processes (e.g., with the
+    forkserver) in proportion, and the USS only counts the pages of the
+    process's own. See smaps_rollup in proc(5).
+    """
+    usage = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ('Pss', 'Private_Clean', 'Private_Dirty'):
+                    usage[key] = int(value.split()[0]) * 1024  # in kB
+    # The process is gone (its smaps are empty if it's a zombie).
+    except OSError:
+        return None
+    
+    if len(usage) != 3:
+        return None
+    
+    return {'pss': usage['Pss'],
+            'uss': usage['Private_Clean'] + usage['Private_Dirty']}
+
 
-fs_pidfd = os.pidfd_open(fs_pid)
-fs_read_fd = tracer.pidfd_getfd(fs_pidfd, settings.FORKSERVER_PIPES_FDS['_r'])
-fs_write_fd = tracer.pidfd_getfd(fs_pidfd, settings.FORKSERVER_PIPES_FDS['_w'])
+def get_cpu_time(pid):
+    """Get the CPU time used by a process so far, in seconds.
+    
+    This is the clock of the process's CPU time (as in clock_getcpuclockid(3)),
+    for which the clock id is made as the kernel does for the other processes.
+    """
+    return time.clock_gettime(((~pid) << 3) | 2)  # CPUCLOCK_SCHED
 
-fs_talker = StreamTalker.from_fd(fs_read_fd, fs_write_fd, 
-                                 ForkServer_UnknownKill)
 
-fs_talker.send(settings.CC_F_CONTINUE)
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
 
-logging.info('Successfully connected to the forkserver pipes.')
+def get_address_space_size(pid):
+    """Get the size of the address space of a process (i.e., what RLIMIT_AS limits), in KiB."""
+    with open(f'/proc/{pid}/statm') as f:
+        return int(f.read().split(maxsplit=1)[0]) * PAGE_SIZE // 1024
 
 
-# lookup once
-fs_send = fs_talker.send
-fs_recv = fs_talker.recv
+# The responses of the coderunner children are read into this, one at
+# a time (see CRController.run_command()). A response is written by a
+# single write(), so it's never larger than this.
+response_buffer = bytearray(settings.CHILD_MAX_WRITE_SIZE)
 
 
 # Coderunner Controller
 class CRController:
-    def __init__(self, code, game_settings, limits):
+    def __init__(self, code, game_settings, limits, forkserver):
+        self.fs = forkserver
         is_setup = False
         
+        # What each command run took; see fights.perf.
+        self.perf_report = {'cpu': [], 'memory': [], 'response': []}
+        
+        # Besides the CPU time limit of the whole child ('cpu_sec' and
+        # 'cpu_nsec'), the games can give each command (e.g., each tick)
+        # an allowance of CPU time ('cpu_turn', in seconds), with a bank
+        # ('cpu_bank', in seconds) that the commands taking longer draw
+        # from, chess clock style. Once the bank is used up, the player
+        # is eliminated as for exceeding the CPU time. These are checked
+        # after each command; the limit of the whole child is still what
+        # stops a command that runs for too long. A bank without an
+        # allowance is drawn from by the whole of each command.
+        self.cpu_turn = limits.get('cpu_turn', 0)
+        self.cpu_bank = limits.get('cpu_bank')
+        
+        # The setup time and the memory usage of the child, before the
+        # player's code is run; see CODERUNNER_STATS in the settings.
+        self.stats = None
+        setup_started = time.monotonic()
+        
         # Conventions on these exceptions:
         #   1) We don't kill the process before raising
         #      the exception. It has to be done by this
@@ -330,22 +491,22 @@ class CRController:
         #      we do, is kill by SIGKILL and waitpid to
         #      get rid of the zombie.
         try:
-            fs_send(settings.CC_F_FORK_CHILD)
+            self.fs.send(settings.CC_F_FORK_CHILD)
             
             # Wait for stop due to fork().
-            tracer.forkserver_wait_stop(fs_pid)
+            tracer.forkserver_wait_stop(self.fs.pid)
             
-            child_pid = tracer.forkserver_get_forked_pid(fs_pid)
+            child_pid = tracer.forkserver_get_forked_pid(self.fs.pid)
             self.pid = child_pid
             
             # After fork(), both the forkserver and the forked
             # child will be stopped by ptrace, which is the effect
             # caused by the PTRACE_O_TRACEFORK option.
-            tracer.forkserver_resume(fs_pid)
+            tracer.forkserver_resume(self.fs.pid)
             
             # icns: in-container namespace. This is the pid of
             # the forked child in the PID namespace of the container.
-            self.icns_pid_str = fs_recv()
+            self.icns_pid_str = self.fs.recv()
             
             # I used to think that since a forked child is stopped from
             # the very beginning, stop-requiring requests like PTRACE_SYSCALL
@@ -391,6 +552,14 @@ class CRController:
             # Resume until the final read() before starting the simulation.
             tracer.forked_resume_until_read(child_pid)
             
+            # The child is stopped and done with its own setup, and
+            # the player's code hasn't run yet.
+            if settings.CODERUNNER_STATS:
+                memory_usage = get_memory_usage(child_pid)
+                if memory_usage is not None:
+                    self.stats = {'setup': time.monotonic() - setup_started,
+                                  **memory_usage}
+            
             child_talker.send(settings.CC_C_START_SIMULATION)
             
             # Stop at the syscall-exit-stop of the read(). Basically
@@ -443,6 +612,10 @@ class CRController:
             self.is_alive = True
             self._talker = child_talker
             
+            # The args of the delta commands last sent to the child,
+            # by the function name; see run_delta_command().
+            self._sent_args = {}
+            
             return
 
         # The exceptions are ordered from the most likely to
@@ -523,10 +696,10 @@ class CRController:
 
         # Wait stop due to SIGCHLD. This also consumes
         # the status so that we don't confuse it later.
-        os.waitpid(fs_pid, settings.WAITPID_FLAGS)  
+        os.waitpid(self.fs.pid, settings.WAITPID_FLAGS)  
         
         # Resume after signal-stop due to SIGCHLD.
-        tracer.forkserver_resume(fs_pid)
+        tracer.forkserver_resume(self.fs.pid)
         
         # Get rid of the zombie. We use the pid in the
         # namespace of the container. According to the
@@ -534,7 +707,7 @@ class CRController:
         # is consumed by the tracer, the real parent will
         # be given the status/notification. Once the parent
         # consumes the status too, the zombie goes away.
-        fs_send(self.icns_pid_str)
+        self.fs.send(self.icns_pid_str)
 
         # If a coderunner child gets killed before any code is
         # run, then it's a problem on our side. We report the
@@ -545,7 +718,7 @@ class CRController:
             logging.error(f'> coderunner pid: {self.pid}')
             logging.error(f'> termination reason: {termination_reason}')
             logging.error(f'> explanation: {explanation}')
-            logging.error(f'> forkserver container id: {fs_container.attrs["Id"]}')
+            logging.error(f'> forkserver container id: {self.fs.container.attrs["Id"]}')
 
         # Cleanup the file descriptors.
         for fdn in ['pidfd', 'r_fd', 'w_fd']:
@@ -589,24 +762,60 @@ class CRController:
         #     raised an exception.
         #   - The Python None. This means that the player has
         #     been eliminated. 
+        return self.send_command({'f': f_name, 'args': f_args})
+    
+    def run_delta_command(self, f_name, f_args):
+        # The same as run_command(), except that only the changes
+        # of the args since the last call of the same function are
+        # sent; see games._base.delta.
+        #
+        # Taken through JSON, so that it's compared the same way as
+        # it's received, and isn't changed along with the game's
+        # own objects.
+        current = json.loads(json.dumps(list(f_args)))
+        
+        previous = self._sent_args.get(f_name)
+        self._sent_args[f_name] = current
         
-        message = json.dumps({'f': f_name, 'args': f_args})
+        if previous is None:
+            return self.send_command({'f': f_name, 's': current})
+        
+        return self.send_command({'f': f_name, 'd': get_args_delta(previous, current)})
+    
+    def send_command(self, command):
+        request = json.dumps(command).encode() + b'\n'
+        
+        cpu_time = get_cpu_time(self.pid)
         
         try:
-            self._talker.send(message)
+            # Sends the request, lets the child read it (limited
+            # to its size), traces it until it writes the response
+            # (as the next expected r/w, a write()) and then until
+            # its next read() for the next command, and reads the
+            # response; all in one call to the tracer.
+            size = tracer.forked_roundtrip(self.pid, self.w_fd, self.r_fd,
+                                           request, response_buffer)
             
-            # +1 for the newline character
-            tracer.forked_resume_read_SE(self.pid, len(message)+1)
+            # The child is stopped again, waiting for the next command.
+            cpu_time = get_cpu_time(self.pid) - cpu_time
             
-            # Next expected r/w: write() with syscall code 1.
-            tracer.forked_trace_until_rw(self.pid, 1)
+            self.perf_report['cpu'].append(round(cpu_time * 1_000_000))
+            self.perf_report['memory'].append(get_address_space_size(self.pid))
+            self.perf_report['response'].append(size)
             
-            tracer.forked_resume_write_SE(self.pid)
+            if self.cpu_bank is not None:
+                self.cpu_bank -= max(0, cpu_time - self.cpu_turn)
+                if self.cpu_bank < 0:
+                    self.finish_after_error(TerminationReasons.XCPUTIME, (), True)
+                    return None
             
-            # Next expected r/w: read() with syscall code 0.
-            tracer.forked_trace_until_rw(self.pid, 0)
+            response = response_buffer[:size]
+            
+            # The coderunner always ends its responses in a newline.
+            if not response.endswith(b'\n'):
+                raise Forked_CodeSabotage('no newline')
             
-            output = json.loads(self._talker.recv())
+            output = json.loads(response)
             
             # We always return a dict JSON from the coderunner,
             # unless an attacker has changed it to something
@@ -640,13 +849,13 @@ class CRController:
         except Forked_UnexpectedCont as e:
             termination_reason = TerminationReasons.UNEXP_CONT
             exc_args = e.args
-        except JSONDecodeError:
+        except (JSONDecodeError, UnicodeDecodeError) as e:
             # If the untrusted code somehow manages to mess with
             # the code we've written for the forked child, then
             # it's a sabotage. In the coderunnre child we always
             # try to return a valid JSON, even on exceptions.
             termination_reason = TerminationReasons.SABOTAGE
-            exc_args = ('JSONDecodeError',)
+            exc_args = (type(e).__name__,)
         
         self.finish_after_error(termination_reason, exc_args, True)
         return None  # means that the player coderunner has been terminated.
@@ -661,10 +870,10 @@ class CRController:
 
         # See the comments in 'finish_after_error' for an
         # explanation of the following.
-        os.waitpid(fs_pid, settings.WAITPID_FLAGS)
-        tracer.forkserver_resume(fs_pid)
+        os.waitpid(self.fs.pid, settings.WAITPID_FLAGS)
+        tracer.forkserver_resume(self.fs.pid)
         
-        fs_send(self.icns_pid_str)
+        self.fs.send(self.icns_pid_str)
 
         # Cleanup the file descriptors. Since this is a
         # successful finish, all these fd's must exist.
@@ -678,22 +887,100 @@ class CRController:
 
 MEDIA_ROOT = Path(global_config.MEDIA_ROOT)
 
-def get_code(filename):
+def get_code(filename, trusted_signature=None):
+    """Get a player code, and whether it's trusted; see common.trusted."""
+    with open(MEDIA_ROOT / filename, 'rb') as f:
+        content = f.read()
+    
+    # Checked against the very content that is run.
+    is_trusted = is_trusted_code(global_config.TRUSTED_CODES_KEY, content, trusted_signature)
+    
     try:
-        with open(MEDIA_ROOT / filename) as f:
-            return f.read()
+        return content.decode(), is_trusted
     # If the player uploads a bytes-formatted file,
     # just return an empty string as the code.
     except UnicodeDecodeError:
-        return ''
+        return '', False
+
+
+# A probe sets up a single player code on its own, gives it the game's
+# probe command (see Game.get_probe_command()), and sets the verdict of
+# whether it survived, so that the player of a code that would be
+# eliminated right away is told before its fight starts (see the web's
+# ProbeCodeService). The code is in the message itself.
+def probe(stream, message_id, data):
+    # Too late to be of use; the code is left without a verdict.
+    if time.time() > data['deadline']:
+        redis_client.xack(stream, global_config.REDIS_SIMULATOR_GROUP, message_id)
+        return
+    
+    game = GAME_CLASSES[data['game']](
+        game_settings=data['game_settings'],
+        player_count=data['player_count']
+    )
+    
+    limits = game.get_limits()
+    
+    # Only a fraction of the game's CPU time; see PROBE_CPU_TIME.
+    game_cpu_time = limits['cpu_sec'] + limits['cpu_nsec'] / 1e9
+    cpu_time = min(settings.PROBE_CPU_TIME, game_cpu_time)
+    limits = {**limits,
+              'cpu_sec': int(cpu_time),
+              'cpu_nsec': round(cpu_time % 1 * 1e9)}
+    
+    crc = CRController(data['code'], data['game_settings'], limits,
+                       use_profile(game.PRELOAD_PROFILE))
+    
+    command = game.get_probe_command()
+    if crc.is_alive and command is not None:
+        # Eliminates the player if it fails; an exception
+        # raised by the player's function doesn't.
+        crc.run_command(*command)
+    
+    if crc.is_alive:
+        crc.finish_after_simulation()
+        verdict = {'ok': True}
+    elif (crc.error_report[0] == TerminationReasons.XCPUTIME
+          and cpu_time < game_cpu_time):
+        # It might have made it with the game's full limit.
+        verdict = {'ok': True}
+    else:
+        verdict = {'ok': False, 'termination_reason': crc.error_report[0]}
+    
+    # Replaces the pending mark that the web process set in its place.
+    redis_client.set(data['verdict_key'], json.dumps(verdict), ex=data['verdict_timeout'])
+    
+    redis_client.xack(stream, global_config.REDIS_SIMULATOR_GROUP, message_id)
 
 
-def process(message):
+# A fight taken from the queue, with its players set up and waiting at
+# CC_C_CHILD_READY, to be simulated (see SETUP_LOOKAHEAD in the settings).
+class PreparedFight:
+    def __init__(self, stream, message_id, fight_id, game, cr_controllers, setup_duration):
+        self.stream = stream
+        self.message_id = message_id
+        self.fight_id = fight_id
+        self.game = game
+        self.cr_controllers = cr_controllers
+        self.setup_duration = setup_duration
+
+
+def prepare(stream, message):
+    """Set up the players of a fight taken from the queue; returns a PreparedFight, or None for a probe.
+    
+    The probes are quick, so they're done right away rather than
+    waiting behind the fights.
+    """
     message_id, serialized_data = message
     
     data = json.loads(serialized_data['data'])
     
-    fight_id = data['fight_id']
+    if data.get('type') == 'probe':
+        probe(stream, message_id, data)
+        return None
+    
+    started = time.monotonic()
+    
     game_settings = data['game_settings']
     codes_filenames = data['codes_filenames']
     player_count = len(codes_filenames)
@@ -706,11 +993,17 @@ def process(message):
     # Memory and CPU time limits
     limits = game.get_limits()
     
+    forkserver = use_profile(game.PRELOAD_PROFILE)
+    
     cr_controllers = []
     initial_players = []
     
+    # Missing in the messages of the older webs.
+    trusted_signatures = data.get('trusted_signatures', [None] * player_count)
+    
     for player_index in range(player_count):
-        player_code = get_code(codes_filenames[player_index])
+        player_code, is_trusted = get_code(codes_filenames[player_index],
+                                           trusted_signatures[player_index])
         
         # TODO: maybe also let the game give each player's Main instance
         # extra context (e.g., by appending it to "context", which is
@@ -719,7 +1012,12 @@ def process(message):
         # by the game in the beginning and give the context to it so
         # that the player can save it, but that would mean that the player
         # has to write more code.
-        crc = CRController(player_code, game_settings, limits)
+        if is_trusted:
+            # Run in this process, out of the sandbox.
+            crc = TrustedCRController(player_code, game_settings)
+        else:
+            crc = CRController(player_code, game_settings, limits, forkserver)
+        
         cr_controllers.append(crc)
         
         if crc.is_alive:
@@ -727,6 +1025,19 @@ def process(message):
     
     game.set_controllers(cr_controllers, initial_players)
     
+    return PreparedFight(stream, message_id, data['fight_id'], game,
+                         cr_controllers, time.monotonic() - started)
+
+
+def simulate(fight):
+    started = time.monotonic()
+    
+    game = fight.game
+    
+    # Other fights (possibly of other profiles) might have been
+    # set up since this one was.
+    use_profile(game.PRELOAD_PROFILE)
+    
     game.simulate()
     
     final_states = []
@@ -738,51 +1049,251 @@ def process(message):
         
         final_states.append(c.error_report)
     
-    output_data = {'fight_id': fight_id,
+    output_data = {'fight_id': fight.fight_id,
                    'report': game.get_report(),
-                   'final_states': final_states}
+                   'final_states': final_states,
+                   'perf_reports': [c.perf_report for c in game.cr_controllers]}
 
     redis_client.xadd(global_config.REDIS_RESULT_PROCESSOR_STREAM,
         {'data': json.dumps(output_data)}
     )
 
-    redis_client.xack(global_config.REDIS_SIMULATOR_STREAM,
-                      global_config.REDIS_SIMULATOR_GROUP,
-                      message_id)
+    redis_client.xack(fight.stream, global_config.REDIS_SIMULATOR_GROUP, fight.message_id)
+    
+    coderunner_stats = [json.dumps(c.stats) for c in fight.cr_controllers if c.stats]
+    
+    # The setup is still the worker's time, even if it's done ahead.
+    duration = fight.setup_duration + time.monotonic() - started
+    
+    # For the web to estimate the queue wait times, and
+    # for keeping an eye on the cost of the coderunner.
+    with redis_client.pipeline() as pipe:
+        pipe.lpush(DURATIONS_KEY, duration)
+        pipe.ltrim(DURATIONS_KEY, 0, settings.SIMULATION_DURATIONS_KEPT - 1)
+        
+        if coderunner_stats:
+            pipe.lpush(CODERUNNER_STATS_KEY, *coderunner_stats)
+            pipe.ltrim(CODERUNNER_STATS_KEY, 0, settings.CODERUNNER_STATS_KEPT - 1)
+        
+        pipe.execute()
+
 
+# The streams of each lane that this pool reads from; one for
+# each of the pool's games, or the shared one of the lane for
+# the default pool.
+LANE_STREAMS = {
+    lane: get_pool_streams(POOLS, POOL_NAME, lane_stream)
+    for lane, lane_stream in {
+        'interactive': global_config.REDIS_SIMULATOR_STREAM,
+        **global_config.REDIS_SIMULATOR_LANE_STREAMS
+    }.items()
+}
 
+ALL_STREAMS = [stream for streams in LANE_STREAMS.values() for stream in streams]
+
+# The probes are quick, and their verdicts are only of use before the
+# fights of their codes start (see probe()), so their lane is always
+# served first, rather than being weighted.
+PROBE_LANE = 'probe'
+
+# The worker stats are kept per pool, since the pools
+# are queued and estimated apart (see fights.queue).
+DURATIONS_KEY = get_pool_key(global_config.REDIS_SIMULATION_DURATIONS_KEY, POOL_NAME)
+WORKERS_KEY = get_pool_key(global_config.REDIS_SIMULATOR_WORKERS_KEY, POOL_NAME)
+IDLE_WORKERS_KEY = get_pool_key(global_config.REDIS_SIMULATOR_IDLE_WORKERS_KEY, POOL_NAME)
+CODERUNNER_STATS_KEY = get_pool_key(global_config.REDIS_CODERUNNER_STATS_KEY, POOL_NAME)
+
+lane_scheduler = LaneScheduler(global_config.SIMULATOR_LANE_WEIGHTS)
+
+
+def read_next_messages(block=True):
+    """Read the next simulation(s) to process; returns a list of (stream, message).
+    
+    If nothing is waiting, an empty list is returned right away,
+    unless 'block' is True.
+    """
+    for lane in [PROBE_LANE, *lane_scheduler.get_order()]:
+        query = redis_client.xreadgroup(
+            groupname=global_config.REDIS_SIMULATOR_GROUP,
+            consumername=WORKER_NAME,
+            # Only the new messages; at most one from each
+            # of the lane's streams, all of which are ours
+            # to process now.
+            streams={stream: '>' for stream in LANE_STREAMS[lane]},
+            count=1
+        )
+        
+        if lane == PROBE_LANE:
+            if query:
+                return [(stream, messages[0]) for stream, messages in query]
+            continue
+        
+        if query:
+            lane_scheduler.mark_served(lane)
+            return [(stream, messages[0]) for stream, messages in query]
+        
+        lane_scheduler.mark_idle(lane)
+    
+    if not block:
+        return []
+    
+    # Nothing is waiting in any lane; block until something arrives
+    # in any of them. If more than one arrive together, we get one
+    # from each, all of which are ours to process now. Meanwhile, the
+    # other workers know not to take fights ahead; see is_any_worker_idle().
+    redis_client.zadd(IDLE_WORKERS_KEY, {WORKER_NAME: time.time()})
+    try:
+        query = redis_client.xreadgroup(
+            groupname=global_config.REDIS_SIMULATOR_GROUP,
+            consumername=WORKER_NAME,
+            streams={stream: '>' for stream in ALL_STREAMS},
+            count=1,
+            # Not forever, so that we keep reporting ourselves as alive.
+            block=settings.IDLE_BLOCK_MS
+        )
+    finally:
+        redis_client.zrem(IDLE_WORKERS_KEY, WORKER_NAME)
+    
+    return [(stream, messages[0]) for stream, messages in query]
 
-# Create the stream and the group if they don't exist.
-try:
-    redis_client.xgroup_create(
-        name=global_config.REDIS_SIMULATOR_STREAM,
-        groupname=global_config.REDIS_SIMULATOR_GROUP,
-        mkstream=True
-    )
-except redis.exceptions.ResponseError:
-    pass
 
-# The worker might crash while some simulations have
-# not been acknowledged yet (which shouldn't really
-# be more than one per worker). We redo those simulations.
-unacked = redis_client.xreadgroup(
-        groupname=global_config.REDIS_SIMULATOR_GROUP,
-        consumername=WORKER_NAME,
-        streams={global_config.REDIS_SIMULATOR_STREAM: '0'},
-)[0][1]  # get for the one and only relevant stream.
+def is_any_worker_idle():
+    """Tell whether any (other) worker of the pool is waiting for a simulation."""
+    # Those of the dead workers are left behind; they're not counted
+    # once they're older than a wait (which is renewed each time).
+    return redis_client.zcount(
+        IDLE_WORKERS_KEY,
+        time.time() - 2 * settings.IDLE_BLOCK_MS / 1000,
+        '+inf'
+    ) > 0
 
-for msg in unacked:
-    process(msg)
 
+def report_alive():
+    redis_client.zadd(WORKERS_KEY, {WORKER_NAME: time.time()})
+
+
+def requeue(stream, message):
+    """Put a pending simulation (of any worker) back in its stream, or in the dead-letter stream after too many attempts.
+    
+    The attempts are counted in the message itself (as 'attempts', next
+    to the 'data'), so that a simulation that keeps killing the workers
+    can't keep them busy forever. The requeued simulation goes to the end
+    of its lane.
+    """
+    message_id, fields = message
+    
+    # Entries trimmed from the stream while pending.
+    if not fields:
+        redis_client.xack(stream, global_config.REDIS_SIMULATOR_GROUP, message_id)
+        return
+    
+    attempts = int(fields.get('attempts', 0)) + 1
+    
+    # Atomic, so that the simulation is neither lost nor duplicated.
+    with redis_client.pipeline(transaction=True) as pipe:
+        if attempts >= global_config.MAX_DELIVERY_ATTEMPTS:
+            pipe.xadd(global_config.REDIS_SIMULATOR_DEAD_LETTER_STREAM,
+                      {**fields, 'attempts': attempts, 'stream': stream})
+        else:
+            pipe.xadd(stream, {**fields, 'attempts': attempts})
+        
+        pipe.xack(stream, global_config.REDIS_SIMULATOR_GROUP, message_id)
+        pipe.execute()
+    
+    if attempts >= global_config.MAX_DELIVERY_ATTEMPTS:
+        logging.error('A simulation has been moved to the dead-letter stream.')
+        logging.error(f'> stream: {stream}, message id: {message_id}')
+    else:
+        logging.warning(f'A pending simulation has been requeued (attempt {attempts}).')
+        logging.warning(f'> stream: {stream}, message id: {message_id}')
+
+
+def get_reclaim_min_idle_ms():
+    # The game classes can be reloaded, so it's computed each time.
+    max_duration = max(g.MAX_EXPECTED_DURATION for g in GAME_CLASSES.values())
+    
+    # A simulation taken ahead also waits for those before it.
+    max_duration *= 1 + settings.SETUP_LOOKAHEAD
+    
+    return max_duration * settings.RECLAIM_IDLE_FACTOR * 1000
+
+
+def reclaim_stuck():
+    """Requeue the simulations that have been pending for too long, e.g., with a worker that died."""
+    for stream in ALL_STREAMS:
+        _, claimed, *_ = redis_client.xautoclaim(
+            stream,
+            global_config.REDIS_SIMULATOR_GROUP,
+            WORKER_NAME,
+            min_idle_time=get_reclaim_min_idle_ms(),
+            count=settings.RECLAIM_BATCH_SIZE
+        )
+        
+        for message in claimed:
+            requeue(stream, message)
+
+
+for stream in ALL_STREAMS:
+    # Create the stream and the group if they don't exist.
+    try:
+        redis_client.xgroup_create(
+            name=stream,
+            groupname=global_config.REDIS_SIMULATOR_GROUP,
+            mkstream=True
+        )
+    except redis.exceptions.ResponseError:
+        pass
+
+    # The worker might crash while some simulations have
+    # not been acknowledged yet (which shouldn't really
+    # be more than one per worker). Those are requeued
+    # right away, rather than waiting for a reclaim.
+    unacked = redis_client.xreadgroup(
+            groupname=global_config.REDIS_SIMULATOR_GROUP,
+            consumername=WORKER_NAME,
+            streams={stream: '0'},
+    )[0][1]  # get for the one and only relevant stream.
+
+    for msg in unacked:
+        requeue(stream, msg)
+
+
+last_reclaimed = 0
+
+# The fights set up ahead, in the order they were taken.
+prepared = deque()
 
 while True:
-    query = redis_client.xreadgroup(
-        groupname=global_config.REDIS_SIMULATOR_GROUP,
-        consumername=WORKER_NAME,
-        streams={global_config.REDIS_SIMULATOR_STREAM: '>'},  # only the new messages
-        block=0,  # block until a new message arrives.
-        count=1
-    )[0]  # get for the one and only relevant stream.
-    
-    # Process the one and only message.
-    process(query[1][0])
+    report_alive()
+    
+    if time.monotonic() - last_reclaimed >= settings.RECLAIM_INTERVAL:
+        reclaim_stuck()
+        last_reclaimed = time.monotonic()
+    
+    # The fight at the head is simulated before any other is taken or
+    # set up, so that it's never delayed by the setups of those after it.
+    if prepared:
+        simulate(prepared.popleft())
+    
+    # Take and set up the next fights, up to the lookahead besides the
+    # one to be simulated next; only blocking if there's nothing to
+    # simulate. The tracer can only be used from this thread, so the
+    # setups can't run along with a simulation; rather, they're done in
+    # between. Though, a fight is only taken ahead while no other worker
+    # could take it now.
+    while len(prepared) <= settings.SETUP_LOOKAHEAD:
+        if prepared and is_any_worker_idle():
+            break
+        
+        messages = read_next_messages(block=not prepared)
+        if not messages:
+            break
+        
+        for stream, message in messages:
+            fight = prepare(stream, message)
+            if fight is not None:
+                prepared.append(fight)
+        
+        # Keep reporting while blocked on probes only.
+        if not prepared:
+            break
@@ -24,6 +24,7 @@
 #include <sys/wait.h>
 #include <sys/syscall.h>      /* Definition of SYS_* constants */
 #include <sys/utsname.h>
+#include <sys/ioctl.h>
 
 
 // Only for x86_64.
@@ -651,47 +652,169 @@ tracer_forked_resume_until_read(PyObject *self, PyObject *args) {
 }
 
 
-static PyObject *
-tracer_forked_trace_until_rw(PyObject *self, PyObject *args) { 
-    // When we call this function, we should be stopped at a
-    // syscall-exit-stop of a syscall, we this function lets
-    // the process run until it hits the next read/write in 
-    // the alternating sequence. That which one (read or write)
-    // is the next, shall be given by the caller (the worker).
+// The functions that drive the forked children run without holding
+// the GIL (see forked_roundtrip()), so they can't raise the exceptions
+// themselves. Instead, they return -1 and describe the error in a
+// 'struct trace_error', which is raised by raise_trace_error() once
+// the GIL is held again. The errors are the same as the ones raised
+// by CHECK_WAITPID_STATUS and CHECK_PTRACE_ERROR for the forked
+// children (fs_or_f = 1), with the same args.
+enum trace_error_kind {
+    TE_NONE = 0,
+    TE_UNKNOWN_KILL,
+    TE_UNKNOWN_SIGNAL,
+    TE_UNEXPECTED_CONT,
+    TE_ILLEGAL_SYSCALL,
+    TE_ENOMEM,
+    TE_SYSTEM,  // an unexpected ptrace error; a SystemError
+    TE_OS       // an error on the pipes; an OSError
+};
 
-    // for storing ptrace() return value and waitpid() status.
-    int r, status;
+struct trace_error {
+    enum trace_error_kind kind;
 
-    static const char *ptrace_unex_emf = 
-        "forked_trace_until_rw: ptrace on the forked child raised error code %i.";
+    // Whether the waitpid() status is the arg of the exception.
+    int has_status;
+    int status;
 
-    pid_t pid;
-    int next_rw;
+    // For TE_ILLEGAL_SYSCALL: the syscall number and its 1st and
+    // 3rd args (see the comments in simulator/entry.py).
+    long syscall_info[3];
+
+    // For TE_SYSTEM and TE_OS.
+    const char *error_message_format;
+    int error_number;
+};
+
+#define SET_STATUS_ERROR(err, error_kind, _status)    \
+    (err)->kind = error_kind;                         \
+    (err)->has_status = 1;                            \
+    (err)->status = _status;
+
+#define SET_ILLEGAL_SYSCALL(err, number, arg_1, arg_3)    \
+    (err)->kind = TE_ILLEGAL_SYSCALL;                     \
+    (err)->syscall_info[0] = number;                      \
+    (err)->syscall_info[1] = arg_1;                       \
+    (err)->syscall_info[2] = arg_3;
+
+// The same as CHECK_WAITPID_STATUS, for the forked children.
+#define NOGIL_CHECK_WAITPID_STATUS(status, stop_strap_trap, err)           \
+    if (WIFSIGNALED(status)) {                                             \
+        SET_STATUS_ERROR(err, TE_UNKNOWN_KILL, status);                    \
+        return -1;                                                         \
+    } else if (WIFSTOPPED(status)) {                                       \
+        if (STOPPED_CHECK_WRONG(stop_strap_trap)) {                        \
+            SET_STATUS_ERROR(err, TE_UNKNOWN_SIGNAL, status);              \
+            return -1;                                                     \
+        }                                                                  \
+    } else {                                                               \
+        SET_STATUS_ERROR(err, TE_UNEXPECTED_CONT, status);                 \
+        return -1;                                                         \
+    }
+
+// The same as CHECK_PTRACE_ERROR, for the forked children.
+#define NOGIL_CHECK_PTRACE_ERROR(r, pid, emf, err)                         \
+    if (r == -1) {                                                         \
+        if (errno == ESRCH) {                                              \
+            if (waitpid(pid, &status, WAITPID_FLAGS) == -1) {              \
+                (err)->kind = TE_UNKNOWN_KILL;                             \
+            } else {                                                       \
+                if (WIFSIGNALED(status)) {                                 \
+                    SET_STATUS_ERROR(err, TE_UNKNOWN_KILL, status);        \
+                } else if (WIFCONTINUED(status)) {                         \
+                    SET_STATUS_ERROR(err, TE_UNEXPECTED_CONT, status);     \
+                } else {                                                   \
+                    kill(pid, SIGKILL);                                    \
+                    SET_STATUS_ERROR(err, TE_UNKNOWN_KILL, status);        \
+                }                                                          \
+            }                                                              \
+            return -1;                                                     \
+        } else {                                                           \
+            kill(pid, SIGKILL);                                            \
+            (err)->kind = TE_SYSTEM;                                       \
+            (err)->error_message_format = emf;                             \
+            (err)->error_number = errno;                                   \
+            return -1;                                                     \
+        }                                                                  \
+    }
 
-    if (PyArg_ParseTuple(args, "ii:forked_trace_until_rw", &pid, &next_rw)) {
-        if (next_rw != 0 && next_rw != 1) {
-            PyErr_SetString(PyExc_ValueError, 
-            "The value of the second argument must be either 0 (for read) "
-            "or 1 (for write).");
 
+static PyObject *
+raise_trace_error(struct trace_error *err) {
+    PyObject *exc;
+
+    switch (err->kind) {
+        case TE_UNKNOWN_KILL:
+            exc = Forked_UnknownKill;
+            break;
+        case TE_UNKNOWN_SIGNAL:
+            exc = Forked_UnknownSignal;
+            break;
+        case TE_UNEXPECTED_CONT:
+            exc = Forked_UnexpectedCont;
+            break;
+        case TE_ENOMEM:
+            PyErr_SetNone(Forked_ENOMEM);
+            return NULL;
+        case TE_ILLEGAL_SYSCALL: {
+            PyObject *status_tuple = PyTuple_New(3);
+            for (int i = 0; i < 3; i++) {
+                PyTuple_SetItem(status_tuple, i, PyLong_FromLong(err->syscall_info[i]));
+            }
+
+            EXC_WITH_ARG(Forked_IllegalSyscall, status_tuple);
             return NULL;
         }
+        case TE_OS:
+            errno = err->error_number;
+            PyErr_SetFromErrno(PyExc_OSError);
+            return NULL;
+        default: {  // TE_SYSTEM
+            char error_message[100];
+            snprintf(error_message, 100, err->error_message_format, err->error_number);
+            PyErr_SetString(PyExc_SystemError, error_message);
+            return NULL;
+        }
+    }
+
+    if (err->has_status) {
+        EXC_WITH_ARG(exc, PyLong_FromLong(err->status));
     } else {
-        return NULL;
+        PyErr_SetNone(exc);
     }
 
+    return NULL;
+}
+
+
+// When we call this function, we should be stopped at a
+// syscall-exit-stop of a syscall, we this function lets
+// the process run until it hits the next read/write in 
+// the alternating sequence. That which one (read or write)
+// is the next, shall be given by the caller (the worker).
+//
+// Must be called without holding the GIL (or with; it doesn't
+// touch any Python objects). See 'struct trace_error'.
+static int
+forked_trace_until_rw_nogil(pid_t pid, int next_rw, struct trace_error *err) {
+    // for storing ptrace() return value and waitpid() status.
+    int r, status;
+
+    static const char *ptrace_unex_emf = 
+        "forked_trace_until_rw: ptrace on the forked child raised error code %i.";
+
     while (1) {
         // Resume from the syscall-exit-stop until the
         // next syscall (or signal).
         r = ptrace(PTRACE_SYSCALL, pid, 0, 0);
-        CHECK_PTRACE_ERROR(r, pid, ptrace_unex_emf, 1);
+        NOGIL_CHECK_PTRACE_ERROR(r, pid, ptrace_unex_emf, err);
 
         waitpid(pid, &status,  WAITPID_FLAGS);
-        CHECK_WAITPID_STATUS(status, 1, 1);
+        NOGIL_CHECK_WAITPID_STATUS(status, 1, err);
 
         struct user_regs_struct regs;
         r = ptrace(PTRACE_GETREGS, pid, 0, &regs);
-        CHECK_PTRACE_ERROR(r, pid, ptrace_unex_emf, 1);
+        NOGIL_CHECK_PTRACE_ERROR(r, pid, ptrace_unex_emf, err);
 
         // This is only for the x86-64 architechture.
         // Since %rax is used both for storing the
@@ -711,21 +834,18 @@ tracer_forked_trace_until_rw(PyObject *self, PyObject *args) {
                     SYSCALL_ARG_3(regs) > (unsigned long long)write_max_bytes)
                 )
             ) {
+                SET_ILLEGAL_SYSCALL(err, syscall_number,
+                    SYSCALL_ARG_1(regs), SYSCALL_ARG_3(regs));
+
                 // See the comments in the last 'else' block.
                 SYSCALL_NUMBER(regs) = -1;
                 r = ptrace(PTRACE_SETREGS, pid, 0, &regs);
-                CHECK_PTRACE_ERROR(r, pid, ptrace_unex_emf, 1);
+                NOGIL_CHECK_PTRACE_ERROR(r, pid, ptrace_unex_emf, err);
 
-                PyObject *status_tuple = PyTuple_New(3);
-                PyTuple_SetItem(status_tuple, 0, PyLong_FromLong(syscall_number));
-                PyTuple_SetItem(status_tuple, 1, PyLong_FromLong(SYSCALL_ARG_1(regs)));
-                PyTuple_SetItem(status_tuple, 2, PyLong_FromLong(SYSCALL_ARG_3(regs)));
-
-                EXC_WITH_ARG(Forked_IllegalSyscall, status_tuple);
-                return NULL;
+                return -1;
             }
 
-            return Py_Zero;
+            return 0;
         } else if (IS_SYSCALL_ALLOWED(syscall_number)) {  // EXCLUDING read() and write()
             // We let the syscall run. Once the syscall exits and before 
             // it returns to the user-space code (the code runner child),
@@ -734,13 +854,13 @@ tracer_forked_trace_until_rw(PyObject *self, PyObject *args) {
             // then this inspection is not necessary. For mem-related ones,
             // we'll check to see if ENOMEM has occured or not.
             r = ptrace(PTRACE_SYSCALL, pid, 0, 0);
-            CHECK_PTRACE_ERROR(r, pid, ptrace_unex_emf, 1);
+            NOGIL_CHECK_PTRACE_ERROR(r, pid, ptrace_unex_emf, err);
             waitpid(pid, &status,  WAITPID_FLAGS);
-            CHECK_WAITPID_STATUS(status, 1, 1);
+            NOGIL_CHECK_WAITPID_STATUS(status, 1, err);
 
             if (SYSCALL_RAISES_ENOMEM(syscall_number)) {
                 r = ptrace(PTRACE_GETREGS, pid, 0, &regs);
-                CHECK_PTRACE_ERROR(r, pid, ptrace_unex_emf, 1);
+                NOGIL_CHECK_PTRACE_ERROR(r, pid, ptrace_unex_emf, err);
 
                 // the %rax register will refer to the return value
                 // of the syscall. Again, this is another x86-64 thing.
@@ -751,17 +871,14 @@ tracer_forked_trace_until_rw(PyObject *self, PyObject *args) {
                     // See the comments in the last 'else' block.
                     SYSCALL_NUMBER(regs) = -1;
                     r = ptrace(PTRACE_SETREGS, pid, 0, &regs);
-                    CHECK_PTRACE_ERROR(r, pid, ptrace_unex_emf, 1);
+                    NOGIL_CHECK_PTRACE_ERROR(r, pid, ptrace_unex_emf, err);
 
-                    PyErr_SetNone(Forked_ENOMEM);
-                    return NULL;
+                    err->kind = TE_ENOMEM;
+                    return -1;
                 }
             }
         } else {  // illegal syscall.
-            PyObject *status_tuple = PyTuple_New(3);
-            PyTuple_SetItem(status_tuple, 0, PyLong_FromLong(syscall_number));
-            PyTuple_SetItem(status_tuple, 1, PyLong_FromLong(-1));
-            PyTuple_SetItem(status_tuple, 2, PyLong_FromLong(-1));
+            SET_ILLEGAL_SYSCALL(err, syscall_number, -1, -1);
 
             // Change the syscall number to -1 (= invalid syscall) so
             // that the actual illegal syscall does not get executed.
@@ -770,10 +887,9 @@ tracer_forked_trace_until_rw(PyObject *self, PyObject *args) {
             // prevent the syscall from actually being executed.
             SYSCALL_NUMBER(regs) = -1;
             r = ptrace(PTRACE_SETREGS, pid, 0, &regs);
-            CHECK_PTRACE_ERROR(r, pid, ptrace_unex_emf, 1);
+            NOGIL_CHECK_PTRACE_ERROR(r, pid, ptrace_unex_emf, err);
 
-            EXC_WITH_ARG(Forked_IllegalSyscall, status_tuple);
-            return NULL;
+            return -1;
         }
 
         // Note that the child stops on a syscall-exit-stop
@@ -867,67 +983,254 @@ tracer_forked_trace_until_rw(PyObject *self, PyObject *args) {
 }
 
 
-// SE: stop on syscall exit (syscall-exit-stop).
 static PyObject *
-tracer_forked_resume_read_SE(PyObject *self, PyObject *args) {
-    int r, status;
-
-    static const char *ptrace_unex_emf = 
-        "forked_resume_read_SE: ptrace on the forked child raised error code %i.";
-
+tracer_forked_trace_until_rw(PyObject *self, PyObject *args) { 
     pid_t pid;
-    int read_byte_count;
+    int next_rw;
 
-    if (!PyArg_ParseTuple(args, "ii:forked_resume_read_SE", &pid, &read_byte_count)) {
+    if (PyArg_ParseTuple(args, "ii:forked_trace_until_rw", &pid, &next_rw)) {
+        if (next_rw != 0 && next_rw != 1) {
+            PyErr_SetString(PyExc_ValueError, 
+            "The value of the second argument must be either 0 (for read) "
+            "or 1 (for write).");
+
+            return NULL;
+        }
+    } else {
         return NULL;
     }
 
+    struct trace_error err = {0};
+    int res;
+
+    Py_BEGIN_ALLOW_THREADS
+    res = forked_trace_until_rw_nogil(pid, next_rw, &err);
+    Py_END_ALLOW_THREADS
+
+    if (res != 0) {
+        return raise_trace_error(&err);
+    }
+
+    return Py_Zero;
+}
+
+
+// SE: stop on syscall exit (syscall-exit-stop).
+static int
+forked_resume_read_SE_nogil(pid_t pid, int read_byte_count, struct trace_error *err) {
+    int r, status;
+
+    static const char *ptrace_unex_emf = 
+        "forked_resume_read_SE: ptrace on the forked child raised error code %i.";
+
     // When 'read_byte_count' is -1, don't impose any limit
     // on the read size.
     if (read_byte_count != -1) {
         struct user_regs_struct regs;
         r = ptrace(PTRACE_GETREGS, pid, 0, &regs);
-        CHECK_PTRACE_ERROR(r, pid, ptrace_unex_emf, 1);
+        NOGIL_CHECK_PTRACE_ERROR(r, pid, ptrace_unex_emf, err);
 
         SYSCALL_ARG_3(regs) = read_byte_count;
         r = ptrace(PTRACE_SETREGS, pid, 0, &regs);
-        CHECK_PTRACE_ERROR(r, pid, ptrace_unex_emf, 1);
+        NOGIL_CHECK_PTRACE_ERROR(r, pid, ptrace_unex_emf, err);
     }
 
     r = ptrace(PTRACE_SYSCALL, pid, 0, 0);
-    CHECK_PTRACE_ERROR(r, pid, ptrace_unex_emf, 1);
+    NOGIL_CHECK_PTRACE_ERROR(r, pid, ptrace_unex_emf, err);
 
     waitpid(pid, &status, WAITPID_FLAGS);
-    CHECK_WAITPID_STATUS(status, 1, 1);
+    NOGIL_CHECK_WAITPID_STATUS(status, 1, err);
+
+    return 0;
+}
+
+
+static PyObject *
+tracer_forked_resume_read_SE(PyObject *self, PyObject *args) {
+    pid_t pid;
+    int read_byte_count;
+
+    if (!PyArg_ParseTuple(args, "ii:forked_resume_read_SE", &pid, &read_byte_count)) {
+        return NULL;
+    }
+
+    struct trace_error err = {0};
+    int res;
+
+    Py_BEGIN_ALLOW_THREADS
+    res = forked_resume_read_SE_nogil(pid, read_byte_count, &err);
+    Py_END_ALLOW_THREADS
+
+    if (res != 0) {
+        return raise_trace_error(&err);
+    }
 
     return Py_Zero;
 }
 
 
 // SE: stop on syscall exit (syscall-exit-stop).
-static PyObject *
-tracer_forked_resume_write_SE(PyObject *self, PyObject *args) {
+static int
+forked_resume_write_SE_nogil(pid_t pid, struct trace_error *err) {
     int r, status;
 
     static const char *ptrace_unex_emf = 
         "forked_resume_write_SE: ptrace on the forked child raised error code %i.";
 
+    r = ptrace(PTRACE_SYSCALL, pid, 0, 0);
+    NOGIL_CHECK_PTRACE_ERROR(r, pid, ptrace_unex_emf, err);
+
+    waitpid(pid, &status, WAITPID_FLAGS);
+    NOGIL_CHECK_WAITPID_STATUS(status, 1, err);
+
+    return 0;
+}
+
+
+static PyObject *
+tracer_forked_resume_write_SE(PyObject *self, PyObject *args) {
     pid_t pid;
 
     if (!PyArg_ParseTuple(args, "i:forked_resume_write_SE", &pid)) {
         return NULL;
     }
 
-    r = ptrace(PTRACE_SYSCALL, pid, 0, 0);
-    CHECK_PTRACE_ERROR(r, pid, ptrace_unex_emf, 1);
+    struct trace_error err = {0};
+    int res;
 
-    waitpid(pid, &status, WAITPID_FLAGS);
-    CHECK_WAITPID_STATUS(status, 1, 1);
+    Py_BEGIN_ALLOW_THREADS
+    res = forked_resume_write_SE_nogil(pid, &err);
+    Py_END_ALLOW_THREADS
+
+    if (res != 0) {
+        return raise_trace_error(&err);
+    }
 
     return Py_Zero;
 }
 
 
+// A whole command of a forked child: the same as (in Python):
+//
+//     send(request)
+//     forked_resume_read_SE(pid, len(request))
+//     forked_trace_until_rw(pid, 1)
+//     forked_resume_write_SE(pid)
+//     forked_trace_until_rw(pid, 0)
+//     recv()
+//
+// but in one call, without the GIL, and without the text streams.
+// The child must be stopped at the syscall-enter-stop of its read(),
+// as it is after the setup or after the last round trip, and is left
+// the same way.
+//
+// The response is read into the given buffer, so that it's not made
+// anew for each command. Since the response is written by a single
+// write() of at most 'write_max_bytes' bytes (any other write() is an
+// illegal syscall), and that's less than the pipe buffer (so it's
+// written atomically), it's all in the pipe by the time the child hits
+// its next read(); it's read as a whole, without blocking. A buffer
+// smaller than 'write_max_bytes' truncates the response, which then
+// fails to parse in the worker.
+static int
+forked_roundtrip_nogil(pid_t pid, int write_fd, int read_fd,
+                       const char *request, Py_ssize_t request_size,
+                       char *response, Py_ssize_t response_capacity,
+                       Py_ssize_t *response_size, struct trace_error *err) {
+    Py_ssize_t done = 0;
+    while (done < request_size) {
+        ssize_t w = write(write_fd, request + done, request_size - done);
+        if (w == -1) {
+            if (errno == EINTR) {
+                continue;
+            }
+
+            // The child (the only reader) is gone; the same as a
+            // BrokenPipeError in StreamTalker.send().
+            if (errno == EPIPE) {
+                err->kind = TE_UNKNOWN_KILL;
+            } else {
+                err->kind = TE_OS;
+                err->error_number = errno;
+            }
+            return -1;
+        }
+
+        done += w;
+    }
+
+    if (forked_resume_read_SE_nogil(pid, request_size, err) != 0 ||
+        forked_trace_until_rw_nogil(pid, SYS_write, err) != 0 ||
+        forked_resume_write_SE_nogil(pid, err) != 0 ||
+        forked_trace_until_rw_nogil(pid, SYS_read, err) != 0) {
+        return -1;
+    }
+
+    int available;
+    if (ioctl(read_fd, FIONREAD, &available) == -1) {
+        err->kind = TE_OS;
+        err->error_number = errno;
+        return -1;
+    }
+
+    if (available > response_capacity) {
+        available = response_capacity;
+    }
+
+    done = 0;
+    while (done < available) {
+        ssize_t n = read(read_fd, response + done, available - done);
+        if (n == -1 && errno == EINTR) {
+            continue;
+        }
+
+        if (n <= 0) {
+            err->kind = TE_OS;
+            err->error_number = n == 0 ? EPIPE : errno;
+            return -1;
+        }
+
+        done += n;
+    }
+
+    *response_size = done;
+    return 0;
+}
+
+
+static PyObject *
+tracer_forked_roundtrip(PyObject *self, PyObject *args) {
+    pid_t pid;
+    int write_fd, read_fd;
+    Py_buffer request, response;
+
+    if (!PyArg_ParseTuple(args, "iiiy*w*:forked_roundtrip", &pid, &write_fd,
+                          &read_fd, &request, &response)) {
+        return NULL;
+    }
+
+    struct trace_error err = {0};
+    Py_ssize_t response_size = 0;
+    int res;
+
+    Py_BEGIN_ALLOW_THREADS
+    res = forked_roundtrip_nogil(pid, write_fd, read_fd,
+                                 request.buf, request.len,
+                                 response.buf, response.len,
+                                 &response_size, &err);
+    Py_END_ALLOW_THREADS
+
+    PyBuffer_Release(&request);
+    PyBuffer_Release(&response);
+
+    if (res != 0) {
+        return raise_trace_error(&err);
+    }
+
+    return PyLong_FromSsize_t(response_size);
+}
+
+
 static PyObject *
 tracer_pidfd_getfd(PyObject *self, PyObject *args) {
     int pidfd, fd;
@@ -1007,6 +1310,14 @@ static PyMethodDef TracerMethods[] = {
      "Pass over the syscall-entry-stop event of the current write() syscall "
      "and stop at the syscall-exit-stop of it."},
 
+    {"forked_roundtrip", tracer_forked_roundtrip, METH_VARARGS,
+     "Run a whole command on the forked child: write the request to its pipe, "
+     "trace it through the read(), the computation and the write() of the response, "
+     "and read the response into the given buffer (a bytearray, reused across the "
+     "commands), without holding the GIL. Returns the size of the response. The "
+     "arguments are the pid, the write fd and the read fd of the worker's ends of "
+     "the child's pipes, the request (bytes, ending in a newline) and the buffer."},
+
     {"pidfd_getfd", tracer_pidfd_getfd, METH_VARARGS,
      "Basically a Python port for the syscall pidfd_getfd()."},
 
@@ -0,0 +1,35 @@
+# The simulations are queued in lanes (e.g., the interactive fights
+# apart from the batches), each a stream. When more than one lane has
+# simulations waiting, the lanes are served in proportion to their
+# weights, by smooth weighted round-robin: each time, every lane gains
+# its weight in credit, and the one with the most credit that has
+# something waiting is served, paying back the total weight. A lane
+# with nothing waiting doesn't keep its credit, so that a batch that
+# arrives after a quiet while can't take the simulators in a burst.
+# In turn, a lane served while the others are idle pays for their
+# weights too, so its debt is capped; otherwise it would be the one
+# left behind once the others have something waiting again.
+#
+# Used by the workers (see entry.py), which read the lanes' streams in
+# the order given here.
+
+
+class LaneScheduler:
+    def __init__(self, weights):
+        self.weights = weights
+        self.total_weight = sum(weights.values())
+        self.credits = {lane: 0 for lane in weights}
+    
+    def get_order(self):
+        """Get the lanes in the order they should be tried for the next simulation."""
+        for lane, weight in self.weights.items():
+            self.credits[lane] += weight
+        
+        return sorted(self.weights, key=lambda lane: -self.credits[lane])
+    
+    def mark_served(self, lane):
+        self.credits[lane] = max(self.credits[lane] - self.total_weight,
+                                 -self.total_weight)
+    
+    def mark_idle(self, lane):
+        self.credits[lane] = 0
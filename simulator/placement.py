@@ -0,0 +1,93 @@
+# The placement of the simulator workers on the CPUs (see
+# SIMULATOR_CPU_PLACEMENT in the global config). Each worker is given
+# its own set of CPUs, out of those not reserved for the rest of the
+# services (the web, the database, ...), and is pinned to them along
+# with its forkserver containers, and so the coderunner children. This
+# way, the fights don't get moved around between the CPUs, or share
+# their caches with other fights, and take about the same time under
+# any load.
+#
+# Used by the daemon; the workers only take their own CPUs (as set by
+# the daemon) for their forkserver containers.
+
+import os
+
+
+def assign_worker_cpus(worker_names, available_cpus, reserved_cpus, cpus_per_worker):
+    """Give each worker its set of CPUs.
+    
+    Parameters
+    ----------
+    worker_names : list[str]
+        The names of all the workers, of all the pools.
+    
+    available_cpus : set[int]
+        The CPUs that the daemon can run on.
+    
+    reserved_cpus : list[int]
+        The CPUs that are never given to the workers.
+    
+    cpus_per_worker : int
+        The number of the CPUs given to each worker.
+    
+    Returns
+    -------
+    tuple[dict[str, list[int]], bool]
+        The CPUs of each worker, and whether some of the workers had to
+        share their CPUs, as there weren't enough of them. In that case,
+        the CPUs are given around in turn.
+    """
+    cpus = sorted(set(available_cpus) - set(reserved_cpus))
+    if not cpus:
+        raise ValueError('no CPUs are left for the simulator workers')
+    
+    assignment = {}
+    for i, name in enumerate(worker_names):
+        start = i * cpus_per_worker
+        assignment[name] = sorted({cpus[(start + j) % len(cpus)]
+                                   for j in range(cpus_per_worker)})
+    
+    is_shared = len(worker_names) * cpus_per_worker > len(cpus)
+    
+    return assignment, is_shared
+
+
+def get_own_cpuset():
+    """Get the CPUs of this process as a cpuset string (e.g., for 'docker run --cpuset-cpus')."""
+    return ','.join(str(cpu) for cpu in sorted(os.sched_getaffinity(0)))
+
+
+def read_cpu_times():
+    """Get the busy and the total time of each CPU since the boot, in clock ticks; see /proc/stat in proc(5)."""
+    times = {}
+    with open('/proc/stat') as f:
+        for line in f:
+            name, *values = line.split()
+            
+            # Skips the total of all the CPUs ('cpu').
+            if not name.startswith('cpu') or name == 'cpu':
+                continue
+            
+            values = [int(v) for v in values]
+            
+            # The idle and the iowait times.
+            idle = values[3] + values[4]
+            
+            times[int(name[3:])] = (sum(values) - idle, sum(values))
+    
+    return times
+
+
+def get_cpu_usage(before, after):
+    """Get the usage (from 0 to 1) of each CPU between two reads of read_cpu_times()."""
+    usage = {}
+    for cpu, (busy, total) in after.items():
+        if cpu not in before:  # came online in between
+            continue
+        
+        busy -= before[cpu][0]
+        total -= before[cpu][1]
+        
+        usage[cpu] = busy / total if total else 0.0
+    
+    return usage
@@ -13,6 +13,9 @@
 import signal
 from pathlib import Path
 
+# Copied into the coderunner image too; see Dockerfile.coderunner.
+from games._base.profiles import PROFILE_MODULES
+
 
 SIMULATOR_ROOT = Path(__file__).parent
 
@@ -22,7 +25,8 @@ SIMULATOR_ROOT = Path(__file__).parent
 _SYSCALLS_NUMBERS = {
     'mmap': 9,
     'munmap': 11,
-    'brk': 12
+    'brk': 12,
+    'madvise': 28
 }
 
 
@@ -81,13 +85,82 @@ _ALLOWED_SYSCALLS = (
 )
 
 
+##################################################################
+# Modify this if you need to change the preload profiles.
+##################################################################
+#
+# The preload profiles of the coderunner. A worker runs a forkserver
+# for each profile of its games (see Game.PRELOAD_PROFILE), which
+# imports the profile's modules once before forking any children, so
+# that they're shared by all of them. The modules of each profile are
+# those of games/_base/profiles.py, which the games (and the tests of
+# the games) check the imports of the player codes against; they MUST
+# be installed in the coderunner image (see coderunner/requirements.txt).
+#
+# A profile may need more syscalls than '_ALLOWED_SYSCALLS' for its
+# modules to work, which are only allowed for the children of that
+# profile. The same WARNING as for '_ALLOWED_SYSCALLS' applies.
+def _get_profile_modules(profile):
+    # Sorted, so that they're imported in the same order every time.
+    return tuple(sorted(PROFILE_MODULES[profile]))
+
+PRELOAD_PROFILES = {
+    'stdlib': {
+        'modules': _get_profile_modules('stdlib'),
+        'syscalls': (),
+    },
+    'numeric': {
+        'modules': _get_profile_modules('numeric'),
+        
+        # For the huge pages hint on the large arrays. Note that
+        # the unseeded random generators of numpy can't be made,
+        # as they need getrandom().
+        'syscalls': ('madvise',),
+    },
+}
+
+
+# The syscalls that MUST NOT be allowed by any profile. See the
+# WARNING above '_ALLOWED_SYSCALLS'.
+_FORBIDDEN_SYSCALLS = (
+    'read',
+    'write',
+    'close',
+    'exit',
+    'exit_group',
+    'kill',
+    'tgkill',
+    'tkill',
+    'clone',
+    'clone3',
+    'fork',
+    'vfork',
+    'execve',
+    'execveat',
+)
+
+def _validate_preload_profiles():
+    for name, profile in PRELOAD_PROFILES.items():
+        for sn in profile['syscalls']:
+            if sn in _FORBIDDEN_SYSCALLS:
+                raise ValueError(f"the preload profile '{name}' allows the forbidden syscall '{sn}'")
+            
+            if sn not in _SYSCALLS_NUMBERS:
+                raise ValueError(f"the syscall '{sn}' of the preload profile '{name}' has no number")
+
+_validate_preload_profiles()
+
+
 ##################################################################
 # DO NOT CHANGE THIS DIRECTLY; CHANGE '_ALLOWED_SYSCALLS' INSTEAD.
 ##################################################################
 #
-# Note that this MUST NOT contain the read() or the write() syscalls.
-# PTRACE_ALLOWED_SYSCALLS = tuple(_SYSCALLS_NUMBERS[sn] for sn in _ALLOWED_SYSCALLS)
-PTRACE_ALLOWED_SYSCALLS = tuple(_SYSCALLS_NUMBERS[sn] for sn in _ALLOWED_SYSCALLS)
+# By the preload profile. Note that these MUST NOT contain the read()
+# or the write() syscalls.
+PTRACE_ALLOWED_SYSCALLS = {
+    name: tuple(_SYSCALLS_NUMBERS[sn] for sn in _ALLOWED_SYSCALLS + profile['syscalls'])
+    for name, profile in PRELOAD_PROFILES.items()
+}
 
 
 ##################################################################
@@ -104,7 +177,12 @@ PTRACE_ALLOWED_SYSCALLS = tuple(_SYSCALLS_NUMBERS[sn] for sn in _ALLOWED_SYSCALL
 # control and communication purposes with the coderunner. They
 # are used for 1) sending commands and receiving responses, and
 # 2) signaling back and forth with the worker.
-SECCOMP_ALLOWED_SYSCALLS = _ALLOWED_SYSCALLS + ('read', 'write')
+#
+# By the preload profile, as above.
+SECCOMP_ALLOWED_SYSCALLS = {
+    name: _ALLOWED_SYSCALLS + profile['syscalls'] + ('read', 'write')
+    for name, profile in PRELOAD_PROFILES.items()
+}
 
 
 
@@ -128,6 +206,64 @@ CPU_TIME_EXCEED_SIGNAL = signal.SIGUSR1
 GAMES_INDEX_MODULE = 'games.index'
 
 
+# In seconds. The CPU time limit of the probed codes, unless the game's
+# own limit is lower. A probe only sets the code up and runs its first
+# command, so a code that takes longer than this (but not longer than
+# the game allows) isn't failed; it passes.
+PROBE_CPU_TIME = 0.1
+
+
+# The number of the recent simulation durations kept (by all the
+# workers together) for estimating the queue wait times.
+SIMULATION_DURATIONS_KEPT = 100
+
+# Whether the workers measure each coderunner child, for the stats
+# of the coderunner (see REDIS_CODERUNNER_STATS_KEY in the global
+# config), and how many of the recent measures are kept.
+CODERUNNER_STATS = True
+CODERUNNER_STATS_KEPT = 1000
+
+# The number of the fights, besides the next one to be simulated, that
+# each worker takes from the queue ahead and sets up the players of (up
+# to their CC_C_CHILD_READY). Each of these holds the memory of its
+# coderunner children while it waits. The setups don't overlap with the
+# simulations (they run in between, on the same thread), so this saves
+# no time yet; 0 sets up each fight only when it's taken. A fight taken
+# ahead waits for those before it, so they're only taken while no other
+# worker of the pool is idle.
+SETUP_LOOKAHEAD = 0
+
+# In milliseconds. How long an idle worker blocks waiting for a
+# simulation before reporting itself as alive again.
+IDLE_BLOCK_MS = 10_000
+
+
+# In seconds. How often each worker looks for the stuck simulations
+# to reclaim (see simulator/entry.py).
+RECLAIM_INTERVAL = 30
+
+# A simulation is stuck if it's been pending for this many times the
+# longest expected duration of any game.
+RECLAIM_IDLE_FACTOR = 3
+
+# The most simulations reclaimed from each lane at a time.
+RECLAIM_BATCH_SIZE = 10
+
+
+# In seconds. A worker that exits is restarted by the daemon on its own
+# (see simulator/daemon.py), after a delay that starts at the min and is
+# doubled on each restart, up to the max. The delay goes back to the min
+# once the worker has been running for 'RESET_AFTER'.
+WORKER_RESTART_BACKOFF = {
+    'MIN': 0.1,
+    'MAX': 30,
+    'RESET_AFTER': 60,
+}
+
+# In seconds. How often the daemon checks on the workers.
+DAEMON_POLL_INTERVAL = 0.1
+
+
 # -------- Control codes --------
 
 # We're not using a class to organize these
@@ -1,3 +1,13 @@
-from simulator.tests.assets.games.testgame1.main import TestGame1
+import importlib
 
-GAME_CLASSES = {'testgame1': TestGame1}
+
+GAME_CLASS_PATHS = {'testgame1': 'simulator.tests.assets.games.testgame1.main.TestGame1'}
+
+
+def load_game_classes(names):
+    classes = {}
+    for name in names:
+        module_path, _, class_name = GAME_CLASS_PATHS[name].rpartition('.')
+        classes[name] = getattr(importlib.import_module(module_path), class_name)
+    
+    return classes
@@ -0,0 +1,61 @@
+import unittest
+from collections import Counter
+
+from simulator.lanes import LaneScheduler
+
+
+class LaneSchedulerTest(unittest.TestCase):
+    def serve(self, scheduler, waiting, rounds):
+        """Serve the given number of simulations; return the lanes served, in order."""
+        served = []
+        for _ in range(rounds):
+            for lane in scheduler.get_order():
+                if lane in waiting:
+                    scheduler.mark_served(lane)
+                    served.append(lane)
+                    break
+                
+                scheduler.mark_idle(lane)
+        
+        return served
+    
+    def test_shares_follow_weights(self):
+        scheduler = LaneScheduler({'interactive': 8, 'batch': 1})
+        served = self.serve(scheduler, {'interactive', 'batch'}, 90)
+        
+        self.assertEqual(Counter(served), {'interactive': 80, 'batch': 10})
+    
+    def test_order_is_smooth(self):
+        scheduler = LaneScheduler({'interactive': 2, 'batch': 1})
+        served = self.serve(scheduler, {'interactive', 'batch'}, 6)
+        
+        # Interleaved, rather than all of the interactive ones first.
+        self.assertEqual(served, ['interactive', 'batch', 'interactive'] * 2)
+    
+    def test_idle_lane_takes_all(self):
+        scheduler = LaneScheduler({'interactive': 8, 'batch': 1})
+        served = self.serve(scheduler, {'batch'}, 5)
+        
+        self.assertEqual(served, ['batch'] * 5)
+    
+    def test_idle_lane_loses_credit(self):
+        scheduler = LaneScheduler({'interactive': 8, 'batch': 1})
+        
+        # The batch lane is idle while the interactive one is served.
+        self.serve(scheduler, {'interactive'}, 20)
+        self.assertEqual(scheduler.credits['batch'], 0)
+        
+        # Once a batch arrives, it gets about its share, rather than
+        # a burst for the time it was idle.
+        served = self.serve(scheduler, {'interactive', 'batch'}, 9)
+        self.assertLessEqual(Counter(served)['batch'], 2)
+    
+    def test_lane_served_alone_keeps_share(self):
+        scheduler = LaneScheduler({'interactive': 8, 'batch': 1})
+        
+        # Served alone for a long while; it doesn't build up a debt
+        # that the batch lane would then take over for.
+        self.serve(scheduler, {'interactive'}, 1000)
+        
+        served = self.serve(scheduler, {'interactive', 'batch'}, 9)
+        self.assertGreaterEqual(Counter(served)['interactive'], 7)
@@ -0,0 +1,53 @@
+import unittest
+
+from simulator.placement import assign_worker_cpus, get_cpu_usage
+
+
+class AssignWorkerCpusTest(unittest.TestCase):
+    def test_own_cpus(self):
+        assignment, is_shared = assign_worker_cpus(['a', 'b'], {0, 1, 2, 3, 4}, [0], 2)
+        
+        self.assertEqual(assignment, {'a': [1, 2], 'b': [3, 4]})
+        self.assertFalse(is_shared)
+    
+    def test_reserved_cpus_never_given(self):
+        assignment, _ = assign_worker_cpus(['a', 'b', 'c'], {0, 1, 2, 3}, [0, 3], 1)
+        
+        for cpus in assignment.values():
+            self.assertFalse({0, 3} & set(cpus))
+    
+    def test_shared_in_turn(self):
+        assignment, is_shared = assign_worker_cpus(['a', 'b', 'c'], {0, 1}, [], 1)
+        
+        self.assertEqual(assignment, {'a': [0], 'b': [1], 'c': [0]})
+        self.assertTrue(is_shared)
+    
+    def test_more_cpus_per_worker_than_left(self):
+        assignment, is_shared = assign_worker_cpus(['a'], {0, 1, 2}, [0], 3)
+        
+        # No CPU twice.
+        self.assertEqual(assignment, {'a': [1, 2]})
+        self.assertTrue(is_shared)
+    
+    def test_no_cpus_left(self):
+        with self.assertRaises(ValueError):
+            assign_worker_cpus(['a'], {0, 1}, [0, 1], 1)
+
+
+class GetCpuUsageTest(unittest.TestCase):
+    def test_usage(self):
+        before = {0: (100, 1000), 1: (500, 1000)}
+        after = {0: (150, 1100), 1: (600, 1100)}
+        
+        self.assertEqual(get_cpu_usage(before, after), {0: 0.5, 1: 1.0})
+    
+    def test_cpu_came_online(self):
+        before = {0: (100, 1000)}
+        after = {0: (100, 1100), 1: (10, 20)}
+        
+        self.assertEqual(get_cpu_usage(before, after), {0: 0.0})
+    
+    def test_no_time_passed(self):
+        times = {0: (100, 1000)}
+        
+        self.assertEqual(get_cpu_usage(times, times), {0: 0.0})
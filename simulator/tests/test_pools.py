@@ -0,0 +1,53 @@
+import unittest
+
+from common.pools import (
+    get_default_pool_name,
+    get_pool_name_of_game,
+    get_pool_game_names,
+    get_game_stream,
+    get_pool_streams,
+    get_pool_key
+)
+
+
+POOLS = {
+    'heavy': {'games': ['chess', 'go'], 'workers': 2, 'cpus': None},
+    'default': {'games': None, 'workers': 4, 'cpus': None},
+}
+
+ALL_GAME_NAMES = ['tanks', 'chess', 'go', 'snake']
+
+
+class PoolsTest(unittest.TestCase):
+    def test_default_pool(self):
+        self.assertEqual(get_default_pool_name(POOLS), 'default')
+    
+    def test_pool_of_game(self):
+        self.assertEqual(get_pool_name_of_game(POOLS, 'go'), 'heavy')
+        self.assertEqual(get_pool_name_of_game(POOLS, 'tanks'), 'default')
+        
+        # The unknown games go to the default pool too.
+        self.assertEqual(get_pool_name_of_game(POOLS, 'unknown'), 'default')
+    
+    def test_pool_game_names(self):
+        self.assertEqual(get_pool_game_names(POOLS, 'heavy', ALL_GAME_NAMES), ['chess', 'go'])
+        self.assertEqual(get_pool_game_names(POOLS, 'default', ALL_GAME_NAMES), ['tanks', 'snake'])
+    
+    def test_streams_match(self):
+        # Each game is sent to a stream that its pool (and only its
+        # pool) reads from.
+        for game_name in ALL_GAME_NAMES:
+            stream = get_game_stream(POOLS, 'lane', game_name)
+            readers = [
+                pool_name for pool_name in POOLS
+                if stream in get_pool_streams(POOLS, pool_name, 'lane')
+            ]
+            
+            self.assertEqual(readers, [get_pool_name_of_game(POOLS, game_name)])
+    
+    def test_game_streams(self):
+        self.assertEqual(get_game_stream(POOLS, 'lane', 'chess'), 'lane:chess')
+        self.assertEqual(get_game_stream(POOLS, 'lane', 'tanks'), 'lane')
+    
+    def test_pool_key(self):
+        self.assertEqual(get_pool_key('workers', 'heavy'), 'workers:heavy')
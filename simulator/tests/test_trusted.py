@@ -0,0 +1,119 @@
+import hashlib
+import unittest
+
+from common.trusted import sign_trusted_code, is_trusted_code
+from common.values import TerminationReasons
+from simulator.trusted import TrustedCRController
+from games._tests.coderunner import CRController
+
+
+KEY = 'test-key'
+
+CODE = b'''
+class Main:
+    def decide(self, tick, state):
+        return [tick, state]
+'''
+
+
+class IsTrustedCodeTest(unittest.TestCase):
+    def sign(self, content, key=KEY):
+        return sign_trusted_code(key, hashlib.sha256(content).hexdigest())
+    
+    def test_valid_signature(self):
+        self.assertTrue(is_trusted_code(KEY, CODE, self.sign(CODE)))
+    
+    def test_forged_signature(self):
+        # Signed with another key, or for another code.
+        self.assertFalse(is_trusted_code(KEY, CODE, self.sign(CODE, 'other-key')))
+        self.assertFalse(is_trusted_code(KEY, CODE, self.sign(CODE + b'\n')))
+        self.assertFalse(is_trusted_code(KEY, CODE, '0' * 64))
+    
+    def test_changed_code(self):
+        self.assertFalse(is_trusted_code(KEY, CODE + b'# changed', self.sign(CODE)))
+    
+    def test_missing_signature(self):
+        self.assertFalse(is_trusted_code(KEY, CODE, None))
+        self.assertFalse(is_trusted_code(KEY, CODE, ''))
+    
+    def test_no_key(self):
+        # Not even with a signature made with no key.
+        for key in [None, '']:
+            self.assertFalse(is_trusted_code(key, CODE, self.sign(CODE, '')))
+
+
+# The games are tested with the CRController of games/_tests, so the
+# trusted codes must behave just the same in the simulator.
+class TrustedCRControllerParityTest(unittest.TestCase):
+    GAME_SETTINGS = {'player_count': 2}
+    
+    def make_controllers(self, code):
+        return [
+            CRController(code, self.GAME_SETTINGS, {}),
+            TrustedCRController(code, self.GAME_SETTINGS),
+        ]
+    
+    def assert_same(self, code, run):
+        results = [run(crc) for crc in self.make_controllers(code)]
+        self.assertEqual(results[0], results[1])
+        return results[1]
+    
+    def test_commands(self):
+        result = self.assert_same(CODE.decode(), lambda crc: [
+            crc.run_command('decide', [0, {'x': 1}]),
+            crc.run_command('decide', [1, (1, 2)]),  # tuples come back as lists
+        ])
+        self.assertEqual(result, [([0, {'x': 1}],), ([1, [1, 2]],)])
+    
+    def test_delta_commands(self):
+        code = '''
+class Main:
+    def decide(self, tick, state):
+        seen = dict(state)
+        state['x'] = -1  # undone on the next call
+        return [tick, seen]
+'''
+        ticks = [[0, {'x': 1, 'y': 1}], [1, {'x': 1, 'y': 2}], [2, {'x': 3, 'y': 2}]]
+        
+        result = self.assert_same(code, lambda crc: [
+            crc.run_delta_command('decide', args) for args in ticks
+        ])
+        self.assertEqual(result, [(args,) for args in ticks])
+    
+    def test_context(self):
+        code = '''
+class Main:
+    def get(self):
+        return self.context
+'''
+        self.assert_same(code, lambda crc: crc.run_command('get', []))
+    
+    def test_exception(self):
+        code = '''
+class Main:
+    def decide(self):
+        raise ValueError
+    
+    def unserializable(self):
+        return object()
+'''
+        result = self.assert_same(code, lambda crc: [
+            crc.run_command('decide', []),
+            crc.run_command('unserializable', []),
+            crc.is_alive,
+        ])
+        self.assertEqual(result, [-1, -1, True])
+    
+    def test_missing_function(self):
+        result = self.assert_same(CODE.decode(), lambda crc: [
+            crc.run_command('missing', []),
+            crc.is_alive,
+        ])
+        self.assertEqual(result, [None, False])
+    
+    def test_failed_setup(self):
+        self.assert_same('raise ValueError', lambda crc: crc.is_alive)
+        self.assert_same('x = 1', lambda crc: crc.is_alive)  # no Main
+        
+        crc = TrustedCRController('raise ValueError', self.GAME_SETTINGS)
+        self.assertEqual(crc.error_report[0], TerminationReasons.TRUSTED_ERROR)
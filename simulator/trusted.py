@@ -0,0 +1,111 @@
+# The controller of the trusted codes (see common.trusted), which runs
+# them in the worker's own process, with the same interface as the
+# CRController of entry.py (the games can't tell them apart). It's the
+# same as the one that the games are tested with (see
+# games/_tests/coderunner.py), plus what the worker reads off of the
+# controllers after a fight.
+#
+# The args and the results are still taken through JSON, so that the
+# trusted codes get (and give) the same kinds of values as the others,
+# and can't change the game's own objects.
+
+import json
+import time
+import logging
+
+from common.values import TerminationReasons
+from games._base.delta import get_args_delta, apply_args_delta, refresh_given_args
+
+
+def take_through_json(data):
+    return json.loads(json.dumps(data))
+
+
+class TrustedCRController:
+    def __init__(self, code, game_settings):
+        # No coderunner child to measure; see CRController.stats.
+        self.stats = None
+        
+        # See CRController.perf_report. The memory can't be told
+        # apart from the worker's, so it's left as 0.
+        self.perf_report = {'cpu': [], 'memory': [], 'response': []}
+        
+        self.resolved_names = {}
+        
+        # The args of the delta commands, as the worker and the
+        # coderunner would keep them, respectively, and as the
+        # coderunner would give them to the player.
+        self.sent_args = {}
+        self.kept_args = {}
+        self.given_args = {}
+        
+        try:
+            ls = {}
+            exec(code, ls, ls)
+            
+            self.main_instance = ls['Main']()
+            
+            setattr(self.main_instance, 'context', game_settings)
+            
+            self.is_alive = True
+        # A trusted code is reviewed like our own; if it fails, it's
+        # a bug on our side. The fight still goes on without it.
+        except Exception:
+            logging.exception('A trusted code has failed to set up.')
+            
+            self.is_alive = False
+            self.error_report = (TerminationReasons.TRUSTED_ERROR, None)
+    
+    def run_command(self, f_name, f_args):
+        # See CRController.run_command() for the return values.
+        return self.call(f_name, take_through_json(list(f_args)))
+    
+    def run_delta_command(self, f_name, f_args):
+        # Kept in place as the coderunner does, so that the trusted
+        # codes get the same objects on every call too.
+        current = take_through_json(list(f_args))
+        
+        previous = self.sent_args.get(f_name)
+        if previous is None:
+            self.kept_args[f_name] = take_through_json(current)
+            self.given_args[f_name] = take_through_json(current)
+        else:
+            apply_args_delta(self.kept_args[f_name],
+                             take_through_json(get_args_delta(previous, current)))
+            refresh_given_args(self.given_args[f_name], self.kept_args[f_name])
+        
+        self.sent_args[f_name] = current
+        
+        return self.call(f_name, self.given_args[f_name])
+    
+    def call(self, f_name, args):
+        f = self.resolved_names.get(f_name)
+        if f is None:
+            f = getattr(self.main_instance, f_name, None)
+            
+            # The same as what the coderunner does.
+            if f is None:
+                self.is_alive = False
+                self.error_report = (TerminationReasons.TRUSTED_ERROR, None)
+                return None
+            
+            self.resolved_names[f_name] = f
+        
+        cpu_time = time.thread_time()
+        
+        try:
+            response = json.dumps(f(*args))
+        except Exception:
+            response = None
+        
+        self.perf_report['cpu'].append(round((time.thread_time() - cpu_time) * 1_000_000))
+        self.perf_report['memory'].append(0)
+        self.perf_report['response'].append(len(response) if response is not None else 0)
+        
+        if response is None:
+            return -1  # means exception
+        
+        return (json.loads(response),)
+    
+    def finish_after_simulation(self):
+        self.is_alive = False
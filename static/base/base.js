@@ -27,7 +27,13 @@ window.addEventListener('load', function() {
         hide_confirmation_dialog();
     });
 
-    document.querySelectorAll('.post-confirm-dialog-button').forEach((i) => {
+    bind_confirmation_dialog_buttons(document);
+})
+
+
+// Also used for the parts of the page that are replaced after load.
+function bind_confirmation_dialog_buttons(root) {
+    root.querySelectorAll('.post-confirm-dialog-button').forEach((i) => {
         i.addEventListener('click', function(event) {
             show_confirmation_dialog(
                 i.getAttribute('data-dialog-title'),
@@ -36,7 +42,7 @@ window.addEventListener('load', function() {
             );
         });
     })
-})
+}
 
 
 function show_confirmation_dialog(text, description, confirmation_url) {
@@ -2,11 +2,15 @@ var player_search_input = document.querySelector('.info-fight-form-players-searc
 var player_search_errors = document.querySelector('.info-fight-form-players-search-errors');
 var players_list_element = document.querySelector('.info-fight-form-players-list');
 var code_upload_input = document.querySelector('.info-fight-form-code-select-upload');
+var house_bot_inputs = document.querySelectorAll('.info-fight-form-house-bot input');
 
 
 function check_send_invitations_enabled() {
     // +1 for the host.
-    if (min_players <= players_list.length+1 && players_list.length+1 <= max_players &&
+    let players_count = players_list.length + 1 +
+        Array.from(house_bot_inputs).filter(input => input.checked).length;
+
+    if (min_players <= players_count && players_count <= max_players &&
         code_upload_input.value
     ) {
         document.querySelector(".btn-send-invitations").classList.add("enabled");
@@ -16,6 +20,9 @@ function check_send_invitations_enabled() {
 }
 
 code_upload_input.addEventListener('change', check_send_invitations_enabled);
+house_bot_inputs.forEach(input => {
+    input.addEventListener('change', check_send_invitations_enabled);
+});
 
 
 if (typeof players_list === "undefined") {
@@ -0,0 +1,68 @@
+// The dashboard is kept up to date through WebSocket signals, so
+// that the players don't have to reload the page to see whether
+// their fights have finished or their invitations have changed.
+
+const WS_SCHEME = location.protocol === 'https:' ? 'wss:' : 'ws:';
+
+// Several signals may arrive at once (e.g., a fight finishing for
+// all of its players); we refresh only once for all of them.
+const REFRESH_DELAY = 300;
+
+var refresh_timeout = null;
+var watched_fights = new Set();
+
+
+function open_signals_socket(path) {
+    let socket = new WebSocket(`${WS_SCHEME}//${location.host}${path}`);
+
+    // The first message must be the CSRF token.
+    socket.addEventListener('open', () => socket.send(csrf_token));
+    socket.addEventListener('message', schedule_refresh);
+
+    return socket;
+}
+
+
+// The fights might finish before their sockets are connected, which
+// is fine, as these are one-off signals that are immediately sent
+// back if the fight has already finished.
+function watch_ongoing_fights() {
+    document.querySelectorAll('.info-ongoing-fight[data-fight-uuid]').forEach((i) => {
+        let fight_uuid = i.getAttribute('data-fight-uuid');
+
+        if (watched_fights.has(fight_uuid)) return;
+
+        watched_fights.add(fight_uuid);
+        open_signals_socket(`/ws/fights/finished/${fight_uuid}/`);
+    });
+}
+
+
+function schedule_refresh() {
+    if (refresh_timeout !== null) return;
+
+    refresh_timeout = setTimeout(refresh_dashboard, REFRESH_DELAY);
+}
+
+
+// Replace the dashboard contents in place with a freshly rendered version.
+function refresh_dashboard() {
+    fetch(location.href, {credentials: 'same-origin'}).then(
+        (response) => response.text()
+    ).then((html) => {
+        let info = new DOMParser().parseFromString(html, 'text/html').querySelector('.info');
+
+        document.querySelector('.info').replaceWith(info);
+
+        bind_confirmation_dialog_buttons(info);
+        watch_ongoing_fights();
+    }).finally(() => {
+        refresh_timeout = null;
+    });
+}
+
+
+window.addEventListener('load', function() {
+    open_signals_socket('/ws/fights/dashboard/');
+    watch_ongoing_fights();
+});
@@ -0,0 +1,86 @@
+// The finished time is rendered as an absolute time, since the page is
+// cached; it's shown relative to now here, as the other pages do.
+const TIME_UNITS = [
+    ['year', 365 * 24 * 60 * 60],
+    ['month', 30 * 24 * 60 * 60],
+    ['week', 7 * 24 * 60 * 60],
+    ['day', 24 * 60 * 60],
+    ['hour', 60 * 60],
+    ['minute', 60],
+];
+
+
+function get_time_since(date) {
+    let seconds = (Date.now() - date.getTime()) / 1000;
+
+    for (let [unit, size] of TIME_UNITS) {
+        let count = Math.floor(seconds / size);
+        if (count >= 1) {
+            return `${count} ${unit}${count > 1 ? 's' : ''} ago`;
+        }
+    }
+
+    return 'just now';
+}
+
+
+window.addEventListener('load', function() {
+    document.querySelectorAll('.info-fight-datetimes time[datetime]').forEach((i) => {
+        i.textContent = get_time_since(new Date(i.getAttribute('datetime')));
+    });
+});
+
+
+// The performance report of the player's own code (see fights.perf) is
+// drawn as a timeline of bars for each of its fields, one bar per tick,
+// so that the players can find the ticks where their code took the most.
+
+const SVG_NS = 'http://www.w3.org/2000/svg';
+
+const PERF_TIMELINE_HEIGHT = 40;
+
+
+function draw_perf_timeline(element, values) {
+    let scale = parseFloat(element.getAttribute('data-scale'));
+    let unit = element.getAttribute('data-unit');
+
+    let max = Math.max(...values, 1);
+
+    let svg = document.createElementNS(SVG_NS, 'svg');
+    svg.setAttribute('viewBox', `0 0 ${values.length} ${PERF_TIMELINE_HEIGHT}`);
+    svg.setAttribute('preserveAspectRatio', 'none');
+
+    values.forEach((value, tick) => {
+        let height = value / max * PERF_TIMELINE_HEIGHT;
+
+        let bar = document.createElementNS(SVG_NS, 'rect');
+        bar.setAttribute('x', tick);
+        bar.setAttribute('y', PERF_TIMELINE_HEIGHT - height);
+        bar.setAttribute('width', 1);
+        bar.setAttribute('height', height);
+
+        let title = document.createElementNS(SVG_NS, 'title');
+        title.textContent = `Tick ${tick}: ${+(value * scale).toFixed(2)} ${unit}`;
+        bar.appendChild(title);
+
+        svg.appendChild(bar);
+    });
+
+    let peak = document.createElement('span');
+    peak.textContent = ` (peak: ${+(max * scale).toFixed(2)} ${unit})`;
+
+    element.appendChild(peak);
+    element.appendChild(svg);
+}
+
+
+window.addEventListener('load', function() {
+    let data = document.getElementById('my-perf-report');
+    if (!data) return;
+
+    let perf_report = JSON.parse(data.textContent);
+
+    document.querySelectorAll('.info-fight-code-details-perf-timeline').forEach((i) => {
+        draw_perf_timeline(i, perf_report[i.getAttribute('data-field')]);
+    });
+});
@@ -0,0 +1,36 @@
+import os
+import tempfile
+
+
+def fsync_directory(path):
+    """Flush the entries of a directory (e.g., a file renamed into it) to the disk."""
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_file_atomically(path, content, *, durable=False):
+    """Write the content to the path, so that a reader never sees a partially-written file.
+
+    The content is written to a temporary file in the same directory,
+    which is then renamed to the path. If durable, the file is flushed
+    to the disk before the rename, and its directory after it (as the
+    rename itself is only a change to the directory), so that the file
+    is guaranteed to survive a crash once this returns.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    if durable:
+        fsync_directory(path.parent)